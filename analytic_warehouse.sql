@@ -410,6 +410,64 @@ GO
 DROP TABLE IF EXISTS #src_users;
 GO
 
+/**********************************************
+8b) Apply a client-side SCD2 delta for dim_user
+    src/data_generation/scd2.py computes the same record_hash as above in bulk,
+    keeps a local user_id -> record_hash index of the last load and writes only
+    the new and changed users to dbo.dim_user_delta. Applying that delta scales
+    with the change volume instead of rehashing all of dbo.users_clean.
+***********************************************/
+-- Staging table for the delta: the columns scd2.user_delta emits
+IF OBJECT_ID('dbo.dim_user_delta','U') IS NULL
+BEGIN
+    CREATE TABLE dbo.dim_user_delta (
+        user_id INT NOT NULL PRIMARY KEY,
+        signup_date DATE,
+        age INT,
+        gender VARCHAR(20),
+        country VARCHAR(100),
+        device_type VARCHAR(50),
+        referral_source VARCHAR(100),
+        learning_motivation VARCHAR(200),
+        email_verified BIT,
+        duolingo_plus_subscribed BIT,
+        record_hash VARBINARY(32) NOT NULL,
+        change_type VARCHAR(10) NOT NULL  -- 'insert' or 'update'
+    );
+END
+GO
+
+IF OBJECT_ID('analytics_wh.sp_apply_dim_user_delta','P') IS NOT NULL
+    DROP PROCEDURE analytics_wh.sp_apply_dim_user_delta;
+GO
+CREATE PROCEDURE analytics_wh.sp_apply_dim_user_delta
+AS
+BEGIN
+    SET NOCOUNT ON;
+    IF OBJECT_ID('dbo.dim_user_delta','U') IS NULL
+        THROW 50000, 'dbo.dim_user_delta does not exist; create it (section 8b) before writing a delta', 1;
+    DECLARE @now DATETIME2(3) = SYSUTCDATETIME();
+    BEGIN TRAN;
+
+    -- 1) Close the current rows of changed users
+    UPDATE d
+    SET effective_to = @now, is_current = 0
+    FROM analytics_wh.dim_user d
+    JOIN dbo.dim_user_delta s ON d.user_id = s.user_id AND d.is_current = 1
+    WHERE ISNULL(d.record_hash, 0x) <> ISNULL(s.record_hash, 0x);
+
+    -- 2) Insert new current rows (rerunning an applied delta inserts nothing)
+    INSERT INTO analytics_wh.dim_user (user_id, signup_date, age, gender, country, device_type, referral_source, learning_motivation, email_verified, duolingo_plus_subscribed, effective_from, is_current, record_hash)
+    SELECT s.user_id, s.signup_date, s.age, s.gender, s.country, s.device_type, s.referral_source, s.learning_motivation, s.email_verified, s.duolingo_plus_subscribed, @now, 1, s.record_hash
+    FROM dbo.dim_user_delta s
+    LEFT JOIN analytics_wh.dim_user d ON d.user_id = s.user_id AND d.is_current = 1
+    WHERE d.user_id IS NULL;
+
+    DELETE FROM dbo.dim_user_delta;
+    COMMIT;
+END
+GO
+
 /**********************************************
 9) Fact loads (incremental pattern)
    We'll provide stored procedures to run incremental loads from dbo.* tables into facts.
@@ -580,6 +638,96 @@ BEGIN
 END
 GO
 
+/**********************************************
+9D) One-pass load of the generator's star-schema output
+    With STAR_SCHEMA=1, src/data_generation/generate_synthetic_data.py appends
+    the facts straight to analytics_wh.fact_* (date_id and surrogate keys
+    already computed) and writes the dimensions, with their keys, to the
+    *_stage tables below. This procedure inserts the staged dimension rows
+    with IDENTITY_INSERT and moves the watermarks of 9A-9C past the loaded
+    days, so the facts are never copied from dbo a second time.
+***********************************************/
+IF OBJECT_ID('analytics_wh.dim_language_stage','U') IS NULL
+    CREATE TABLE analytics_wh.dim_language_stage (language_sk INT NOT NULL, language_id INT NOT NULL, language_name VARCHAR(100), popularity_score FLOAT, script_type VARCHAR(50), native_speakers_millions INT);
+IF OBJECT_ID('analytics_wh.dim_course_stage','U') IS NULL
+    CREATE TABLE analytics_wh.dim_course_stage (course_sk INT NOT NULL, course_id INT NOT NULL, target_language_sk INT, base_language_sk INT, difficulty_level INT, total_lessons INT, avg_completion_time_days FLOAT, created_date DATE);
+IF OBJECT_ID('analytics_wh.dim_device_stage','U') IS NULL
+    CREATE TABLE analytics_wh.dim_device_stage (device_sk INT NOT NULL, device_type VARCHAR(100));
+IF OBJECT_ID('analytics_wh.dim_notification_type_stage','U') IS NULL
+    CREATE TABLE analytics_wh.dim_notification_type_stage (notification_type_sk INT NOT NULL, notification_type VARCHAR(200));
+IF OBJECT_ID('analytics_wh.dim_user_stage','U') IS NULL
+    CREATE TABLE analytics_wh.dim_user_stage (user_sk INT NOT NULL, user_id INT NOT NULL, signup_date DATE, age INT, gender VARCHAR(20), country VARCHAR(100), device_type VARCHAR(50), referral_source VARCHAR(100), learning_motivation VARCHAR(200), email_verified BIT, duolingo_plus_subscribed BIT, effective_from DATETIME2(3) NOT NULL, effective_to DATETIME2(3) NULL, is_current BIT NOT NULL, record_hash VARBINARY(32) NULL);
+GO
+
+IF OBJECT_ID('analytics_wh.sp_load_star_dimensions','P') IS NOT NULL
+    DROP PROCEDURE analytics_wh.sp_load_star_dimensions;
+GO
+CREATE PROCEDURE analytics_wh.sp_load_star_dimensions
+AS
+BEGIN
+    SET NOCOUNT ON;
+    BEGIN TRAN;
+
+    -- 1) Staged dimension rows keep the keys the facts refer to
+    SET IDENTITY_INSERT analytics_wh.dim_language ON;
+    INSERT INTO analytics_wh.dim_language (language_sk, language_id, language_name, popularity_score, script_type, native_speakers_millions)
+    SELECT s.language_sk, s.language_id, s.language_name, s.popularity_score, s.script_type, s.native_speakers_millions
+    FROM analytics_wh.dim_language_stage s
+    WHERE NOT EXISTS (SELECT 1 FROM analytics_wh.dim_language d WHERE d.language_sk = s.language_sk);
+    SET IDENTITY_INSERT analytics_wh.dim_language OFF;
+
+    SET IDENTITY_INSERT analytics_wh.dim_course ON;
+    INSERT INTO analytics_wh.dim_course (course_sk, course_id, target_language_sk, base_language_sk, difficulty_level, total_lessons, avg_completion_time_days, created_date)
+    SELECT s.course_sk, s.course_id, s.target_language_sk, s.base_language_sk, s.difficulty_level, s.total_lessons, s.avg_completion_time_days, s.created_date
+    FROM analytics_wh.dim_course_stage s
+    WHERE NOT EXISTS (SELECT 1 FROM analytics_wh.dim_course d WHERE d.course_sk = s.course_sk);
+    SET IDENTITY_INSERT analytics_wh.dim_course OFF;
+
+    SET IDENTITY_INSERT analytics_wh.dim_device ON;
+    INSERT INTO analytics_wh.dim_device (device_sk, device_type)
+    SELECT s.device_sk, s.device_type
+    FROM analytics_wh.dim_device_stage s
+    WHERE NOT EXISTS (SELECT 1 FROM analytics_wh.dim_device d WHERE d.device_sk = s.device_sk);
+    SET IDENTITY_INSERT analytics_wh.dim_device OFF;
+
+    SET IDENTITY_INSERT analytics_wh.dim_notification_type ON;
+    INSERT INTO analytics_wh.dim_notification_type (notification_type_sk, notification_type)
+    SELECT s.notification_type_sk, s.notification_type
+    FROM analytics_wh.dim_notification_type_stage s
+    WHERE NOT EXISTS (SELECT 1 FROM analytics_wh.dim_notification_type d WHERE d.notification_type_sk = s.notification_type_sk);
+    SET IDENTITY_INSERT analytics_wh.dim_notification_type OFF;
+
+    -- Later SCD2 versions (8 / 8b) get IDENTITY keys above the staged ones
+    SET IDENTITY_INSERT analytics_wh.dim_user ON;
+    INSERT INTO analytics_wh.dim_user (user_sk, user_id, signup_date, age, gender, country, device_type, referral_source, learning_motivation, email_verified, duolingo_plus_subscribed, effective_from, effective_to, is_current, record_hash)
+    SELECT s.user_sk, s.user_id, s.signup_date, s.age, s.gender, s.country, s.device_type, s.referral_source, s.learning_motivation, s.email_verified, s.duolingo_plus_subscribed, s.effective_from, s.effective_to, s.is_current, s.record_hash
+    FROM analytics_wh.dim_user_stage s
+    WHERE NOT EXISTS (SELECT 1 FROM analytics_wh.dim_user d WHERE d.user_sk = s.user_sk);
+    SET IDENTITY_INSERT analytics_wh.dim_user OFF;
+
+    -- 2) The facts are loaded up to their last day: the incremental loads
+    --    continue from the day after
+    DECLARE @activity_next DATETIME2 = (SELECT DATEADD(DAY, 1, CONVERT(DATE, CONVERT(CHAR(8), MAX(date_id)))) FROM analytics_wh.fact_daily_activity);
+    DECLARE @session_next DATETIME2 = (SELECT DATEADD(DAY, 1, CONVERT(DATE, CONVERT(CHAR(8), MAX(date_id)))) FROM analytics_wh.fact_session);
+    DECLARE @notification_next DATETIME2 = (SELECT DATEADD(DAY, 1, CONVERT(DATE, CONVERT(CHAR(8), MAX(date_id)))) FROM analytics_wh.fact_notification);
+    EXEC analytics_wh.sp_update_last_lsn @job_name = 'load_fact_daily_activity', @table_name = 'daily_activity', @last_lsn = NULL, @rows_processed = NULL;
+    EXEC analytics_wh.sp_update_last_lsn @job_name = 'load_fact_session', @table_name = 'sessions', @last_lsn = NULL, @rows_processed = NULL;
+    EXEC analytics_wh.sp_update_last_lsn @job_name = 'load_fact_notification', @table_name = 'notifications', @last_lsn = NULL, @rows_processed = NULL;
+    UPDATE analytics_wh.etl_metadata
+    SET last_load_ts = CASE table_name WHEN 'daily_activity' THEN @activity_next
+                                       WHEN 'sessions' THEN @session_next
+                                       ELSE @notification_next END
+    WHERE job_name IN ('load_fact_daily_activity', 'load_fact_session', 'load_fact_notification');
+
+    TRUNCATE TABLE analytics_wh.dim_language_stage;
+    TRUNCATE TABLE analytics_wh.dim_course_stage;
+    TRUNCATE TABLE analytics_wh.dim_device_stage;
+    TRUNCATE TABLE analytics_wh.dim_notification_type_stage;
+    TRUNCATE TABLE analytics_wh.dim_user_stage;
+    COMMIT;
+END
+GO
+
 /**********************************************
 10) Example wrapper job: run full gold load (idempotent)
     Use this to execute the sequence. In production orchestrator (Airflow/Agent) should call these procs.
@@ -0,0 +1,240 @@
+'''Benchmark the generators and the insert path.
+
+Generates 10k and 100k users (``--sizes``) batch by batch exactly like
+``generate_synthetic_data.py`` and writes them to a local SQLite or DuckDB
+file, reporting rows per second of every generator and insert, and the peak
+memory of the run. Every size is run ``--repeat`` times, and smaller sizes
+often enough to generate ``TIMED_USERS`` in all; the median of each figure is
+kept. Stages that took less than ``MIN_SECONDS`` over all runs are listed as
+untimed rather than compared. Results are compared with ``baseline.json``; the
+script
+exits with status 1 when a throughput falls, or the peak memory grows, by
+more than ``--tolerance``. The first batch of every size is also checked
+against ``reference_distributions.json`` so that a faster implementation
+cannot silently change the data. The reference is a snapshot of the
+vectorized generators (the original per-user loop never simulated churn),
+so it catches drift from that point on, not from the original script.
+
+    python benchmarks/bench_generation.py --sizes 10000
+    python benchmarks/bench_generation.py --update-baseline  # after a change
+    python benchmarks/bench_generation.py --update-reference --sizes 10000
+
+Baselines are machine specific: record one on the machine that runs the
+comparison.
+'''
+import argparse
+import datetime
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), 'src', 'data_generation'))
+
+from batch_builder import BLOCK_SIZE, build_batch, build_users  # noqa: E402
+from batch_sizing import PeakRss  # noqa: E402
+from distributions import compare, summarize  # noqa: E402
+from generators import USER_COLUMNS  # noqa: E402
+from metrics import RunMetrics  # noqa: E402
+from pipeline import frame_nbytes  # noqa: E402
+from sinks import create_sink  # noqa: E402
+
+SEED = 42
+CURRENT_DATE = datetime.date(2025, 8, 31)
+NUM_COURSES = 100
+DEFAULT_SIZES = [10000, 100000]
+# Stages that took less than this over all runs are too short to time
+MIN_SECONDS = 0.25
+# Small sizes are repeated until this many users were generated in all
+TIMED_USERS = 30000
+REFERENCE_NOTE = ('Snapshot of the vectorized generators, not of the '
+                  'original per-user loop; regenerate with --update-reference '
+                  'only for intended changes of the data')
+BASELINE_PATH = os.path.join(HERE, 'baseline.json')
+REFERENCE_PATH = os.path.join(HERE, 'reference_distributions.json')
+
+
+def generate_sample(num_users, seed=SEED):
+    '''Every table for users 1..num_users in one batch (for distribution
+    checks; use ``run`` for anything large).'''
+    user_ids = np.arange(1, num_users + 1)
+    users = build_users(user_ids, CURRENT_DATE, seed)
+    tables = build_batch(user_ids, users, NUM_COURSES, CURRENT_DATE, seed)
+    tables['users'] = users
+    return tables
+
+
+def run(num_users, sink_url, batch_size, reference=None):
+    '''Generate and insert ``num_users`` users; returns the result dict.'''
+    metrics = RunMetrics()
+    problems = []
+    started = time.perf_counter()
+    with PeakRss() as rss, create_sink(sink_url) as sink:
+        generate_started = time.perf_counter()
+        users = build_users(np.arange(1, num_users + 1), CURRENT_DATE, SEED)
+        metrics.record('generate', 'users', 'static',
+                       time.perf_counter() - generate_started, len(users),
+                       frame_nbytes(users))
+        stats = {}
+        sink.write('users', users[USER_COLUMNS], stats=stats)
+        metrics.record_write('users', 'static', len(users),
+                             frame_nbytes(users), stats)
+
+        for start in range(0, num_users, batch_size):
+            end = min(start + batch_size, num_users)
+            label = f'batch-{start + 1:09d}'
+            timings = {}
+            tables = build_batch(np.arange(start + 1, end + 1),
+                                 users.iloc[start:end], NUM_COURSES,
+                                 CURRENT_DATE, SEED, timings=timings)
+            for table, frame in tables.items():
+                nbytes = frame_nbytes(frame)
+                metrics.record('generate', table, label, timings[table],
+                               len(frame), nbytes)
+                stats = {}
+                sink.write(table, frame, label, stats=stats)
+                metrics.record_write(table, label, len(frame), nbytes, stats)
+            if reference is not None and start == 0:
+                tables['users'] = users.iloc[start:end]
+                problems = compare(reference, summarize(tables, end - start))
+            tables = None
+    result = {'users': num_users,
+              'seconds': round(time.perf_counter() - started, 3),
+              'peak_rss_mb': round((rss.delta or 0) / 1024 ** 2, 1),
+              'rows_per_s': {}, 'stage_seconds': {}}
+    for (stage, table), total in sorted(metrics.totals().items()):
+        if total['seconds'] > 0:
+            name = f'{stage}:{table}'
+            result['rows_per_s'][name] = round(
+                total['rows'] / total['seconds'], 1)
+            result['stage_seconds'][name] = total['seconds']
+    return result, problems
+
+
+def median_result(results):
+    '''The median of every figure over repeated runs of one size. A stage
+    that took less than ``MIN_SECONDS`` over all runs is listed under
+    ``untimed`` instead.'''
+    median = {'users': results[0]['users'],
+              'seconds': float(np.median([r['seconds'] for r in results])),
+              'peak_rss_mb': float(np.median(
+                  [r['peak_rss_mb'] for r in results])),
+              'rows_per_s': {}, 'untimed': []}
+    names = sorted(set().union(*(r['rows_per_s'] for r in results)))
+    for name in names:
+        seconds = sum(r['stage_seconds'].get(name, 0) for r in results)
+        rates = [r['rows_per_s'][name] for r in results
+                 if name in r['rows_per_s']]
+        if seconds < MIN_SECONDS:
+            median['untimed'].append(name)
+        else:
+            median['rows_per_s'][name] = round(float(np.median(rates)), 1)
+    return median
+
+
+def regressions(result, baseline, tolerance):
+    '''Throughputs below, or peak memory above, the baseline by more than
+    ``tolerance`` (a fraction).'''
+    found = []
+    for name, expected in baseline.get('rows_per_s', {}).items():
+        actual = result['rows_per_s'].get(name)
+        if actual is not None and actual < expected * (1 - tolerance):
+            found.append(f'{name}: {actual:.0f} rows/s, baseline '
+                         f'{expected:.0f}')
+    expected = baseline.get('peak_rss_mb')
+    if expected and result['peak_rss_mb'] > expected * (1 + tolerance):
+        found.append(f'peak memory: {result["peak_rss_mb"]:.0f} MB, '
+                     f'baseline {expected:.0f} MB')
+    return found
+
+
+def _load(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--sink', choices=['sqlite', 'duckdb'],
+                        default='sqlite')
+    parser.add_argument('--batch-size', type=int, default=10 * BLOCK_SIZE)
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs per size, the median is kept (default 3)')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float, default=0.3,
+                        help='allowed relative regression (default 0.3)')
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--update-reference', action='store_true',
+                        help='store the distributions of the largest size '
+                             'as the reference')
+    parser.add_argument('--output', help='also write the results here')
+    args = parser.parse_args(argv)
+    if args.batch_size % BLOCK_SIZE:
+        parser.error(f'--batch-size must be a multiple of {BLOCK_SIZE}')
+    if args.repeat < 1:
+        parser.error('--repeat must be at least 1')
+
+    if args.update_reference:
+        size = max(args.sizes)
+        _save(REFERENCE_PATH, {'_note': REFERENCE_NOTE,
+                               **summarize(generate_sample(size), size)})
+        print(f'Stored the distributions of {size} users in {REFERENCE_PATH}')
+        return 0
+
+    reference = _load(REFERENCE_PATH)
+    baseline = _load(args.baseline) or {}
+    # Warm up lazy imports and cached vocabularies outside the measurements
+    build_users(np.arange(1, BLOCK_SIZE + 1), CURRENT_DATE, SEED)
+    results, failures = {}, []
+    for size in args.sizes:
+        runs, problems = [], []
+        for _ in range(max(args.repeat, -(-TIMED_USERS // size))):
+            with tempfile.TemporaryDirectory() as tmp:
+                url = f'{args.sink}:///{os.path.join(tmp, "bench.db")}'
+                # The data is the same every run, check it once
+                result, found = run(size, url, args.batch_size,
+                                    None if runs else reference)
+            runs.append(result)
+            problems += found
+        result = median_result(runs)
+        results[str(size)] = result
+        print(f'\n{size} users: {result["seconds"]:.1f}s, peak RSS '
+              f'+{result["peak_rss_mb"]:.0f} MB')
+        for name, rate in result['rows_per_s'].items():
+            print(f'  {name:<28} {rate:>14,.0f} rows/s')
+        if result['untimed']:
+            print(f'  untimed (< {MIN_SECONDS}s over {len(runs)} runs): '
+                  f'{", ".join(result["untimed"])}')
+        failures += [f'{size} users, distribution {p}' for p in problems]
+        if str(size) in baseline:
+            failures += [f'{size} users, {r}' for r in regressions(
+                result, baseline[str(size)], args.tolerance)]
+
+    if args.output:
+        _save(args.output, results)
+    if args.update_baseline:
+        _save(args.baseline, {**baseline, **results})
+        print(f'\nUpdated {args.baseline}')
+        failures = [f for f in failures if 'distribution' in f]
+    if failures:
+        print('\nFAILED:\n  ' + '\n  '.join(failures))
+        return 1
+    print('\nOK')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
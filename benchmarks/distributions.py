@@ -0,0 +1,94 @@
+'''Statistical fingerprints of the generated tables.
+
+``summarize`` reduces every table to per-column statistics (means and
+standard deviations of numeric and date columns, null rates, category
+frequencies and rows per user); ``compare`` checks that two summaries could
+come from the same distributions. A faster generator drawing its random
+numbers in a different order produces different rows, so equality cannot be
+required; instead every statistic must agree within ``z`` standard errors.
+
+Rows of one user are correlated (a churner's whole activity history decays
+together), so standard errors are computed with the number of users rather
+than the number of rows, which keeps the check conservative.
+'''
+import numpy as np
+import pandas as pd
+
+# Identifier columns whose distribution is an artifact of the user range
+SKIP_COLUMNS = {'user_id'}
+
+
+def _stat(value, scale):
+    return {'value': float(value), 'scale': float(scale)}
+
+
+def _proportion(p):
+    return _stat(p, np.sqrt(p * (1 - p)))
+
+
+def _column_stats(name, column):
+    stats = {}
+    missing = column.isna()
+    if missing.any():
+        stats[f'{name}:null'] = _proportion(missing.mean())
+    column = column[~missing]
+    if pd.api.types.is_bool_dtype(column.dtype) or not len(column):
+        return stats
+    if pd.api.types.is_numeric_dtype(column.dtype):
+        values = column.to_numpy(dtype=np.float64)
+    elif pd.api.types.is_datetime64_any_dtype(column.dtype):
+        values = (column.to_numpy(dtype='datetime64[s]').astype(np.int64)
+                  / 86400.0)
+    else:
+        for category, p in column.astype(str).value_counts(
+                normalize=True).items():
+            stats[f'{name}={category}'] = _proportion(p)
+        return stats
+    stats[f'{name}:mean'] = _stat(values.mean(), values.std())
+    return stats
+
+
+def summarize(tables, num_users):
+    '''{table: {statistic: {'value', 'scale'}}, '_users': num_users} for a
+    dict of generated tables covering ``num_users`` users.'''
+    summary = {'_users': int(num_users)}
+    for table, frame in sorted(tables.items()):
+        stats = {}
+        if 'user_id' in frame and table != 'users':
+            per_user = frame.groupby('user_id').size().reindex(
+                np.unique(frame['user_id']), fill_value=0)
+            stats['rows_per_user'] = _stat(len(frame) / num_users,
+                                           per_user.std(ddof=0))
+        for name in frame.columns:
+            if name not in SKIP_COLUMNS:
+                stats.update(_column_stats(name, frame[name]))
+        summary[table] = stats
+    return summary
+
+
+def compare(reference, candidate, z=4.0, min_tolerance=1e-9):
+    '''Differences between two summaries larger than ``z`` standard errors,
+    as a list of messages (empty if they are equivalent). Categories that
+    appear in only one summary count as frequency 0 in the other; keys
+    starting with ``_`` (the user count, notes) are not tables.'''
+    n_ref, n_new = reference['_users'], candidate['_users']
+    problems = []
+    for table in sorted(set(reference) | set(candidate)):
+        if table.startswith('_'):
+            continue
+        if table not in candidate or table not in reference:
+            problems.append(f'{table}: missing from '
+                            f'{"candidate" if table in reference else "reference"}')
+            continue
+        ref_stats, new_stats = reference[table], candidate[table]
+        for name in sorted(set(ref_stats) | set(new_stats)):
+            ref = ref_stats.get(name, _proportion(0.0))
+            new = new_stats.get(name, _proportion(0.0))
+            scale = max(ref['scale'], new['scale'])
+            tolerance = max(z * scale * np.sqrt(1 / n_ref + 1 / n_new),
+                            min_tolerance)
+            if abs(new['value'] - ref['value']) > tolerance:
+                problems.append(
+                    f'{table}.{name}: {new["value"]:.6g} vs reference '
+                    f'{ref["value"]:.6g} (tolerance {tolerance:.3g})')
+    return problems
@@ -139,6 +139,9 @@ GO
 
 /**********************************************
 4) Facts with batch inserts
+   Not needed when the generator ran with STAR_SCHEMA=1: it already wrote the
+   facts; run analytics_wh.sp_load_star_dimensions (analytic_warehouse.sql 9D)
+   for the dimensions instead.
 ***********************************************/
 DECLARE @batchSize INT = 100000;
 
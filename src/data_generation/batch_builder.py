@@ -0,0 +1,211 @@
+'''Columnar assembly of one batch of per-user tables.
+
+Users are generated in fixed-size blocks; each block appends its column chunks
+to a ``BatchBuilder`` and every table is materialized exactly once at the end,
+so the cost of a batch grows linearly with the number of users in it.
+
+Blocks are aligned to absolute user ids and every block draws from its own
+random stream derived from the master seed, so the output does not depend on
+which process builds a batch or in which order batches are built.
+'''
+import contextlib
+import time
+import traceback
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from batch_sizing import PeakRss
+from generators import (DEFAULT_CHURN_RATE, generate_churn_labels,
+                        generate_courses, generate_daily_activity,
+                        generate_notifications, generate_sessions,
+                        generate_user_courses, generate_users)
+
+BLOCK_SIZE = 1000  # Users per random stream / vectorized pass
+BATCH_TABLES = ('user_courses', 'daily_activity', 'sessions',
+                'notifications', 'churn_labels')
+USERS_STREAM = 1  # Users draw from a stream separate from their batch tables
+COURSES_STREAM = 2
+
+
+class BatchBuilder:
+    '''Collects per-table frame chunks and concatenates each table once.
+
+    ``seconds`` accumulates the generation time of every table, measured
+    with ``timing``.'''
+
+    def __init__(self):
+        self._chunks = defaultdict(list)
+        self.seconds = defaultdict(float)
+
+    def add(self, table, frame):
+        self._chunks[table].append(frame)
+
+    @contextlib.contextmanager
+    def timing(self, table):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[table] += time.perf_counter() - started
+
+    def build(self):
+        tables = {}
+        for table, chunks in self._chunks.items():
+            with self.timing(table):
+                tables[table] = pd.concat(chunks, ignore_index=True) \
+                    if len(chunks) > 1 else chunks[0].reset_index(drop=True)
+        self._chunks.clear()
+        return tables
+
+
+def _first_row_of_each_user(user_ids):
+    '''Index of the first row of every run of equal, sorted user ids.'''
+    return np.flatnonzero(np.r_[True, user_ids[1:] != user_ids[:-1]])
+
+
+def generate_block(builder, user_ids, users, num_courses, current_date, rng):
+    '''Generate every per-user table for one block of users.'''
+    signup = users['signup_date'].to_numpy(dtype='datetime64[D]')
+    is_premium = users['duolingo_plus_subscribed'].to_numpy()
+    is_churner = users['churn_flag'].to_numpy(dtype=bool) \
+        if 'churn_flag' in users else np.zeros(len(users), dtype=bool)
+    churn_dates = users['churn_date'].to_numpy(dtype='datetime64[D]') \
+        if 'churn_date' in users else np.full(len(users), np.datetime64('NaT'))
+
+    with builder.timing('user_courses'):
+        user_courses = generate_user_courses(user_ids, signup, num_courses,
+                                             rng)
+    builder.add('user_courses', user_courses)
+
+    with builder.timing('daily_activity'):
+        activity = generate_daily_activity(user_ids, signup, is_churner,
+                                           is_premium, current_date, rng,
+                                           churn_dates=churn_dates)
+    builder.add('daily_activity', activity)
+
+    # Sessions are linked to the user's first course; user ids are sorted,
+    # so both lookups are positional rather than per-user scans
+    with builder.timing('sessions'):
+        first_course = user_courses['course_id'].to_numpy()[
+            _first_row_of_each_user(user_courses['user_id'].to_numpy())]
+        activity_owner = np.searchsorted(user_ids,
+                                         activity['user_id'].to_numpy())
+        builder.add('sessions', generate_sessions(
+            activity, first_course[activity_owner], rng))
+    with builder.timing('notifications'):
+        builder.add('notifications', generate_notifications(activity, rng))
+
+    with builder.timing('churn_labels'):
+        builder.add('churn_labels', generate_churn_labels(
+            user_ids, signup, is_churner, churn_dates, activity,
+            current_date, rng))
+
+
+def block_rng(seed, block_index, *stream):
+    '''Independent random stream for the users of one block; ``stream``
+    separates different uses of the same block.'''
+    return np.random.default_rng(
+        np.random.SeedSequence(seed, spawn_key=(int(block_index), *stream)))
+
+
+def _blocks(user_ids):
+    '''Yield (lo, hi, block_index) of each block present in sorted
+    ``user_ids``.'''
+    blocks = (user_ids - 1) // BLOCK_SIZE
+    bounds = np.r_[0, np.flatnonzero(np.diff(blocks)) + 1, len(user_ids)]
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        yield lo, hi, blocks[lo]
+
+
+def build_users(user_ids, current_date, seed,
+                churn_rate=DEFAULT_CHURN_RATE):
+    '''Generate the users (and their simulated churn) for sorted
+    ``user_ids``; any id range can be generated independently.'''
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    chunks = [generate_users(user_ids[lo:hi], current_date,
+                             block_rng(seed, block, USERS_STREAM),
+                             churn_rate=churn_rate)
+              for lo, hi, block in _blocks(user_ids)]
+    return pd.concat(chunks, ignore_index=True) if len(chunks) > 1 \
+        else chunks[0]
+
+
+def build_courses(num_targets, num_bases, current_date, seed):
+    '''The courses dimension; depends only on its arguments, so every shard
+    of a run generates identical courses.'''
+    return generate_courses(num_targets, num_bases, current_date,
+                            block_rng(seed, 0, COURSES_STREAM))
+
+
+def build_batch(user_ids, users, num_courses, current_date, seed,
+                timings=None):
+    '''Generate all per-user tables for a batch of users.
+
+    ``user_ids`` must be sorted ascending; ``users`` is aligned with them and
+    provides ``signup_date``, ``duolingo_plus_subscribed`` and, when present,
+    ``churn_flag`` and ``churn_date``. Returns a dict of table name ->
+    DataFrame; a ``timings`` dict receives the seconds spent per table.'''
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    builder = BatchBuilder()
+    for lo, hi, block in _blocks(user_ids):
+        generate_block(builder, user_ids[lo:hi], users.iloc[lo:hi],
+                       num_courses, current_date, block_rng(seed, block))
+    tables = builder.build()
+    if timings is not None:
+        timings.update(builder.seconds)
+    return tables
+
+
+def iter_batch_ranges(num_users, batch_size, first=0):
+    '''Yield (start, end) 0-based user offsets of each batch.
+
+    Batches must cover whole blocks so that no block's random stream is split
+    across two batches.'''
+    if batch_size % BLOCK_SIZE or first % BLOCK_SIZE:
+        raise ValueError(
+            f'batch_size and first must be multiples of {BLOCK_SIZE}')
+    for start in range(first, num_users, batch_size):
+        yield start, min(start + batch_size, num_users)
+
+
+def _build_batch_safely(task):
+    stats = {'table_seconds': {}}
+    started = time.perf_counter()
+    try:
+        with PeakRss() as rss:
+            tables = build_batch(*task, timings=stats['table_seconds'])
+        error = None
+    except Exception:
+        tables, error = None, traceback.format_exc()
+    stats['seconds'] = time.perf_counter() - started
+    stats['rss_delta'] = rss.delta if error is None else None
+    stats['peak_rss'] = rss.peak if error is None else None
+    return tables, error, stats
+
+
+def generate_batches(tasks, workers=1, max_pending=None):
+    '''Build every ``build_batch`` argument tuple in ``tasks``.
+
+    Yields ``(tables, error, stats)`` in task order, where ``error`` is a
+    formatted traceback if the batch failed and ``stats`` holds the build
+    time (in total and per table) and the peak RSS of the process that
+    built it. With ``workers > 1``
+    batches are built in a process pool, keeping at most ``max_pending``
+    (default ``2 * workers``) results in flight. ``tasks`` is consumed lazily,
+    so it may depend on the results already yielded.'''
+    if workers <= 1:
+        for task in tasks:
+            yield _build_batch_safely(task)
+        return
+    max_pending = max_pending or 2 * workers
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.submit(_build_batch_safely, task))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -0,0 +1,154 @@
+'''Memory-budgeted batch sizing.
+
+The rows a user produces grow with the days since signup (up to 730) times
+1-3 sessions per active day, so a fixed number of users per batch is either
+wasteful or too big. ``BatchPlanner`` sizes each batch from the estimated
+rows of its users instead, and corrects its bytes-per-row figure from the
+peak RSS measured while previous batches were built.
+'''
+import os
+import threading
+
+import numpy as np
+
+# In-memory bytes per generated row across the batch tables; only a starting
+# point, replaced by measurements once batches have been built
+DEFAULT_BYTES_PER_ROW = 200
+SESSIONS_PER_ACTIVE_DAY = 2  # 1-3 sessions/day
+NOTIFICATIONS_PER_DAY = 0.3
+
+
+def estimate_rows(signup_dates, is_premium, current_date):
+    '''Expected rows each user adds to the batch tables: one activity row per
+    day plus the sessions and notifications of those days, 1-3 user courses
+    and one churn label.'''
+    signup = np.asarray(signup_dates, dtype='datetime64[D]')
+    days = (np.datetime64(current_date, 'D') - signup).astype(np.int64) + 1
+    active = np.where(np.asarray(is_premium, dtype=bool), 0.8, 0.6)
+    per_day = 1 + NOTIFICATIONS_PER_DAY + active * SESSIONS_PER_ACTIVE_DAY
+    return np.maximum(days, 0) * per_day + 3
+
+
+def current_rss():
+    '''Resident set size of this process in bytes, or None if unknown.'''
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class PeakRss:
+    '''Context manager sampling RSS on a background thread; ``delta`` is how
+    far the peak rose above the RSS at entry (None if RSS is unavailable).'''
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.baseline = self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def delta(self):
+        if self.baseline is None or self.peak is None:
+            return None
+        return max(0, self.peak - self.baseline)
+
+    def _sample(self):
+        rss = current_rss()
+        if rss is not None:
+            self.peak = rss if self.peak is None else max(self.peak, rss)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self.baseline = current_rss()
+        self.peak = self.baseline
+        if self.baseline is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+        self._sample()
+
+
+class BatchPlanner:
+    '''Splits 0-based user offsets into batches of whole blocks.
+
+    ``estimated_rows`` covers the users from offset ``first`` on. With a
+    ``memory_budget`` (bytes), each batch takes as many blocks as fit the
+    budget at the current bytes-per-row estimate (at least one block);
+    without one, every batch has ``batch_size`` users.'''
+
+    def __init__(self, estimated_rows, block_size, memory_budget=None,
+                 batch_size=None, bytes_per_row=DEFAULT_BYTES_PER_ROW,
+                 first=0):
+        if memory_budget is None and not batch_size:
+            raise ValueError('Either memory_budget or batch_size is required')
+        if batch_size and batch_size % block_size:
+            raise ValueError(
+                f'batch_size must be a multiple of {block_size}')
+        self.block_size = block_size
+        self.memory_budget = memory_budget
+        self.batch_size = batch_size
+        self.bytes_per_row = float(bytes_per_row)
+        estimated_rows = np.asarray(estimated_rows, dtype=np.float64)
+        self.first = first
+        self.num_users = first + len(estimated_rows)
+        self._cumulative = np.r_[0.0, np.cumsum(estimated_rows)]
+
+    def _rows_before(self, offset):
+        return self._cumulative[np.asarray(offset) - self.first]
+
+    def estimated_rows(self, start, end):
+        return float(self._rows_before(end) - self._rows_before(start))
+
+    def _block_end(self, block):
+        return min(block * self.block_size, self.num_users)
+
+    def next_end(self, start, stop):
+        '''End offset of the batch starting at ``start`` (block aligned).'''
+        first_block = start // self.block_size
+        if self.memory_budget is None:
+            return min(start + self.batch_size, stop)
+        limit = self._rows_before(start) + \
+            self.memory_budget / self.bytes_per_row
+        block_ends = self._rows_before(np.minimum(
+            np.arange(first_block + 1, -(-stop // self.block_size) + 1)
+            * self.block_size, stop))
+        fitting = int(np.searchsorted(block_ends, limit, side='right'))
+        return min(self._block_end(first_block + max(1, fitting)), stop)
+
+    def iter_batches(self, start, stop):
+        '''Yield (start, end) batches covering [start, stop); each one is
+        planned with the estimate as it is when the batch is requested.'''
+        if start % self.block_size:
+            raise ValueError(f'start must be a multiple of {self.block_size}')
+        while start < stop:
+            end = self.next_end(start, stop)
+            yield start, end
+            start = end
+
+    def observe(self, start, end, rss_delta):
+        '''Feed back the peak RSS growth measured while building a batch.
+        Underestimates are adopted at once, overestimates decay slowly.'''
+        rows = self.estimated_rows(start, end)
+        if not rss_delta or rows <= 0:
+            return
+        sample = rss_delta / rows
+        if sample > self.bytes_per_row:
+            self.bytes_per_row = sample
+        else:
+            self.bytes_per_row = 0.7 * self.bytes_per_row + 0.3 * sample
+
@@ -0,0 +1,279 @@
+'''Time-ordered event streaming, for load-testing the ETL.
+
+The bulk generator writes the data user by user; production sees the events
+of all users interleaved in time, arriving continuously. This module replays
+the simulated daily_activity, sessions and notifications as one globally
+time-ordered stream:
+
+* every block of users is generated exactly like a bulk run and its rows in
+  the requested window become one event stream sorted by time (the merge of
+  the block's per-user streams);
+* ``merge_events`` k-way merges the block streams with a heap;
+* ``paced`` / ``apaced`` emit the merged events at a fixed rate (or as fast
+  as possible) to an ``NdjsonEventSink``, a ``TableEventSink`` inserting
+  micro-batches through any sink (SQLite, SQL Server, ...) or an asyncio
+  consumer.
+
+A daily_activity row becomes an event at the end of its day, when the daily
+aggregate is complete; sessions and notifications at their start / send
+time. Only the events of the window are kept in memory, so size the window
+(and user range) to the load test.
+
+    python event_stream.py --num-users 10000 --days 7 --rate 500 \\
+        --to sqlite:///load_test.db
+    python event_stream.py --num-users 1000 --to events.ndjson
+'''
+import argparse
+import asyncio
+import datetime
+import heapq
+import itertools
+import json
+import sys
+import time
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from batch_builder import BLOCK_SIZE, build_users, generate_batches
+from generators import DEFAULT_CHURN_RATE
+from sinks import frame_records
+
+EVENT_TABLES = ('daily_activity', 'sessions', 'notifications')
+# Column holding the time of each table's events
+TIME_COLUMNS = {'daily_activity': 'activity_date',
+                'sessions': 'session_start',
+                'notifications': 'sent_date'}
+END_OF_DAY = np.timedelta64(86399, 's')
+
+
+class Event(NamedTuple):
+    time: datetime.datetime
+    user_id: int
+    table: str
+    row: dict
+
+
+def event_times(table, frame):
+    '''Time of every row of ``frame`` as datetime64[us].'''
+    times = frame[TIME_COLUMNS[table]].to_numpy(dtype='datetime64[us]')
+    if table == 'daily_activity':
+        times = times + END_OF_DAY
+    return times
+
+
+def block_events(tables, since, until):
+    '''Events of one generated batch in ``[since, until)``, sorted by time
+    and then user id.'''
+    since = np.datetime64(since, 'us')
+    until = np.datetime64(until, 'us')
+    times, users, codes, positions, records = [], [], [], [], []
+    for code, table in enumerate(EVENT_TABLES):
+        frame = tables[table]
+        table_times = event_times(table, frame)
+        keep = (table_times >= since) & (table_times < until)
+        frame = frame[keep]
+        times.append(table_times[keep])
+        users.append(frame['user_id'].to_numpy(dtype=np.int64))
+        codes.append(np.full(len(frame), code, dtype=np.int8))
+        positions.append(np.arange(len(frame)))
+        records.append((list(frame.columns), frame_records(frame)))
+    times, users = np.concatenate(times), np.concatenate(users)
+    codes, positions = np.concatenate(codes), np.concatenate(positions)
+    # A user's events of the same instant keep the table order
+    order = np.lexsort((codes, users, times))
+    # Built eagerly so that the batch's tables can be freed right away
+    return _events(times[order].tolist(), users[order].tolist(),
+                   codes[order].tolist(), positions[order].tolist(), records)
+
+
+def _events(times, users, codes, positions, records):
+    for at, user_id, code, position in zip(times, users, codes, positions):
+        columns, rows = records[code]
+        yield Event(at, user_id, EVENT_TABLES[code],
+                    dict(zip(columns, rows[position])))
+
+
+def merge_events(streams):
+    '''k-way merge of time-sorted event streams.'''
+    return heapq.merge(*streams, key=lambda event: (event.time, event.user_id))
+
+
+def generate_events(first_user, last_user, num_courses, current_date, seed,
+                    since, until, workers=1, churn_rate=DEFAULT_CHURN_RATE):
+    '''Time-ordered events of users ``first_user``+1..``last_user`` in
+    ``[since, until)``; the rows are those a bulk run with the same seed
+    writes. Every block is generated before the first event is yielded.'''
+    def tasks():
+        # Whole blocks on BLOCK_SIZE boundaries, as their seeds are derived
+        # from the block; users before first_user are dropped below
+        first_block = first_user // BLOCK_SIZE * BLOCK_SIZE
+        for start in range(first_block, last_user, BLOCK_SIZE):
+            user_ids = np.arange(start + 1, min(start + BLOCK_SIZE,
+                                                last_user) + 1)
+            users = build_users(user_ids, current_date, seed, churn_rate)
+            yield user_ids, users, num_courses, current_date, seed
+
+    streams = []
+    for tables, error, _ in generate_batches(tasks(), workers):
+        if error:
+            raise RuntimeError(f'Failed generating events:\n{error}')
+        tables = {table: frame[frame['user_id'] > first_user]
+                  for table, frame in tables.items()
+                  if table in EVENT_TABLES}
+        streams.append(block_events(tables, since, until))
+    return merge_events(streams)
+
+
+def paced(events, rate=None):
+    '''Yield ``events`` at ``rate`` events per second (unpaced if None).'''
+    if not rate:
+        yield from events
+        return
+    started = time.perf_counter()
+    for count, event in enumerate(events):
+        delay = started + count / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        yield event
+
+
+async def apaced(events, rate=None):
+    '''``paced`` for asyncio: an async iterator that sleeps without blocking
+    the event loop.'''
+    started = time.perf_counter()
+    for count, event in enumerate(events):
+        delay = started + count / rate - time.perf_counter() if rate else 0
+        # Yield to the loop even when running flat out
+        await asyncio.sleep(max(delay, 0))
+        yield event
+
+
+async def stream_to_consumer(events, consumer, rate=None):
+    '''Await ``consumer(event)`` for every event; returns the event count.'''
+    count = 0
+    async for event in apaced(events, rate):
+        await consumer(event)
+        count += 1
+    return count
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.date, pd.Timestamp)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+class NdjsonEventSink:
+    '''Append events as JSON lines (``{"time", "table", **row}``).'''
+
+    def __init__(self, path):
+        self.file = sys.stdout if path == '-' else open(path, 'a',
+                                                        encoding='utf-8')
+
+    def write(self, event):
+        self.file.write(json.dumps(
+            {'time': event.time, 'table': event.table, **event.row},
+            default=_json_default) + '\n')
+
+    def close(self):
+        self.file.flush()
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+class TableEventSink:
+    '''Insert events into their tables through a ``Sink``, in micro-batches
+    of at most ``flush_rows`` events or ``flush_seconds`` of arrivals
+    (``flush_rows=1`` inserts row by row).'''
+
+    def __init__(self, sink, flush_rows=100, flush_seconds=1.0):
+        self.sink = sink
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.pending = {table: [] for table in EVENT_TABLES}
+        self.count = 0
+        self.flushed_at = time.perf_counter()
+
+    def write(self, event):
+        self.pending[event.table].append(event.row)
+        self.count += 1
+        if (self.count >= self.flush_rows or time.perf_counter()
+                - self.flushed_at >= self.flush_seconds):
+            self.flush()
+
+    def flush(self):
+        for table, rows in self.pending.items():
+            if rows:
+                self.sink.write(table, pd.DataFrame.from_records(rows))
+                rows.clear()
+        self.count = 0
+        self.flushed_at = time.perf_counter()
+
+    def close(self):
+        self.flush()
+        self.sink.close()
+
+
+def stream_events(events, event_sink, rate=None, limit=None):
+    '''Write (at most ``limit``) ``events`` to ``event_sink`` at ``rate``;
+    returns the event count.'''
+    count = 0
+    for event in paced(itertools.islice(events, limit), rate):
+        event_sink.write(event)
+        count += 1
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Stream the simulated events in time order.')
+    parser.add_argument('--num-users', type=int, default=1000)
+    parser.add_argument('--first-user', type=int, default=0,
+                        help='stream users first+1..num-users')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--date', type=datetime.date.fromisoformat,
+                        default=datetime.date(2025, 8, 31),
+                        help='current date of the simulation')
+    parser.add_argument('--days', type=int, default=1,
+                        help='stream the events of the last DAYS days')
+    parser.add_argument('--num-courses', type=int, default=100)
+    parser.add_argument('--churn-rate', type=float,
+                        default=DEFAULT_CHURN_RATE)
+    parser.add_argument('--rate', type=float,
+                        help='events per second (default: unpaced)')
+    parser.add_argument('--limit', type=int, help='stop after this many')
+    parser.add_argument('--to', default='-',
+                        help='.ndjson/.jsonl file, - for stdout, or a sink '
+                             'URL such as sqlite:///load_test.db')
+    parser.add_argument('--flush-rows', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    until = args.date + datetime.timedelta(days=1)
+    since = until - datetime.timedelta(days=args.days)
+    if args.to == '-' or args.to.endswith(('.ndjson', '.jsonl')):
+        event_sink = NdjsonEventSink(args.to)
+    else:
+        from sinks import create_sink
+        event_sink = TableEventSink(create_sink(args.to), args.flush_rows)
+
+    generating = time.perf_counter()
+    events = generate_events(args.first_user, args.num_users,
+                             args.num_courses, args.date, args.seed, since,
+                             until, args.workers, args.churn_rate)
+    started = time.perf_counter()
+    try:
+        count = stream_events(events, event_sink, args.rate, args.limit)
+    finally:
+        event_sink.close()
+    elapsed = time.perf_counter() - started
+    print(f'Generated in {started - generating:.1f}s; streamed {count} '
+          f'events in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.0f}/s)',
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,378 @@
+'''Out-of-core per-user features for the churn model.
+
+The EDA notebook samples (``SELECT TOP 100000 ...``) or pulls whole tables
+into pandas; the training set needs features over every row. This stage
+streams daily_activity, sessions and notifications in bounded chunks, one
+partition of user ids at a time, and folds them into running per-user
+aggregates in a single pass:
+
+* activity: active days, lessons, XP and minutes over the last 7 and 30 days
+  (a 30-day window per user), totals, max and current streak, and days since
+  the last active day;
+* sessions: count, exercises and accuracy mean / std (from running sums);
+* notifications: sent count, open and click rates.
+
+The aggregates of every partition are saved as of a date
+(``<state dir>/users-<first id>.npz``). A later run only reads the rows after
+that date, shifts the windows and folds them in, so updating the features
+after an ``ADVANCE_DAYS`` run reads just the new days. Users who joined
+since (the advance signups) only have rows after it, so they are picked up
+too. Memory is bounded by ``partition_users`` x the 30-day window plus one
+chunk of rows.
+
+The features of every partition are upserted into ``user_features``, with
+compact column types (int8/int16 counters, float32 rates).
+
+    python features.py --source sqlite:///local.db --as-of 2025-08-31
+    python features.py --source parquet:///data/run1 \\
+        --sink sqlite:///features.db --as-of 2025-09-07
+'''
+import argparse
+import datetime
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from sinks import DEFAULT_CHUNKSIZE, connect, create_sink, open_dataset
+
+FEATURE_TABLE = 'user_features'
+WINDOW_DAYS = 30
+SHORT_WINDOW_DAYS = 7
+DEFAULT_PARTITION_USERS = 100000
+# Columns read from each table; the second one dates the row
+SOURCE_COLUMNS = {
+    'daily_activity': ['user_id', 'activity_date', 'lessons_completed',
+                       'xp_gained', 'time_spent_minutes', 'streak_days'],
+    'sessions': ['user_id', 'session_start', 'exercises_completed',
+                 'accuracy_percentage'],
+    'notifications': ['user_id', 'sent_date', 'opened', 'clicked']
+}
+NO_DAY = np.iinfo(np.int32).min  # last_active of a user never active
+# Running aggregates: name -> (dtype, window)
+AGGREGATES = {
+    'recent_lessons': (np.int16, True),
+    'recent_xp': (np.int32, True),
+    'recent_minutes': (np.float32, True),
+    'active_days': (np.int32, False),
+    'lessons': (np.int32, False),
+    'xp': (np.int64, False),
+    'max_streak': (np.int32, False),
+    'current_streak': (np.int32, False),
+    'last_active': (np.int32, False),
+    'sessions': (np.int32, False),
+    'exercises': (np.int32, False),
+    'accuracy_sum': (np.float64, False),
+    'accuracy_sumsq': (np.float64, False),
+    'notifications_sent': (np.int32, False),
+    'notifications_opened': (np.int32, False),
+    'notifications_clicked': (np.int32, False)
+}
+
+
+def _days(values):
+    '''Day numbers (days since 1970-01-01) of dates or timestamps.'''
+    return pd.to_datetime(values).to_numpy(
+        dtype='datetime64[D]').astype(np.int32)
+
+
+def _day(date):
+    return np.datetime64(date, 'D').astype(np.int32)
+
+
+class FeatureState:
+    '''Running aggregates of users ``first_user``+1..``last_user`` over all
+    their rows up to ``as_of``. Window column k holds the day ``as_of`` - k.'''
+
+    def __init__(self, first_user, last_user, as_of, arrays=None):
+        self.first_user = first_user
+        self.last_user = last_user
+        self.as_of = as_of
+        n = last_user - first_user
+        self.arrays = arrays or {
+            name: np.zeros((n, WINDOW_DAYS) if window else n, dtype=dtype)
+            for name, (dtype, window) in AGGREGATES.items()}
+        if arrays is None:
+            self.arrays['last_active'][:] = NO_DAY
+
+    def __len__(self):
+        return self.last_user - self.first_user
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            first_user, last_user, as_of = data['meta'].tolist()
+            return cls(int(first_user), int(last_user),
+                       datetime.date.fromordinal(int(as_of)),
+                       {name: data[name] for name in AGGREGATES})
+
+    def save(self, path):
+        '''Write the state atomically.'''
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, meta=np.array([self.first_user, self.last_user,
+                                       self.as_of.toordinal()]),
+                     **self.arrays)
+        os.replace(path + '.tmp', path)
+
+    def advance(self, as_of, last_user=None):
+        '''Move the state to ``as_of`` (shifting the windows) and make room
+        for users up to ``last_user``.'''
+        shift = (as_of - self.as_of).days
+        if shift < 0:
+            raise ValueError(f'State is as of {self.as_of}, after {as_of}')
+        for name, (dtype, window) in AGGREGATES.items():
+            if window and shift:
+                shifted = np.zeros_like(self.arrays[name])
+                if shift < WINDOW_DAYS:
+                    shifted[:, shift:] = self.arrays[name][:, :-shift]
+                self.arrays[name] = shifted
+        if shift:
+            # Set again by the rows of the new as-of day
+            self.arrays['current_streak'][:] = 0
+        self.as_of = as_of
+        if last_user is not None and last_user > self.last_user:
+            grown = FeatureState(self.last_user, last_user, as_of)
+            for name in AGGREGATES:
+                self.arrays[name] = np.concatenate(
+                    [self.arrays[name], grown.arrays[name]])
+            self.last_user = last_user
+
+    def _positions(self, chunk, column):
+        '''(row mask, user positions, ages in days) of the chunk's rows of
+        this partition up to ``as_of``.'''
+        positions = chunk['user_id'].to_numpy(dtype=np.int64) \
+            - self.first_user - 1
+        ages = _day(self.as_of) - _days(chunk[column])
+        keep = (positions >= 0) & (positions < len(self)) & (ages >= 0)
+        return keep, positions[keep], ages[keep]
+
+    def _bincount(self, positions, weights):
+        return np.bincount(positions, weights, minlength=len(self))
+
+    def add_activity(self, chunk):
+        keep, positions, ages = self._positions(chunk, 'activity_date')
+        lessons = chunk['lessons_completed'].to_numpy()[keep]
+        xp = chunk['xp_gained'].to_numpy()[keep]
+        minutes = chunk['time_spent_minutes'].to_numpy(dtype=np.float64)[keep]
+        streak = chunk['streak_days'].to_numpy(dtype=np.int32)[keep]
+        active = lessons > 0
+
+        a = self.arrays
+        a['active_days'] += self._bincount(positions, active).astype(np.int32)
+        a['lessons'] += self._bincount(positions, lessons).astype(np.int32)
+        a['xp'] += self._bincount(positions, xp).astype(np.int64)
+        np.maximum.at(a['max_streak'], positions, streak)
+        np.maximum.at(a['last_active'], positions[active],
+                      _day(self.as_of) - ages[active].astype(np.int32))
+        # One row per user and day, so the window cells are assigned
+        recent = ages < WINDOW_DAYS
+        cells = positions[recent], ages[recent]
+        a['recent_lessons'][cells] = lessons[recent]
+        a['recent_xp'][cells] = xp[recent]
+        a['recent_minutes'][cells] = minutes[recent]
+        today = ages == 0
+        a['current_streak'][positions[today]] = streak[today]
+
+    def add_sessions(self, chunk):
+        keep, positions, _ = self._positions(chunk, 'session_start')
+        accuracy = chunk['accuracy_percentage'].to_numpy(
+            dtype=np.float64)[keep]
+        a = self.arrays
+        a['sessions'] += self._bincount(positions, None).astype(np.int32)
+        a['exercises'] += self._bincount(
+            positions, chunk['exercises_completed'].to_numpy()[keep]
+        ).astype(np.int32)
+        a['accuracy_sum'] += self._bincount(positions, accuracy)
+        a['accuracy_sumsq'] += self._bincount(positions, accuracy ** 2)
+
+    def add_notifications(self, chunk):
+        keep, positions, _ = self._positions(chunk, 'sent_date')
+        a = self.arrays
+        a['notifications_sent'] += self._bincount(
+            positions, None).astype(np.int32)
+        a['notifications_opened'] += self._bincount(
+            positions, chunk['opened'].to_numpy()[keep]).astype(np.int32)
+        a['notifications_clicked'] += self._bincount(
+            positions, chunk['clicked'].to_numpy()[keep]).astype(np.int32)
+
+    def features(self):
+        '''The feature rows of the partition as of ``as_of``.'''
+        a = self.arrays
+
+        def window(name, days):
+            return a[name][:, :days].sum(axis=1)
+
+        def ratio(numerator, denominator):
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return (numerator / denominator).astype(np.float32)
+
+        active_window = a['recent_lessons'] > 0
+        mean = ratio(a['accuracy_sum'], a['sessions'])
+        variance = ratio(a['accuracy_sumsq'], a['sessions']) \
+            - mean.astype(np.float64) ** 2
+        today = _day(self.as_of)
+        never = a['last_active'] == NO_DAY
+        return pd.DataFrame({
+            'user_id': np.arange(self.first_user + 1, self.last_user + 1,
+                                 dtype=np.int32),
+            'as_of_date': pd.Timestamp(self.as_of),
+            'active_days_7': active_window[:, :SHORT_WINDOW_DAYS].sum(
+                axis=1).astype(np.int8),
+            'active_days_30': active_window.sum(axis=1).astype(np.int8),
+            'lessons_7': window('recent_lessons', SHORT_WINDOW_DAYS).astype(
+                np.int16),
+            'lessons_30': window('recent_lessons', WINDOW_DAYS).astype(
+                np.int16),
+            'xp_7': window('recent_xp', SHORT_WINDOW_DAYS).astype(np.int32),
+            'xp_30': window('recent_xp', WINDOW_DAYS).astype(np.int32),
+            'minutes_7': window('recent_minutes', SHORT_WINDOW_DAYS).astype(
+                np.float32),
+            'minutes_30': window('recent_minutes', WINDOW_DAYS).astype(
+                np.float32),
+            'active_days': a['active_days'].astype(np.int16),
+            'lessons': a['lessons'],
+            'xp': a['xp'].astype(np.int32),
+            'max_streak': a['max_streak'].astype(np.int16),
+            'current_streak': a['current_streak'].astype(np.int16),
+            'days_since_last_activity': pd.arrays.IntegerArray(
+                (today - np.where(never, today, a['last_active'])).astype(
+                    np.int16), never),
+            'sessions': a['sessions'],
+            'exercises': a['exercises'],
+            'accuracy_mean': mean,
+            'accuracy_std': np.sqrt(np.maximum(variance, 0)).astype(
+                np.float32),
+            'notifications_sent': a['notifications_sent'],
+            'open_rate': ratio(a['notifications_opened'],
+                               a['notifications_sent']),
+            'click_rate': ratio(a['notifications_clicked'],
+                                a['notifications_sent'])
+        })
+
+
+def read_chunks(url, table, first_user, last_user, since=None, until=None,
+                chunksize=DEFAULT_CHUNKSIZE):
+    '''Yield the rows of ``table`` for users ``first_user``+1..``last_user``
+    dated in [``since``, ``until``), at most ``chunksize`` at a time, from a
+    database or the files of a parquet/arrow sink.'''
+    columns = SOURCE_COLUMNS[table]
+    date = columns[1]
+    scheme, _, rest = url.partition('://')
+    if scheme in ('parquet', 'arrow'):
+        import pyarrow.dataset as ds
+        condition = ((ds.field('user_id') > first_user)
+                     & (ds.field('user_id') <= last_user))
+        for bound, keep in ((since, ds.field(date).__ge__),
+                            (until, ds.field(date).__lt__)):
+            if bound is not None:
+                condition &= keep(datetime.datetime.combine(
+                    bound, datetime.time()))
+        dataset = open_dataset(rest[1:].partition('?')[0], table, scheme)
+        for batch in dataset.to_batches(columns=columns, filter=condition,
+                                        batch_size=chunksize):
+            if batch.num_rows:
+                yield batch.to_pandas()
+        return
+    # Bounds are ints and dates, so they are inlined for every driver
+    where = [f'user_id > {int(first_user)}', f'user_id <= {int(last_user)}']
+    if since is not None:
+        where.append(f"{date} >= '{since:%Y-%m-%d}'")
+    if until is not None:
+        where.append(f"{date} < '{until:%Y-%m-%d}'")
+    query = (f'SELECT {", ".join(columns)} FROM {table} '
+             f'WHERE {" AND ".join(where)}')
+    with connect(url) as connection:
+        yield from pd.read_sql(query, connection, chunksize=chunksize)
+
+
+def max_user_id(url):
+    '''The largest user id of the source's users table.'''
+    scheme, _, rest = url.partition('://')
+    if scheme in ('parquet', 'arrow'):
+        import pyarrow.compute as pc
+        dataset = open_dataset(rest[1:].partition('?')[0], 'users', scheme)
+        return int(pc.max(dataset.to_table(columns=['user_id'])
+                          .column('user_id')).as_py() or 0)
+    with connect(url) as connection:
+        value = pd.read_sql('SELECT MAX(user_id) AS m FROM users',
+                            connection)['m'].iloc[0]
+    return 0 if pd.isna(value) else int(value)
+
+
+def update_partition(source_url, state, since=None,
+                     chunksize=DEFAULT_CHUNKSIZE):
+    '''Fold the source rows of the state's users dated from ``since`` up to
+    its as-of date into ``state``.'''
+    until = state.as_of + datetime.timedelta(days=1)
+    for table, add in (('daily_activity', state.add_activity),
+                       ('sessions', state.add_sessions),
+                       ('notifications', state.add_notifications)):
+        for chunk in read_chunks(source_url, table, state.first_user,
+                                 state.last_user, since, until, chunksize):
+            add(chunk)
+
+
+def build_features(source_url, sink, state_dir, as_of, num_users,
+                   partition_users=DEFAULT_PARTITION_USERS,
+                   chunksize=DEFAULT_CHUNKSIZE):
+    '''Bring the features of users 1..``num_users`` up to ``as_of``, one
+    partition at a time, and upsert them into ``FEATURE_TABLE``. Partitions
+    with a saved state only read the rows after its date. Keep
+    ``partition_users`` the same across runs. Returns the users written.'''
+    os.makedirs(state_dir, exist_ok=True)
+    written = 0
+    for first in range(0, num_users, partition_users):
+        last = min(first + partition_users, num_users)
+        path = os.path.join(state_dir, f'users-{first+1:09d}.npz')
+        if os.path.exists(path):
+            state = FeatureState.load(path)
+            if state.last_user > last:
+                raise ValueError(f'{path} holds users up to '
+                                 f'{state.last_user}: use the partition '
+                                 f'size of the run that saved it')
+            since = state.as_of + datetime.timedelta(days=1)
+            state.advance(as_of, last)
+        else:
+            state, since = FeatureState(first, last, as_of), None
+        update_partition(source_url, state, since, chunksize)
+        features = state.features()
+        sink.upsert(FEATURE_TABLE, features, 'user_id',
+                    partition=f'users-{first+1:09d}')
+        # Saved once the features are written: a failed run rereads the rows
+        state.save(path)
+        written += len(features)
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Aggregate per-user churn features out of core.')
+    parser.add_argument('--source', required=True,
+                        help='database URL or parquet:///dir / arrow:///dir '
+                             'of the generated tables')
+    parser.add_argument('--sink', help=f'URL to write {FEATURE_TABLE} to '
+                                       '(default: the source)')
+    parser.add_argument('--as-of', type=datetime.date.fromisoformat,
+                        required=True, help='date the features describe')
+    parser.add_argument('--state-dir', default=os.path.join(
+        os.getcwd(), 'logs', 'feature_state'))
+    parser.add_argument('--num-users', type=int,
+                        help='default: the largest user id of the source')
+    parser.add_argument('--partition-users', type=int,
+                        default=DEFAULT_PARTITION_USERS)
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    args = parser.parse_args(argv)
+
+    num_users = args.num_users or max_user_id(args.source)
+    with create_sink(args.sink or args.source) as sink:
+        written = build_features(args.source, sink, args.state_dir,
+                                 args.as_of, num_users, args.partition_users,
+                                 args.chunksize)
+    print(f'Wrote features of {written} users as of {args.as_of} to '
+          f'{FEATURE_TABLE}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
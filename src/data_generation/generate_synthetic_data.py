@@ -1,57 +1,198 @@
+'''Generate the synthetic churnalytics tables and write them to a sink.
+
+    python generate_synthetic_data.py --num-users 1000 --sink sqlite:///local.db
+    python generate_synthetic_data.py --tables users  # only the users table
+
+Every option defaults to its environment variable (e.g. ``--num-users`` to
+NUM_USERS, ``--sink`` to DB_URL; ``.env`` is read as well). Without a sink
+URL the SQL Server given by DB_USER, PASSWORD, HOST and DB is used.
+
+Importing this module does no work: the pipeline modules (NumPy, pandas)
+are imported when a run is configured, and credentials, logging and the sink
+are set up by ``main``. Tests, benchmarks and workers that need a slice of
+the data call the generators directly (``batch_builder.build_users`` /
+``build_batch``) without a database.
+'''
+import argparse
 import datetime
-import random
+import logging
 import os
+import sys
 import time
-import logging
+from collections import deque
 from logging.handlers import RotatingFileHandler
-import traceback
-import numpy as np
-import pandas as pd
-from faker import Faker
-from sqlalchemy import create_engine, text
-from sqlalchemy.exc import SQLAlchemyError
-from dotenv import load_dotenv
 from urllib.parse import quote_plus
-import warnings
-warnings.filterwarnings("ignore")
-
-# db credentials
-load_dotenv()
-password = quote_plus(os.getenv("PASSWORD"))
-username = os.getenv("DB_USER")
-host = os.getenv('HOST')
-port = os.getenv('PORT')
-db = os.getenv('DB')
-
-# Config
-fake = Faker()
-np.random.seed(42)  # Reproducibility
-random.seed(42)
+
+logger = logging.getLogger('generate_synthetic_data')
+
+SEED = 42  # Every generated table is derived from it (reproducibility)
 NUM_USERS = 1000000  # 1M+; reduce to 1000 for testing
 CURRENT_DATE = datetime.date(2025, 8, 31)
-DB_CONNECTION_STRING = f'mssql+pyodbc://{username}:{password}@{host}/{db}?driver=ODBC+Driver+17+for+SQL+Server'
+# Steps 1-3; the batch tables are built together, batch by batch, in step 4
+STATIC_TABLES = ('languages', 'courses', 'users')
 
-# Logging configuration
-LOG_DIR = os.getenv('LOG_DIR', os.path.join(os.getcwd(), 'logs'))
-os.makedirs(LOG_DIR, exist_ok=True)
-logger = logging.getLogger('generate_synthetic_data')
-logger.setLevel(logging.DEBUG)
-formatter = logging.Formatter(
-    '%(asctime)s %(levelname)s [%(module)s:%(lineno)d] %(message)s')
-stream_h = logging.StreamHandler()
-stream_h.setLevel(logging.INFO)
-stream_h.setFormatter(formatter)
-file_h = RotatingFileHandler(os.path.join(
-    LOG_DIR, 'generate_synthetic_data.log'), maxBytes=5_000_000, backupCount=5)
-file_h.setLevel(logging.DEBUG)
-file_h.setFormatter(formatter)
-logger.addHandler(stream_h)
-logger.addHandler(file_h)
-
-start_time = time.time()
-logger.info(f'Starting synthetic data generation script at {start_time}')
-logger.debug('DB connection target: host=%s, db=%s, user=%s',
-             host, db, username)
+
+def sql_server_url():
+    '''SQL Server URL from the DB_USER, PASSWORD, HOST and DB variables.'''
+    password = os.getenv('PASSWORD')
+    if password is None:
+        raise SystemExit('Set PASSWORD (and DB_USER, HOST, DB) for SQL '
+                         'Server, or pass --sink / DB_URL')
+    return (f'mssql+pyodbc://{os.getenv("DB_USER")}:{quote_plus(password)}'
+            f'@{os.getenv("HOST")}/{os.getenv("DB")}'
+            f'?driver=ODBC+Driver+17+for+SQL+Server')
+
+
+def _env(name, default, type=str):
+    value = os.getenv(name)
+    return default if value is None else type(value)
+
+
+def parse_args(argv=None):
+    '''Run configuration from ``argv``; unset options fall back to their
+    environment variables, then to the defaults.'''
+    from batch_builder import BATCH_TABLES
+    from generators import DEFAULT_CHURN_RATE
+    from sharding import parse_shard
+
+    def tables(value):
+        names = tuple(name.strip() for name in value.split(',')
+                      if name.strip())
+        unknown = set(names) - set(STATIC_TABLES + BATCH_TABLES)
+        if unknown:
+            raise argparse.ArgumentTypeError(
+                f'unknown table(s): {", ".join(sorted(unknown))}')
+        return names
+
+    parser = argparse.ArgumentParser(
+        description='Generate the synthetic churnalytics tables.')
+    parser.add_argument('--num-users', type=int,
+                        default=_env('NUM_USERS', NUM_USERS, int))
+    parser.add_argument('--seed', type=int, default=_env('SEED', SEED, int))
+    parser.add_argument('--date', type=datetime.date.fromisoformat,
+                        default=_env('CURRENT_DATE', CURRENT_DATE,
+                                     datetime.date.fromisoformat),
+                        help='current date of the simulation')
+    # Any sink URL overrides SQL Server, e.g. sqlite:///local.db for a local
+    # test run or parquet:///data/run1 to write partitioned files
+    parser.add_argument('--sink', default=os.getenv('DB_URL'),
+                        help='sink URL (default: SQL Server from .env)')
+    parser.add_argument('--tables', type=tables,
+                        default=tables(_env(
+                            'TABLES', ','.join(STATIC_TABLES + BATCH_TABLES))),
+                        help='comma-separated tables (steps) to write; '
+                             'default: all')
+    # Users per batch, or with --batch-memory-mb > 0 batches are sized to
+    # that memory budget from the users' expected rows and the measured RSS
+    parser.add_argument('--batch-size', type=int,
+                        default=_env('BATCH_SIZE', 10000, int))
+    parser.add_argument('--batch-memory-mb', type=int,
+                        default=_env('BATCH_MEMORY_MB', 0, int))
+    parser.add_argument('--chunksize', type=int,
+                        default=_env('INSERT_CHUNKSIZE', 50000, int),
+                        help='rows per round trip')
+    # Batches are built in this many processes; output is identical for any
+    # value
+    parser.add_argument('--workers', type=int,
+                        default=_env('NUM_WORKERS', 1, int))
+    # Generated tables are written by background threads; generation blocks
+    # once MAX_PENDING_MB of data is waiting to be written
+    parser.add_argument('--writer-threads', type=int,
+                        default=_env('WRITER_THREADS', 2, int))
+    parser.add_argument('--max-pending-mb', type=int,
+                        default=_env('MAX_PENDING_MB', 2048, int))
+    # Share of the users labelled as churned (see churn_hazard)
+    parser.add_argument('--churn-rate', type=float,
+                        default=_env('CHURN_RATE', DEFAULT_CHURN_RATE, float))
+    # Shard i/n generates only its disjoint share of the users (see
+    # sharding.py); run shards 0/n .. n-1/n on different nodes and verify
+    # the merged output
+    parser.add_argument('--shard', default=_env('SHARD', '0/1'))
+    # > 0 advances the clock of the last complete run (full or advance) by
+    # that many days instead of regenerating everything: only the new days
+    # of existing users, the signups and the changed churn labels are
+    # generated and appended (see incremental.py)
+    parser.add_argument('--advance-days', type=int,
+                        default=_env('ADVANCE_DAYS', 0, int))
+    parser.add_argument('--new-users-per-day', type=float,
+                        default=_env('NEW_USERS_PER_DAY', None, float),
+                        help='default: num-users / 730')
+    # Also emit the analytics_wh dimensions (to <dim>_stage tables) and facts
+    # with their surrogate keys, so the gold layer is loaded in one pass (see
+    # star_schema.py). Tables are named star-table-prefix + table.
+    parser.add_argument('--star-schema', action='store_true',
+                        default=_env('STAR_SCHEMA', '0') == '1')
+    parser.add_argument('--star-table-prefix',
+                        default=os.getenv('STAR_TABLE_PREFIX'),
+                        help="default: 'analytics_wh.' for SQL Server")
+    # Every unit is profiled and checked against the expectations (see
+    # profiler.py) before it is written; a violation stops the run unless
+    # --on-violation is warn. Runs advancing the clock are not profiled.
+    parser.add_argument('--profile', action=argparse.BooleanOptionalAction,
+                        default=_env('PROFILE', '1') == '1')
+    parser.add_argument('--expectations', default=os.getenv('EXPECTATIONS'),
+                        help='JSON list of expectations (default: the '
+                             'built-in ones, for the --churn-rate)')
+    parser.add_argument('--on-violation', choices=('abort', 'warn'),
+                        default=_env('ON_VIOLATION', 'abort'))
+    parser.add_argument('--profile-path', default=os.getenv('PROFILE_PATH'))
+    parser.add_argument('--log-dir', default=_env(
+        'LOG_DIR', os.path.join(os.getcwd(), 'logs')))
+    # Committed (table, batch) units are recorded in the manifest so that a
+    # restarted run skips them and regenerates only the missing batches.
+    # Delete it to start over.
+    parser.add_argument('--manifest-path', default=os.getenv('MANIFEST_PATH'))
+    # Per-stage, per-table timings: one JSON line per sample and running
+    # totals in Prometheus text format (e.g. for the node_exporter textfile
+    # collector)
+    parser.add_argument('--metrics-path', default=os.getenv('METRICS_PATH'))
+    parser.add_argument('--metrics-prom-path',
+                        default=os.getenv('METRICS_PROM_PATH'))
+    # Per-user snapshots of every batch as of the last generated day, read
+    # when advancing the clock
+    parser.add_argument('--state-dir', default=os.getenv('STATE_DIR'))
+    config = parser.parse_args(argv)
+
+    config.shard_index, config.shard_count = parse_shard(config.shard)
+    suffix = '' if config.shard_count == 1 else \
+        f'-shard-{config.shard_index}-of-{config.shard_count}'
+    if config.new_users_per_day is None:
+        config.new_users_per_day = config.num_users / 730
+    if config.manifest_path is None:
+        config.manifest_path = os.path.join(
+            config.log_dir, f'generation_manifest{suffix}.jsonl')
+    if config.metrics_path is None:
+        config.metrics_path = os.path.join(config.log_dir,
+                                           'generation_metrics.jsonl')
+    if config.metrics_prom_path is None:
+        config.metrics_prom_path = os.path.join(config.log_dir,
+                                                'generation_metrics.prom')
+    if config.profile_path is None:
+        config.profile_path = os.path.join(config.log_dir,
+                                           f'data_profile{suffix}.json')
+    if config.state_dir is None:
+        config.state_dir = os.path.join(config.log_dir, f'user_state{suffix}')
+    return config
+
+
+def setup_logging(log_dir):
+    '''Log INFO to stderr and DEBUG to a rotating file in ``log_dir``.'''
+    if logger.handlers:
+        return
+    os.makedirs(log_dir, exist_ok=True)
+    logger.setLevel(logging.DEBUG)
+    formatter = logging.Formatter(
+        '%(asctime)s %(levelname)s [%(module)s:%(lineno)d] %(message)s')
+    stream_h = logging.StreamHandler()
+    stream_h.setLevel(logging.INFO)
+    stream_h.setFormatter(formatter)
+    file_h = RotatingFileHandler(os.path.join(
+        log_dir, 'generate_synthetic_data.log'), maxBytes=5_000_000,
+        backupCount=5)
+    file_h.setLevel(logging.DEBUG)
+    file_h.setFormatter(formatter)
+    logger.addHandler(stream_h)
+    logger.addHandler(file_h)
 
 # Static data: Languages
 languages_data = [
@@ -158,293 +299,490 @@ base_languages = [
     {'language_name': 'Mandarin', 'popularity_score': 0.5,
         'script_type': 'Latin', 'native_speakers_millions': 990}]
 
-# Helper functions
-
-
-def generate_signup_date():
-    # Up to 2 years back
-    return CURRENT_DATE - datetime.timedelta(days=random.randint(1, 730))
-
-
-def simulate_churn(signup_date):
-    '''Simple churn simulation using geometric distribution. Average retention ~100 days
-     Returns (is_churner, churn_date - True, None if not churned, else churn date)'''
-    retention_days = int(np.random.geometric(p=0.01)) + \
-        30  # Avg 100 days, min 30 (discount immediate churn)
-    churn_date = signup_date + datetime.timedelta(days=retention_days)
-    # If churn_date is on or before CURRENT_DATE -> churned
-    if churn_date <= CURRENT_DATE:
-        return True, churn_date
-    return False, None
-
-
-def generate_daily_activity(user_id, signup_date, is_churner, is_premium):
-    activities = []
-    current_streak = 0
-    current_date = signup_date
-    while current_date <= CURRENT_DATE:
-        if is_churner and (current_date - signup_date).days > 60:  # Decay after 60 days
-            # Exponential decay
-            activity_prob = 0.5 * \
-                np.exp(- (current_date - signup_date).days / 100)
-        else:
-            activity_prob = 0.8 if is_premium else 0.6  # Premium more active
-
-        # random.random() gives [0,1)
-        if random.random() < activity_prob:
-            # Avg 5 lessons/day (poisson because discrete distr.)
-            lessons = np.random.poisson(5)
-            xp = lessons * 10 + random.randint(0, 50)
-            time_spent = np.random.normal(20, 5)  # Avg 20 min
-            current_streak += 1
-            goal_met = int(np.random.choice([1, 0], p=[0.7, 0.3]))
-            rank = random.randint(1, 100) if random.random() > 0.5 else None
-        else:
-            lessons, xp, time_spent, goal_met, rank = 0, 0, 0, 0, None
-            current_streak = 0
-
-        activities.append({
-            'user_id': user_id,
-            'activity_date': current_date,
-            'lessons_completed': lessons,
-            'xp_gained': xp,
-            'time_spent_minutes': max(0, time_spent),  # No negative
-            'streak_days': current_streak,
-            'daily_goal_met': goal_met,
-            'leaderboard_rank': rank,
-            'duolingo_plus_active': is_premium
-        })
-        current_date += datetime.timedelta(days=1)
-    return pd.DataFrame(activities)
-
-
-def generate_sessions(user_id, user_course_id, activity_df):
-    sessions = []
-    for _, row in activity_df.iterrows():
-        if row['lessons_completed'] > 0:
-            num_sessions = random.randint(1, 3)  # 1-3 sessions/day
-            for _ in range(num_sessions):
-                start = datetime.datetime.combine(
-                    row['activity_date'], fake.time_object())
-                end = start + \
-                    datetime.timedelta(minutes=np.random.normal(10, 3))
-                exercises = np.random.poisson(10)
-                accuracy = np.random.normal(85, 10)  # Avg 85%
-                sessions.append({
-                    'user_id': user_id,
-                    'user_course_id': user_course_id,
-                    'session_start': start,
-                    'session_end': end,
-                    'exercises_completed': exercises,
-                    'accuracy_percentage': min(100, max(50, accuracy)),
-                    'skill_practiced': random.choice(['Vocabulary', 'Grammar', 'Listening', 'Speaking']),
-                    'hearts_lost': random.randint(0, 5),
-                    'gems_earned': random.randint(0, 20)
-                })
-    return pd.DataFrame(sessions)
-
-
-def generate_notifications(user_id, activity_df):
-    notifications = []
-    for _, row in activity_df.iterrows():
-        if random.random() < 0.3:  # 30% chance per day
-            sent = datetime.datetime.combine(
-                row['activity_date'], fake.time_object())
-            n_type = random.choice(
-                ['Streak Reminder', 'Progress Update', 'Friend Challenge', 'Daily Goal'])
-            opened = int(np.random.choice([1, 0], p=[0.6, 0.4]))
-            clicked = int(opened and np.random.choice([1, 0], p=[0.5, 0.5]))
-            # Simulate boost: If notification, increase next day's activity prob (but handled in analysis)
-            notifications.append({
-                'user_id': user_id,
-                'sent_date': sent,
-                'notification_type': n_type,
-                'opened': opened,
-                'clicked': clicked,
-                'response_time_seconds': random.randint(10, 3600) if clicked else None,
-                'channel': random.choice(['Push', 'Email', 'In-App'])
-            })
-    return pd.DataFrame(notifications)
+# Main generation
 
 
-# Main generation
-engine = create_engine(DB_CONNECTION_STRING)
-logger.info('Created SQLAlchemy engine')
-
-# Step 1: Insert static languages
-languages_df = pd.DataFrame(languages_data)
-try:
-    languages_df.to_sql('languages', engine, if_exists='append', index=False)
-    logger.info('Inserted %d languages rows into languages table',
-                len(languages_df))
-except SQLAlchemyError:
-    logger.exception('Failed to insert languages into database')
-
-# Step 2: Generate courses (combinations)
-courses = []
-for target in range(1, len(languages_data) + 1):
-    for base in range(1, len(base_languages) + 1):
-        if target != base:
-            courses.append({
-                'target_language_id': target,
-                'base_language_id': base,
-                'difficulty_level': random.randint(1, 5),
-                'total_lessons': random.randint(100, 300),
-                'avg_completion_time_days': np.random.normal(90, 30),
-                'created_date': fake.date_between(start_date='-5y', end_date='today')
-            })
-courses_df = pd.DataFrame(courses[:100])  # Limit to 100 courses for simplicity
-try:
-    courses_df.to_sql('courses', engine, if_exists='append', index=False)
-    logger.info('Inserted %d courses rows into courses table', len(courses_df))
-except SQLAlchemyError:
-    logger.exception('Failed to insert courses into database')
-
-# Step 3: Generate users
-users = []
-for uid in range(NUM_USERS):
-    signup = generate_signup_date()
-    is_premium = np.random.choice([1, 0], p=[0.2, 0.8])  # 20% premium
-    churn_flag, churn_date = simulate_churn(signup)
-    users.append({
-        'user_id': uid,
-        'signup_date': signup,
-        # Avg 30, min 18, max 100
-        'age': int(round(np.clip(np.random.normal(30, 10), 18, 100))),
-        'gender': random.choice(['Male', 'Female', 'Non-binary', 'Prefer not to say']),
-        'country': fake.country()[:49],  # Limit length
-        'device_type': np.random.choice(['iOS', 'Android', 'Web'], p=[0.4, 0.4, 0.2]),
-        'referral_source': random.choice(['Friend', 'Ad', 'Organic']),
-        'learning_motivation': random.choice(['Travel', 'Career', 'Hobby', 'School']),
-        'email_verified': np.random.choice([1, 0], p=[0.9, 0.1]),
-        'duolingo_plus_subscribed': int(is_premium)
-    })
-users_df = pd.DataFrame(users)
-try:
-    with engine.begin() as conn:
-        result = conn.execute(text("SELECT COUNT(*) FROM users"))
-        existing_count = int(result.scalar())
-        logger.info('Users table currently has %d rows', existing_count)
-        if existing_count < NUM_USERS:
-            users_df.to_sql('users', conn, if_exists='append', index=False)
-            logger.info('Inserted %d users into users table', len(users_df))
-        else:
-            logger.info(
-                'Skipping users insert because existing_count (%d) >= NUM_USERS (%d)', existing_count, NUM_USERS)
-except SQLAlchemyError:
-    logger.exception('Failed writing users to database')
-
-# Step 4: For each user, generate related data (this loop is memory-intensive; batching)
-batch_size = 10000  # Process in batches
-for start in range(0, NUM_USERS, batch_size):
-    end = min(start + batch_size, NUM_USERS)
-    user_ids = range(start + 1, end + 1)  
-    logger.info('Starting batch %d-%d', start+1, end)
-
-    # User courses: 1-3 per user
-    user_courses = []
-    for uid in user_ids:
-        num_courses = random.randint(1, 3)
-        for _ in range(num_courses):
-            user_courses.append({
-                'user_id': uid,
-                'course_id': random.randint(1, len(courses_df)),
-                'start_date': users_df.iloc[uid-1]['signup_date'],
-                'current_level': random.randint(1, 50),
-                'total_xp': random.randint(0, 10000),
-                'crown_count': random.randint(0, 200),
-                'lingot_count': random.randint(0, 500)
-            })
-    with engine.begin() as conn:
-        try:
-            pd.DataFrame(user_courses).to_sql('user_courses',
-                                              conn, if_exists='append', index=False)
-            logger.info('Batch %d-%d: inserted %d user_courses rows',
-                        start+1, end, len(user_courses))
-        except SQLAlchemyError:
-            logger.exception(
-                'Failed to insert user_courses for batch %d-%d', start+1, end)
-
-    # Daily activity, sessions, notifications, churn
-    daily_activities = pd.DataFrame()
-    all_sessions = pd.DataFrame()
-    all_notifications = pd.DataFrame()
-    churns = []
-    for idx, uid in enumerate(user_ids):
-        try:
-            # Use absolute index into users_df (users are 0-indexed by user_id-1)
-            user_row = users_df.iloc[uid-1]
-            is_churner = bool(user_row.get('churn_flag', 0))
-            activity_df = generate_daily_activity(uid, user_row['signup_date'], is_churner,
-                                                  user_row['duolingo_plus_subscribed'])
-            daily_activities = pd.concat([daily_activities, activity_df])
-
-            # Sessions: Linked to a course
-            # Find first course associated with this user in this batch
-            uc = next(
-                (uc for uc in user_courses if uc['user_id'] == uid), None)
-            uc_id = uc['course_id'] if uc else None
-            sessions_df = generate_sessions(uid, uc_id, activity_df)
-            all_sessions = pd.concat([all_sessions, sessions_df])
-
-            notifs_df = generate_notifications(uid, activity_df)
-            all_notifications = pd.concat([all_notifications, notifs_df])
-
-            last_active = activity_df[activity_df['lessons_completed']
-                                      > 0]['activity_date'].max()
-            retention_days = (
-                last_active - user_row['signup_date']).days if pd.notnull(last_active) else 0
-            churns.append({
-                'user_id': uid,
-                'churn_flag': 1 if is_churner else 0,
-                'churn_date': user_row.get('churn_date', None),
-                'last_active_date': last_active,
-                'churn_reason_category': random.choice(['Inactivity', 'Difficulty',
-                                                        'Time Constraints']) if is_churner else None,
-                'retention_days': retention_days,
-                'reactivation_attempts': random.randint(0, 3) if is_churner else 0
-            })
-        except Exception:
-            logger.exception(
-                'Error generating data for user %d in batch %d-%d', uid, start+1, end)
-            # continue with next user
-    with engine.begin() as conn:
+def insert_logger(manifest, failed, seed):
+    '''Factory of pipeline ``on_done`` callbacks that record every committed
+    unit in ``manifest`` and collect the failed ones in ``failed``.'''
+    def log_insert(table, label, start, end):
+        def on_done(rows, error):
+            if error is None:
+                manifest.record(table, label, rows, seed,
+                                first_user_id=start+1, last_user_id=end)
+                logger.info('Batch %d-%d: inserted %s rows=%d',
+                            start+1, end, table, rows)
+            else:
+                failed.append(f'{table}/{label}')
+                logger.error('Failed inserting %s for batch %d-%d', table,
+                             start+1, end, exc_info=error)
+        return on_done
+    return log_insert
+
+
+def record_generated(metrics, tables, label, timings):
+    from pipeline import frame_nbytes
+    for table, seconds in timings.items():
+        frame = tables.get(table)
+        metrics.record('generate', table, label, seconds,
+                       0 if frame is None else len(frame),
+                       0 if frame is None else frame_nbytes(frame))
+    metrics.write_prometheus()
+
+
+def advance_clock(config, sink, num_courses):
+    '''Advance the last complete run by ``config.advance_days`` days: append
+    the new days of every saved batch of users, upsert their changed churn
+    labels and add the users who signed up meanwhile (see incremental.py).'''
+    import numpy as np
+    from batch_builder import BATCH_TABLES, BLOCK_SIZE
+    from generators import USER_COLUMNS
+    from incremental import (ADVANCE_TABLES, STATE_UNIT, build_advance,
+                             build_signups, iter_state, latest_state_date,
+                             mark_complete, save_state, signup_range)
+    from manifest import RunManifest
+    from metrics import RunMetrics
+    from pipeline import WritePipeline
+    from sharding import shard_range
+
+    seed = config.seed
+    from_date = latest_state_date(config.state_dir)
+    if from_date is None:
+        raise SystemExit(f'No complete user state in {config.state_dir}: run '
+                         f'a full generation (--advance-days 0) first')
+    to_date = from_date + datetime.timedelta(days=config.advance_days)
+    suffix = f'{to_date:%Y%m%d}'
+    root, ext = os.path.splitext(config.manifest_path)
+    manifest_path = f'{root}-advance-{suffix}{ext}'
+    manifest = RunManifest(manifest_path, {
+        'num_users': config.num_users, 'seed': seed,
+        'current_date': config.date, 'block_size': BLOCK_SIZE,
+        'shard': config.shard, 'from_date': from_date, 'to_date': to_date,
+        'new_users_per_day': config.new_users_per_day,
+        'churn_rate': config.churn_rate})
+    logger.info('Advancing from %s to %s, using run manifest %s', from_date,
+                to_date, manifest_path)
+    metrics = RunMetrics(config.metrics_path, config.metrics_prom_path)
+    failed = []
+    log_insert = insert_logger(manifest, failed, seed)
+
+    def selected(tables):
+        return tuple(table for table in tables if table in config.tables) + \
+            (STATE_UNIT,)
+
+    with WritePipeline(sink, config.writer_threads,
+                       config.max_pending_mb * 1024 ** 2,
+                       metrics=metrics) as pipeline:
+        def submit(tables, pending, label, start, end, key=None):
+            for table in pending:
+                if table != STATE_UNIT:
+                    pipeline.submit(
+                        table, tables.pop(table),
+                        log_insert(table, label, start, end),
+                        partition=f'users-{start+1:09d}'
+                        if table == 'users' else label,
+                        key=key if table == 'churn_labels' else None)
+
+        def save(label, state, delta, start, end):
+            save_state(config.state_dir, to_date, label, state)
+            manifest.record(STATE_UNIT, delta, len(state), seed,
+                            first_user_id=start+1, last_user_id=end)
+
+        # Existing users (including those of earlier advances); their churn
+        # labels already exist, so the changed ones replace them
+        for label, state in iter_state(config.state_dir, from_date):
+            delta = f'{label}-{suffix}'
+            pending = manifest.pending(selected(ADVANCE_TABLES), delta)
+            if not pending:
+                logger.info('Skipping %s: already committed', delta)
+                continue
+            start = int(state['user_id'].iloc[0]) - 1
+            end = int(state['user_id'].iloc[-1])
+            timings = {}
+            try:
+                tables, new_state = build_advance(
+                    state, from_date, to_date, seed, timings,
+                    config.churn_rate)
+            except Exception:
+                logger.exception('Error advancing batch %d-%d', start+1, end)
+                failed.append(delta)
+                continue
+            record_generated(metrics, tables, delta, timings)
+            if STATE_UNIT in pending:
+                save(label, new_state, delta, start, end)
+            submit(tables, pending, delta, start, end, key='user_id')
+
+        # New users get the ids after those of the full run and of every
+        # earlier advance; batches stay aligned to the batch size
+        first, last = signup_range(config.num_users, config.new_users_per_day,
+                                   config.date, from_date, to_date)
+        first, last = shard_range(last, config.shard_index,
+                                  config.shard_count, BLOCK_SIZE, first=first)
+        logger.info('Generating signups %d-%d', first + 1, last)
+        start = first
+        while start < last:
+            end = min((start // config.batch_size + 1) * config.batch_size,
+                      last)
+            label = f'batch-{start+1:09d}'
+            delta = f'{label}-{suffix}'
+            pending = manifest.pending(
+                selected(('users',) + BATCH_TABLES), delta)
+            if pending:
+                timings = {}
+                try:
+                    users, tables, state = build_signups(
+                        np.arange(start + 1, end + 1), from_date, to_date,
+                        num_courses, seed, timings, config.churn_rate)
+                except Exception:
+                    logger.exception('Error generating signups %d-%d',
+                                     start+1, end)
+                    failed.append(delta)
+                else:
+                    tables['users'] = users[USER_COLUMNS]
+                    record_generated(metrics, tables, delta, timings)
+                    if STATE_UNIT in pending:
+                        save(label, state, delta, start, end)
+                    submit(tables, pending, delta, start, end)
+            start = end
+
+    if failed:
+        logger.error('%d unit(s) failed; rerun to complete them', len(failed))
+    else:
+        mark_complete(config.state_dir, to_date)
+    metrics.close()
+    logger.info('Stage summary (metrics in %s, %s):\n%s', config.metrics_path,
+                config.metrics_prom_path, metrics.summary())
+
+
+def main(argv=None):
+    import warnings
+    from dotenv import load_dotenv
+
+    # .env may set any of the options' environment variables
+    load_dotenv()
+    config = parse_args(argv)
+    setup_logging(config.log_dir)
+    warnings.filterwarnings("ignore")
+
+    import numpy as np
+    import pandas as pd
+    from batch_builder import (BATCH_TABLES, BLOCK_SIZE, build_courses,
+                               build_users, generate_batches)
+    from batch_sizing import BatchPlanner, estimate_rows
+    from generators import USER_COLUMNS
+    from incremental import STATE_UNIT, mark_complete, save_state, user_state
+    from manifest import RunManifest
+    from metrics import RunMetrics
+    from pipeline import WritePipeline, frame_nbytes
+    from profiler import DataProfiler, load_expectations
+    from schema import TABLE_SCHEMAS
+    from sharding import frame_fingerprint, shard_range
+    from sinks import SinkError, create_sink
+    from star_schema import FACT_SOURCES, STAR_FACTS, StarSchema, stage_table
+
+    start_time = time.time()
+    logger.info(f'Starting synthetic data generation script at {start_time}')
+    url = config.sink or sql_server_url()
+    if config.sink is None:
+        logger.debug('DB connection target: host=%s, db=%s, user=%s',
+                     os.getenv('HOST'), os.getenv('DB'), os.getenv('DB_USER'))
+    star_prefix = config.star_table_prefix
+    if star_prefix is None:
+        star_prefix = 'analytics_wh.' if url.startswith('mssql') else ''
+    seed, current_date = config.seed, config.date
+
+    sink = create_sink(url, chunksize=config.chunksize, dtypes=TABLE_SCHEMAS)
+    logger.info('Created %s', type(sink).__name__)
+    first_user, last_user = shard_range(config.num_users, config.shard_index,
+                                        config.shard_count, BLOCK_SIZE)
+    logger.info('Shard %s: users %d-%d', config.shard, first_user + 1,
+                last_user)
+
+    # The static dimensions depend only on the seed, so every shard generates
+    # identical ones; their fingerprint in the config proves it. Only shard 0
+    # writes them.
+    languages_df = pd.DataFrame(languages_data).astype(
+        TABLE_SCHEMAS['languages'])
+    courses_df = build_courses(len(languages_data), len(base_languages),
+                               current_date, seed)
+    write_dimensions = config.shard_index == 0
+    if config.advance_days > 0:
+        advance_clock(config, sink, len(courses_df))
+        sink.close()
+        logger.info('Advanced the clock in %.2f seconds',
+                    time.time() - start_time)
+        return 0
+
+    # Batch boundaries do not change the generated data, so they are not part
+    # of the run config
+    manifest = RunManifest(config.manifest_path, {
+        'num_users': config.num_users, 'seed': seed,
+        'current_date': current_date, 'block_size': BLOCK_SIZE,
+        'shard': config.shard, 'churn_rate': config.churn_rate,
+        'static_fingerprint': frame_fingerprint(languages_df) +
+        frame_fingerprint(courses_df)})
+    logger.info('Using run manifest %s', config.manifest_path)
+    metrics = RunMetrics(config.metrics_path, config.metrics_prom_path)
+    failed = []
+    profiler = DataProfiler(
+        load_expectations(config.expectations) if config.expectations
+        else None, config.churn_rate) if config.profile else None
+
+    def checked(label, tables):
+        '''Profile the tables of one unit; False if the run must stop.'''
+        if profiler is None:
+            return True
+        problems = []
+        for table, frame in tables.items():
+            profile_started = time.perf_counter()
+            problems.extend(profiler.observe(table, frame))
+            metrics.record('profile', table, label,
+                           time.perf_counter() - profile_started, len(frame))
+        profiler.write(config.profile_path)
+        for problem in problems:
+            logger.error('Expectation failed in %s: %s', label, problem)
+        return not problems or config.on_violation == 'warn'
+
+    def stop():
+        sink.close()
+        metrics.close()
+        logger.error('Stopped: the generated data violates its expectations '
+                     '(profile in %s)', config.profile_path)
+        return 1
+
+    if not checked('static', {table: frame for table, frame in (
+            ('languages', languages_df), ('courses', courses_df))
+            if table in config.tables}):
+        return stop()
+
+    def write_static(table, frame, partition=None):
+        stats = {}
+        sink.write(table, frame, partition, stats=stats)
+        metrics.record_write(table, 'static', len(frame), frame_nbytes(frame),
+                             stats)
+
+    # Step 1: Insert static languages
+    if 'languages' not in config.tables:
+        logger.info('Skipping languages insert: not selected')
+    elif not write_dimensions:
+        logger.info('Skipping languages insert: written by shard 0')
+    elif manifest.is_done('languages', 'static'):
+        logger.info('Skipping languages insert: already committed')
+    else:
         try:
-            daily_activities.to_sql(
-                'daily_activity', conn, if_exists='append', index=False)
-            logger.info('Batch %d-%d: inserted daily_activity rows=%d',
-                        start+1, end, len(daily_activities))
-        except SQLAlchemyError:
-            logger.exception(
-                'Failed inserting daily_activity for batch %d-%d', start+1, end)
-    with engine.begin() as conn:
+            write_static('languages', languages_df)
+            manifest.record('languages', 'static', len(languages_df), seed)
+            logger.info('Inserted %d languages rows into languages table',
+                        len(languages_df))
+        except SinkError:
+            logger.exception('Failed to insert languages into database')
+            failed.append('languages')
+
+    # Step 2: Generate courses (combinations, limited to 100 for simplicity)
+    if 'courses' not in config.tables:
+        logger.info('Skipping courses insert: not selected')
+    elif not write_dimensions:
+        logger.info('Skipping courses insert: written by shard 0')
+    elif manifest.is_done('courses', 'static'):
+        logger.info('Skipping courses insert: already committed')
+    else:
         try:
-            all_sessions.to_sql(
-                'sessions', conn, if_exists='append', index=False)
-            logger.info('Batch %d-%d: inserted sessions rows=%d',
-                        start+1, end, len(all_sessions))
-        except SQLAlchemyError:
-            logger.exception(
-                'Failed inserting sessions for batch %d-%d', start+1, end)
-    with engine.begin() as conn:
+            write_static('courses', courses_df)
+            manifest.record('courses', 'static', len(courses_df), seed)
+            logger.info('Inserted %d courses rows into courses table', len(courses_df))
+        except SinkError:
+            logger.exception('Failed to insert courses into database')
+            failed.append('courses')
+
+    # Step 2b: Star-schema dimensions with the keys the facts refer to,
+    # written with the courses
+    star = StarSchema(len(languages_df), len(courses_df)) \
+        if config.star_schema else None
+    if star and write_dimensions and 'courses' in config.tables:
+        for table, frame in star.dimensions(languages_df, courses_df).items():
+            if manifest.is_done(table, 'static'):
+                logger.info('Skipping %s insert: already committed', table)
+                continue
+            try:
+                write_static(star_prefix + stage_table(table), frame)
+                manifest.record(table, 'static', len(frame), seed)
+                logger.info('Inserted %d %s rows', len(frame), table)
+            except SinkError:
+                logger.exception('Failed to insert %s into database', table)
+                failed.append(table)
+
+    # Step 4 writes these (plus every batch's user state); the users are
+    # generated for it even if their table is not selected
+    batch_units = tuple(table for table in BATCH_TABLES
+                        if table in config.tables)
+    if star:
+        batch_units += tuple(fact for fact in STAR_FACTS
+                             if FACT_SOURCES[fact] in config.tables)
+    if 'users' not in config.tables and not batch_units:
+        sink.close()
+        metrics.close()
+        logger.info('Data generation complete in %.2f seconds',
+                    time.time() - start_time)
+        return 0
+
+    # Step 3: Generate users (vectorized, every block of users drawn from its
+    # own stream derived from the seed). user_id runs 1..num_users and is
+    # written explicitly (IDENTITY_INSERT on SQL Server) since the batches
+    # below refer to it; this shard owns first_user+1..last_user. The
+    # simulated churn is not stored on the users table but drives the
+    # activity decay and churn_labels of Step 4.
+    generate_started = time.perf_counter()
+    users_df = build_users(np.arange(first_user + 1, last_user + 1),
+                           current_date, seed, config.churn_rate)
+    metrics.record('generate', 'users', 'static',
+                   time.perf_counter() - generate_started, len(users_df),
+                   frame_nbytes(users_df[USER_COLUMNS]))
+    logger.info('Generated %d users', len(users_df))
+    if 'users' in config.tables and \
+            not checked('users', {'users': users_df[USER_COLUMNS]}):
+        return stop()
+
+    # Users are always regenerated (Step 4 needs them) but written only once
+    if 'users' not in config.tables:
+        logger.info('Skipping users insert: not selected')
+    elif manifest.is_done('users', 'static'):
+        logger.info('Skipping users insert: already committed')
+    else:
         try:
-            all_notifications.to_sql(
-                'notifications', conn, if_exists='append', index=False)
-            logger.info('Batch %d-%d: inserted notifications rows=%d',
-                        start+1, end, len(all_notifications))
-        except SQLAlchemyError:
-            logger.exception(
-                'Failed inserting notifications for batch %d-%d', start+1, end)
-    with engine.begin() as conn:
+            # Named after the first user so that shards writing files to a
+            # shared directory do not collide
+            write_static('users', users_df[USER_COLUMNS],
+                         f'users-{first_user+1:09d}')
+            manifest.record('users', 'static', len(users_df), seed)
+            logger.info('Inserted %d users into users table', len(users_df))
+        except SinkError:
+            logger.exception('Failed writing users to database')
+            failed.append('users')
+    if star and 'users' in config.tables and \
+            not manifest.is_done('dim_user', 'static'):
         try:
-            pd.DataFrame(churns).to_sql('churn_labels', conn,
-                                        if_exists='append', index=False)
-            logger.info('Batch %d-%d: inserted churn_labels rows=%d',
-                        start+1, end, len(churns))
-        except SQLAlchemyError:
-            logger.exception(
-                'Failed inserting churn_labels for batch %d-%d', start+1, end)
-
-elapsed = time.time() - start_time
-logger.info('Data generation complete in %.2f seconds', elapsed)
-print('Data generation complete!')
+            dim_user = star.dim_user(users_df, current_date)
+            write_static(star_prefix + stage_table('dim_user'), dim_user,
+                         f'users-{first_user+1:09d}')
+            manifest.record('dim_user', 'static', len(dim_user), seed)
+            logger.info('Inserted %d dim_user rows', len(dim_user))
+        except SinkError:
+            logger.exception('Failed writing dim_user to database')
+            failed.append('dim_user')
+
+    # Step 4: For each user, generate related data (batched; each batch is built
+    # column-wise and every table is materialized once). Batches can be built
+    # in a process pool: every block of users draws from its own random stream
+    # derived from the seed, so the output does not depend on the number of
+    # workers or on the batch boundaries.
+    planner = BatchPlanner(
+        estimate_rows(users_df['signup_date'],
+                      users_df['duolingo_plus_subscribed'], current_date),
+        BLOCK_SIZE,
+        memory_budget=config.batch_memory_mb * 1024 ** 2 or None,
+        batch_size=config.batch_size, first=first_user)
+
+    # Every batch also saves the users' state snapshot for --advance-days runs
+    units = batch_units + (STATE_UNIT,) if batch_units else ()
+
+    def plan_batches():
+        '''Batches the manifest has partially committed keep their recorded
+        boundaries; every user range it does not cover is planned anew.'''
+        next_start = first_user
+        for label, (first, last) in sorted(manifest.batch_ranges().items(),
+                                           key=lambda item: item[1]):
+            for start, end in planner.iter_batches(next_start, first - 1):
+                yield start, end, list(units)
+            pending = manifest.pending(units, label)
+            if pending:
+                yield first - 1, last, pending
+            next_start = max(next_start, last)
+        for start, end in planner.iter_batches(next_start, last_user):
+            yield start, end, list(units)
+
+    planned = deque()
+
+    def tasks():
+        # users_df row i holds user_id first_user+i+1
+        for start, end, pending in plan_batches():
+            planned.append((start, end, pending))
+            yield (np.arange(start + 1, end + 1),
+                   users_df.iloc[start - first_user:end - first_user],
+                   len(courses_df), current_date, seed)
+
+    if config.batch_memory_mb:
+        logger.info('Sizing batches to a %d MB memory budget',
+                    config.batch_memory_mb)
+    logger.info('Generating batches with %d worker(s), writing with %d thread(s)',
+                config.workers, config.writer_threads)
+
+    log_insert = insert_logger(manifest, failed, seed)
+    aborted = False
+
+    with WritePipeline(sink, config.writer_threads,
+                       config.max_pending_mb * 1024 ** 2,
+                       metrics=metrics) as pipeline:
+        for batch, error, stats in generate_batches(
+                tasks() if units else iter(()), config.workers):
+            start, end, pending = planned.popleft()
+            if error:
+                logger.error('Error generating data for batch %d-%d\n%s',
+                             start+1, end, error)
+                failed.append(f'batch-{start+1:09d}')
+                continue
+            planner.observe(start, end, stats['rss_delta'])
+            logger.info('Generated batch %d-%d in %.1fs: ~%d rows expected, '
+                        'peak RSS +%.0f MB, now %.0f bytes/row',
+                        start+1, end, stats['seconds'],
+                        planner.estimated_rows(start, end),
+                        (stats['rss_delta'] or 0) / 1024 ** 2,
+                        planner.bytes_per_row)
+            label = f'batch-{start+1:09d}'
+            for table, seconds in stats['table_seconds'].items():
+                metrics.record('generate', table, label, seconds,
+                               len(batch[table]), frame_nbytes(batch[table]),
+                               stats['peak_rss'])
+            metrics.write_prometheus()
+            if not checked(label, {table: batch[table] for table in pending
+                                   if table in BATCH_TABLES}):
+                aborted = True
+                break
+            if STATE_UNIT in pending:
+                state = user_state(
+                    users_df.iloc[start - first_user:end - first_user], batch)
+                save_state(config.state_dir, current_date, label, state)
+                manifest.record(STATE_UNIT, label, len(state), seed,
+                                first_user_id=start+1, last_user_id=end)
+            if star and set(STAR_FACTS) & set(pending):
+                star_started = time.perf_counter()
+                batch.update(star.facts(batch))
+                metrics.record('generate', 'star_facts', label,
+                               time.perf_counter() - star_started,
+                               sum(len(batch[table]) for table in STAR_FACTS))
+            for table in pending:
+                if table != STATE_UNIT:
+                    pipeline.submit(
+                        star_prefix + table if table in STAR_FACTS
+                        else table, batch.pop(table),
+                        log_insert(table, label, start, end),
+                        partition=label)
+            batch = None
+
+    if aborted:
+        return stop()
+    if failed:
+        logger.error('%d unit(s) failed; rerun to complete them', len(failed))
+    elif units:
+        mark_complete(config.state_dir, current_date)
+    sink.close()
+    metrics.close()
+    elapsed = time.time() - start_time
+    logger.info('Data generation complete in %.2f seconds', elapsed)
+    logger.info('Stage summary (metrics in %s, %s):\n%s', config.metrics_path,
+                config.metrics_prom_path, metrics.summary())
+    print('Data generation complete!')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,395 @@
+'''Vectorized table generators for the synthetic data pipeline.
+
+Each generator takes a whole batch of users as NumPy arrays and draws every
+column in bulk from a ``numpy.random.Generator``, instead of looping over
+users and calendar days in Python. Frames are built in the compact column
+types of ``schema.TABLE_SCHEMAS``.
+'''
+import functools
+
+import numpy as np
+import pandas as pd
+
+from schema import (CHANNELS, CHURN_REASONS, DEVICE_TYPES, GENDERS,
+                    LEARNING_MOTIVATIONS, NOTIFICATION_TYPES,
+                    REFERRAL_SOURCES, SKILLS, categorical, masked,
+                    typed_frame)
+
+
+def _segment_offsets(lengths):
+    '''Return (owner, offset) for a flattened ragged array.
+
+    ``owner[i]`` is the segment that row ``i`` belongs to and ``offset[i]`` is
+    its position inside that segment.'''
+    lengths = np.asarray(lengths, dtype=np.int64)
+    total = int(lengths.sum())
+    owner = np.repeat(np.arange(len(lengths)), lengths)
+    starts = np.cumsum(lengths) - lengths
+    offset = np.arange(total, dtype=np.int64) - np.repeat(starts, lengths)
+    return owner, offset
+
+
+def _running_streak(active, segment_start, initial=None):
+    '''Consecutive-active-day counter that resets on inactive days and at the
+    start of every segment (user). ``initial`` (per row) is added while a
+    segment's first run of active days lasts, to continue an earlier streak.'''
+    idx = np.arange(len(active), dtype=np.int64)
+    # Position of the last "reset" at or before each row: an inactive day
+    # resets to itself, the first day of a user resets to the row before it
+    reset = np.where(~active, idx, np.where(segment_start, idx - 1, -1))
+    last_reset = np.maximum.accumulate(reset) if len(reset) else reset
+    streak = np.where(active, idx - last_reset, 0)
+    if initial is not None:
+        # The run of an active row began right after its last reset
+        unbroken = active & segment_start[np.where(active, last_reset + 1, 0)]
+        streak = streak + np.where(unbroken, initial, 0)
+    return streak
+
+
+def generate_daily_activity(user_ids, signup_dates, is_churner, is_premium,
+                            current_date, rng, start_dates=None,
+                            initial_streak=None, churn_dates=None):
+    '''Generate the user x day activity matrix for a batch of users.
+
+    One row per user per calendar day from signup (or ``start_dates``, to
+    generate only the days after an earlier run) up to ``current_date``;
+    ``initial_streak`` continues the streaks users had before their first
+    generated day. Premium users are active 80% of days, others 60%;
+    churners decay exponentially after their first 60 days and, given their
+    ``churn_dates``, are inactive for the last ``CHURN_INACTIVE_DAYS`` days
+    before churning and ever after.'''
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    signup = np.asarray(signup_dates, dtype='datetime64[D]')
+    is_churner = np.asarray(is_churner, dtype=bool)
+    is_premium = np.asarray(is_premium, dtype=bool)
+    end = np.datetime64(current_date, 'D')
+    start = signup if start_dates is None else np.maximum(
+        np.asarray(start_dates, dtype='datetime64[D]'), signup)
+
+    num_days = np.maximum((end - start).astype(np.int64) + 1, 0)
+    owner, offset = _segment_offsets(num_days)
+    day = (start - signup).astype(np.int64)[owner] + offset  # Since signup
+    n = len(owner)
+
+    churner = is_churner[owner]
+    premium = is_premium[owner]
+    activity_prob = np.where(premium, 0.8, 0.6)  # Premium more active
+    decay = churner & (day > 60)  # Decay after 60 days
+    activity_prob = np.where(decay, 0.5 * np.exp(-day / 100), activity_prob)
+    if churn_dates is not None:
+        last_day = np.asarray(churn_dates, dtype='datetime64[D]')[owner] - \
+            np.timedelta64(CHURN_INACTIVE_DAYS, 'D')
+        gone = churner & (start[owner] + offset.astype('timedelta64[D]')
+                          > last_day)
+        activity_prob = np.where(gone, 0.0, activity_prob)
+    active = rng.random(n) < activity_prob
+
+    # Avg 5 lessons/day (poisson because discrete distr.)
+    lessons = np.where(active, rng.poisson(5, n), 0)
+    xp = np.where(active, lessons * 10 + rng.integers(0, 51, n), 0)
+    time_spent = np.where(active, np.maximum(
+        0, rng.normal(20, 5, n)), 0.0)  # Avg 20 min, no negative
+    goal_met = np.where(active, rng.random(n) < 0.7, False)
+    has_rank = active & (rng.random(n) > 0.5)
+    rank = rng.integers(1, 101, n)
+
+    segment_start = offset == 0
+    streak = _running_streak(
+        active, segment_start,
+        None if initial_streak is None
+        else np.asarray(initial_streak, dtype=np.int64)[owner])
+
+    return typed_frame('daily_activity', {
+        'user_id': user_ids[owner],
+        'activity_date': start[owner] + offset.astype('timedelta64[D]'),
+        'lessons_completed': lessons,
+        'xp_gained': xp,
+        'time_spent_minutes': time_spent,
+        'streak_days': streak,
+        'daily_goal_met': goal_met,
+        'leaderboard_rank': masked(rank, ~has_rank, 'Int8'),
+        'duolingo_plus_active': premium
+    })
+
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def _time_of_day(dates, rng):
+    '''Uniformly random timestamp (second resolution) on each given date.'''
+    seconds = rng.integers(0, SECONDS_PER_DAY, len(dates))
+    return (np.asarray(dates, dtype='datetime64[D]').astype('datetime64[us]')
+            + seconds.astype('timedelta64[s]'))
+
+
+def generate_sessions(activity, user_course_ids, rng):
+    '''Generate 1-3 sessions for every activity row with lessons completed.
+
+    ``user_course_ids`` is aligned with the rows of ``activity``.'''
+    lessons = activity['lessons_completed'].to_numpy()
+    rows = np.flatnonzero(lessons > 0)
+    num_sessions = rng.integers(1, 4, len(rows))  # 1-3 sessions/day
+    rows = np.repeat(rows, num_sessions)
+    n = len(rows)
+
+    start = _time_of_day(activity['activity_date'].to_numpy()[rows], rng)
+    # Avg 10 min; at least a minute, so no session ends before it starts
+    duration_us = (np.maximum(rng.normal(10, 3, n), 1) * 60e6).astype(
+        np.int64)
+    end = start + duration_us.astype('timedelta64[us]')
+    accuracy = np.clip(rng.normal(85, 10, n), 50, 100)  # Avg 85%
+
+    return typed_frame('sessions', {
+        'user_id': activity['user_id'].to_numpy()[rows],
+        'user_course_id': pd.array(user_course_ids)[rows],
+        'session_start': start,
+        'session_end': end,
+        'exercises_completed': rng.poisson(10, n),
+        'accuracy_percentage': accuracy,
+        'skill_practiced': categorical(
+            rng.integers(0, len(SKILLS), n), SKILLS),
+        'hearts_lost': rng.integers(0, 6, n),
+        'gems_earned': rng.integers(0, 21, n)
+    })
+
+
+def generate_notifications(activity, rng):
+    '''Send a notification on 30% of each user's days; clicks only happen on
+    opened notifications.'''
+    rows = np.flatnonzero(rng.random(len(activity)) < 0.3)
+    n = len(rows)
+
+    opened = rng.random(n) < 0.6
+    clicked = opened & (rng.random(n) < 0.5)
+    response_time = rng.integers(10, 3601, n)
+
+    return typed_frame('notifications', {
+        'user_id': activity['user_id'].to_numpy()[rows],
+        'sent_date': _time_of_day(
+            activity['activity_date'].to_numpy()[rows], rng),
+        'notification_type': categorical(
+            rng.integers(0, len(NOTIFICATION_TYPES), n), NOTIFICATION_TYPES),
+        'opened': opened,
+        'clicked': clicked,
+        'response_time_seconds': masked(response_time, ~clicked, 'Int16'),
+        'channel': categorical(rng.integers(0, len(CHANNELS), n), CHANNELS)
+    })
+
+
+def generate_user_courses(user_ids, signup_dates, num_courses, rng):
+    '''Enrol every user in 1-3 random courses starting on their signup date.'''
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    per_user = rng.integers(1, 4, len(user_ids))  # 1-3 per user
+    owner = np.repeat(np.arange(len(user_ids)), per_user)
+    n = len(owner)
+    return typed_frame('user_courses', {
+        'user_id': user_ids[owner],
+        'course_id': rng.integers(1, num_courses + 1, n),
+        'start_date': np.asarray(signup_dates, dtype='datetime64[D]')[owner],
+        'current_level': rng.integers(1, 51, n),
+        'total_xp': rng.integers(0, 10001, n),
+        'crown_count': rng.integers(0, 201, n),
+        'lingot_count': rng.integers(0, 501, n)
+    })
+
+
+def last_active_dates(user_ids, activity):
+    '''Last day with a completed lesson of every user in sorted
+    ``user_ids`` (NaT if none) according to ``activity``.'''
+    active = activity['lessons_completed'].to_numpy() > 0
+    last_active = pd.Series(
+        activity['activity_date'].to_numpy()[active]).groupby(
+        activity['user_id'].to_numpy()[active]).max()
+    return last_active.reindex(user_ids).to_numpy(dtype='datetime64[D]')
+
+
+def apply_churn_rules(signup_dates, is_churner, churn_dates, last_active,
+                      current_date):
+    '''The churn_labels business rules: a churner retained for fewer than 31
+    days is not labelled as churned; last_active_date is at least the signup
+    date and, for churners, at most ``CHURN_INACTIVE_DAYS`` before the churn
+    date; retention runs to the churn date, or to ``current_date``.
+
+    Returns (churn_flag, churn_dates, last_active, retention_days).'''
+    signup = np.asarray(signup_dates, dtype='datetime64[D]')
+    churn_dates = np.asarray(churn_dates, dtype='datetime64[D]')
+    last_active = np.asarray(last_active, dtype='datetime64[D]')
+    retention_days = (last_active - signup).astype(np.int64)
+    retention_days[np.isnat(last_active)] = 0
+    flag = np.asarray(is_churner, dtype=bool) & (retention_days >= 31)
+    churn_dates = np.where(flag, churn_dates, np.datetime64('NaT'))
+    # NaT compares False, so users never active keep no last_active_date
+    last_active = np.where(last_active < signup, signup, last_active)
+    latest = churn_dates - np.timedelta64(CHURN_INACTIVE_DAYS, 'D')
+    last_active = np.where(flag & (last_active > latest), latest, last_active)
+    retention_days = np.where(
+        flag, (churn_dates - signup).astype(np.int64),
+        (np.datetime64(current_date, 'D') - signup).astype(np.int64))
+    return flag, churn_dates, last_active, retention_days
+
+
+def generate_churn_labels(user_ids, signup_dates, is_churner, churn_dates,
+                          activity, current_date, rng):
+    '''One churn label per user, with last activity taken from ``activity``
+    and the business rules of ``apply_churn_rules`` applied.'''
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    n = len(user_ids)
+    flag, churn_dates, last_active, retention_days = apply_churn_rules(
+        signup_dates, is_churner, churn_dates,
+        last_active_dates(user_ids, activity), current_date)
+
+    reasons = rng.integers(0, len(CHURN_REASONS), n)
+    return typed_frame('churn_labels', {
+        'user_id': user_ids,
+        'churn_flag': flag,
+        'churn_date': churn_dates,
+        'last_active_date': last_active,
+        'churn_reason_category': categorical(
+            np.where(flag, reasons, -1), CHURN_REASONS),
+        'retention_days': retention_days,
+        'reactivation_attempts': np.where(flag, rng.integers(0, 4, n), 0)
+    })
+
+
+def generate_courses(num_targets, num_bases, current_date, rng, limit=100):
+    '''One course per (target, base) language pair with target != base, in
+    target-major order and limited to the first ``limit`` pairs.'''
+    pairs = np.arange(num_targets * num_bases)
+    target, base = pairs // num_bases + 1, pairs % num_bases + 1
+    keep = np.flatnonzero(target != base)[:limit]
+    n = len(keep)
+    # Created up to 5 years back
+    created = np.datetime64(current_date, 'D') - \
+        rng.integers(0, 5 * 365 + 1, n).astype('timedelta64[D]')
+    return typed_frame('courses', {
+        'target_language_id': target[keep],
+        'base_language_id': base[keep],
+        'difficulty_level': rng.integers(1, 6, n),
+        'total_lessons': rng.integers(100, 301, n),
+        'avg_completion_time_days': rng.normal(90, 30, n),
+        'created_date': created
+    })
+
+
+# Share of the users labelled as churned (the project charter targets 20-30%)
+DEFAULT_CHURN_RATE = 0.25
+SIGNUP_DAYS = 730
+# Churn is >30 days of inactivity: a churner's last active day is at least
+# this many days before the churn date
+CHURN_INACTIVE_DAYS = 31
+
+USER_COLUMNS = ['user_id', 'signup_date', 'age', 'gender', 'country',
+                'device_type', 'referral_source', 'learning_motivation',
+                'email_verified', 'duolingo_plus_subscribed']
+DEVICE_TYPE_P = [0.4, 0.4, 0.2]
+
+
+@functools.lru_cache(maxsize=1)
+def country_vocabulary():
+    '''The country names ``Faker().country()`` draws from, truncated to the
+    column width. Loaded once, users then sample it by index.'''
+    from faker.providers.address.en_US import Provider
+    return tuple(dict.fromkeys(country[:49] for country in Provider.countries))
+
+
+@functools.lru_cache(maxsize=None)
+def churn_hazard(churn_rate, signup_days=SIGNUP_DAYS):
+    '''Daily churn probability (after the first 30 days) under which about
+    ``churn_rate`` of the users end up labelled as churned.
+
+    Users sign up uniformly over ``signup_days`` days and churn 30 +
+    Geometric(p) days later; those churning within 31 days of it are not
+    labelled (see ``apply_churn_rules``). The labelled share first grows and
+    then falls with p, peaking near 58% for two years of signups; the
+    smaller, slower churning solution is returned.'''
+    k = np.arange(1, signup_days + 1) - 30  # Days to churn by current date
+
+    def labelled(p):
+        kept = (1 - p) ** 31
+        return np.where(k > 31, kept - (1 - p) ** np.maximum(k, 0),
+                        0.0).mean()
+
+    grid = np.geomspace(1e-5, 0.5, 400)
+    rates = np.array([labelled(p) for p in grid])
+    peak = int(rates.argmax())
+    if not 0 <= churn_rate <= rates[peak]:
+        raise ValueError(f'churn_rate must be in 0..{rates[peak]:.2f}, not '
+                         f'{churn_rate}')
+    lo, hi = 0.0, grid[peak]
+    for _ in range(60):
+        mid = (lo + hi) / 2
+        lo, hi = (mid, hi) if labelled(mid) < churn_rate else (lo, mid)
+    return (lo + hi) / 2
+
+
+def simulate_churn(signup_dates, current_date, rng, hazard):
+    '''Geometric retention with daily churn probability ``hazard`` (min 30
+    days to discount immediate churn).
+
+    Returns (is_churner, churn_dates); users whose churn date falls after
+    ``current_date`` have not churned and get NaT.'''
+    signup = np.asarray(signup_dates, dtype='datetime64[D]')
+    retention_days = rng.geometric(p=hazard, size=len(signup)) + 30
+    churn_dates = signup + retention_days.astype('timedelta64[D]')
+    is_churner = churn_dates <= np.datetime64(current_date, 'D')
+    return is_churner, np.where(is_churner, churn_dates, np.datetime64('NaT'))
+
+
+def advance_churn(signup_dates, is_churner, churn_dates, from_date, to_date,
+                  rng, hazard, last_active=None):
+    '''Continue ``simulate_churn`` from ``from_date`` to ``to_date``.
+
+    Retention is geometric and therefore memoryless: a user who had not
+    churned by ``from_date`` churns a geometric number of days after it (or
+    after day 30 since signup, whichever is later), but not before
+    ``CHURN_INACTIVE_DAYS`` have passed since their ``last_active`` day.'''
+    signup = np.asarray(signup_dates, dtype='datetime64[D]')
+    is_churner = np.asarray(is_churner, dtype=bool)
+    churn_dates = np.asarray(churn_dates, dtype='datetime64[D]')
+    since = np.maximum(np.datetime64(from_date, 'D'),
+                       signup + np.timedelta64(30, 'D'))
+    candidate = since + rng.geometric(
+        p=hazard, size=len(signup)).astype('timedelta64[D]')
+    if last_active is not None:
+        inactive_since = np.asarray(last_active, dtype='datetime64[D]') + \
+            np.timedelta64(CHURN_INACTIVE_DAYS, 'D')
+        candidate = np.where(np.isnat(inactive_since), candidate,
+                             np.maximum(candidate, inactive_since))
+    churned = ~is_churner & (candidate <= np.datetime64(to_date, 'D'))
+    return is_churner | churned, np.where(churned, candidate, churn_dates)
+
+
+def generate_users(user_ids, current_date, rng, signup_days=SIGNUP_DAYS,
+                   churn_rate=DEFAULT_CHURN_RATE):
+    '''Draw every user column for ``user_ids`` at once.
+
+    Users sign up on one of the ``signup_days`` days before ``current_date``.
+    Returns the users table columns plus the simulated ``churn_flag`` and
+    ``churn_date`` (see ``churn_hazard``); low-cardinality strings are
+    categoricals.'''
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    n = len(user_ids)
+    # Up to 2 years back
+    signup = np.datetime64(current_date, 'D') - \
+        rng.integers(1, signup_days + 1, n).astype('timedelta64[D]')
+    is_churner, churn_dates = simulate_churn(signup, current_date, rng,
+                                             churn_hazard(churn_rate))
+    countries = country_vocabulary()
+    return typed_frame('users', {
+        'user_id': user_ids,
+        'signup_date': signup,
+        # Avg 30, min 18, max 100
+        'age': np.rint(np.clip(rng.normal(30, 10, n), 18, 100)),
+        'gender': categorical(rng.integers(0, len(GENDERS), n), GENDERS),
+        'country': categorical(rng.integers(0, len(countries), n), countries),
+        'device_type': categorical(
+            rng.choice(len(DEVICE_TYPES), n, p=DEVICE_TYPE_P), DEVICE_TYPES),
+        'referral_source': categorical(
+            rng.integers(0, len(REFERRAL_SOURCES), n), REFERRAL_SOURCES),
+        'learning_motivation': categorical(
+            rng.integers(0, len(LEARNING_MOTIVATIONS), n), LEARNING_MOTIVATIONS),
+        'email_verified': rng.random(n) < 0.9,
+        'duolingo_plus_subscribed': rng.random(n) < 0.2,  # 20% premium
+        'churn_flag': is_churner,
+        'churn_date': churn_dates
+    })
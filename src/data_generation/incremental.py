@@ -0,0 +1,257 @@
+'''Incremental "advance the clock" generation.
+
+A full run saves a small per-user state snapshot next to every batch: the
+streak at the last generated day, last active date, churn status and first
+course. Advancing the clock by N days then only generates the new days of
+daily_activity, sessions and notifications for existing users (continuing
+their streaks and churn), the users who signed up in those days, and the
+churn_labels rows that changed (every user not labelled as churned, whose
+retention grows with the clock). The delta is appended to the sink (churn
+labels are upserted), so each run is small compared to a full regeneration.
+
+Snapshots live in ``<state dir>/<as-of date>/<batch>.npz``; advancing from
+date D reads the snapshots of D and writes those of D + N days. A date is
+only advanced from once the run that produced it marked it complete, so a
+failed advance is simply rerun. Every
+(block, window) draws from its own random stream, so advancing is
+deterministic for a given seed and window.
+'''
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+
+from batch_builder import (BatchBuilder, _blocks, _first_row_of_each_user,
+                           block_rng, generate_block)
+from generators import (DEFAULT_CHURN_RATE, advance_churn, apply_churn_rules,
+                        churn_hazard, generate_daily_activity,
+                        generate_notifications, generate_sessions,
+                        generate_users, last_active_dates)
+from schema import CHURN_REASONS, categorical, typed_frame
+
+STATE_UNIT = 'user_state'  # Manifest unit of a saved snapshot
+ADVANCE_TABLES = ('daily_activity', 'sessions', 'notifications',
+                  'churn_labels')
+ADVANCE_STREAM = 3  # Streams of the days added for existing users
+SIGNUPS_STREAM = 4  # Streams of the users who sign up while advancing
+COMPLETE_MARKER = 'COMPLETE'
+STATE_COLUMNS = ['user_id', 'signup_date', 'duolingo_plus_subscribed',
+                 'churn_flag', 'churn_date', 'churn_reason',
+                 'reactivation_attempts', 'first_course_id', 'streak_days',
+                 'last_active_date']
+
+
+def _last_row_of_each_user(user_ids):
+    return np.r_[np.flatnonzero(user_ids[1:] != user_ids[:-1]),
+                 len(user_ids) - 1] if len(user_ids) else np.array([], int)
+
+
+def _per_user(user_ids, row_users, rows, values, default):
+    '''``values`` of the given rows placed at their users' positions.'''
+    out = np.full(len(user_ids), default, dtype=np.asarray(values).dtype)
+    out[np.searchsorted(user_ids, row_users[rows])] = np.asarray(values)[rows]
+    return out
+
+
+def user_state(users, tables):
+    '''Snapshot of every user in a generated batch (``users`` sorted by id,
+    with their simulated churn) at its last generated day.'''
+    user_ids = users['user_id'].to_numpy(dtype=np.int64)
+    courses = tables['user_courses']
+    course_users = courses['user_id'].to_numpy()
+    activity = tables['daily_activity']
+    activity_users = activity['user_id'].to_numpy()
+    labels = tables['churn_labels']
+    return pd.DataFrame({
+        'user_id': user_ids,
+        'signup_date': users['signup_date'].to_numpy(dtype='datetime64[D]'),
+        'duolingo_plus_subscribed': users[
+            'duolingo_plus_subscribed'].to_numpy(dtype=np.int8),
+        'churn_flag': users['churn_flag'].to_numpy(dtype=np.int8),
+        'churn_date': users['churn_date'].to_numpy(dtype='datetime64[D]'),
+        # Set only for users labelled as churned
+        'churn_reason': labels['churn_reason_category'].cat.codes.to_numpy(
+            dtype=np.int8),
+        'reactivation_attempts': labels['reactivation_attempts'].to_numpy(
+            dtype=np.int16),
+        'first_course_id': _per_user(
+            user_ids, course_users, _first_row_of_each_user(course_users),
+            courses['course_id'].to_numpy(dtype=np.int32), 0),
+        'streak_days': _per_user(
+            user_ids, activity_users, _last_row_of_each_user(activity_users),
+            activity['streak_days'].to_numpy(dtype=np.int32), 0),
+        # Before the churn_labels rules, which are reapplied when advancing
+        'last_active_date': last_active_dates(user_ids, activity)
+    })
+
+
+def advance_block(state, from_date, to_date, rng,
+                  churn_rate=DEFAULT_CHURN_RATE):
+    '''New rows of one block of users from the day after ``from_date`` up to
+    ``to_date``. Returns (tables, new state); churn_labels only holds the
+    users whose label changed.'''
+    user_ids = state['user_id'].to_numpy(dtype=np.int64)
+    signup = state['signup_date'].to_numpy(dtype='datetime64[D]')
+    was_churner = state['churn_flag'].to_numpy(dtype=bool)
+    n = len(user_ids)
+
+    is_churner, churn_dates = advance_churn(
+        signup, was_churner, state['churn_date'], from_date, to_date, rng,
+        churn_hazard(churn_rate), state['last_active_date'])
+    first_day = np.datetime64(from_date, 'D') + np.timedelta64(1, 'D')
+    activity = generate_daily_activity(
+        user_ids, signup, is_churner, state['duolingo_plus_subscribed'],
+        to_date, rng, start_dates=np.full(n, first_day),
+        initial_streak=state['streak_days'], churn_dates=churn_dates)
+    activity_users = activity['user_id'].to_numpy()
+    first_course = state['first_course_id'].to_numpy()[
+        np.searchsorted(user_ids, activity_users)]
+    sessions = generate_sessions(activity, first_course, rng)
+    notifications = generate_notifications(activity, rng)
+
+    last_active = last_active_dates(user_ids, activity)
+    last_active = np.where(np.isnat(last_active), state[
+        'last_active_date'].to_numpy(dtype='datetime64[D]'), last_active)
+    flag, label_dates, label_last_active, retention_days = apply_churn_rules(
+        signup, is_churner, churn_dates, last_active, to_date)
+    was_labelled = state['churn_reason'].to_numpy() >= 0
+    newly_labelled = flag & ~was_labelled
+    reasons = np.where(newly_labelled, rng.integers(0, len(CHURN_REASONS), n),
+                       state['churn_reason'])
+    reasons = np.where(flag, reasons, -1).astype(np.int8)
+    attempts = np.where(newly_labelled, rng.integers(0, 4, n),
+                        state['reactivation_attempts'])
+    attempts = np.where(flag, attempts, 0).astype(np.int16)
+    # A churner's label is final; everyone else's retention grows each day
+    changed = ~(flag & was_labelled)
+
+    labels = typed_frame('churn_labels', {
+        'user_id': user_ids,
+        'churn_flag': flag,
+        'churn_date': label_dates,
+        'last_active_date': label_last_active,
+        'churn_reason_category': categorical(reasons, CHURN_REASONS),
+        'retention_days': retention_days,
+        'reactivation_attempts': attempts
+    })[changed].reset_index(drop=True)
+
+    new_state = state.copy()
+    new_state['churn_flag'] = is_churner.astype(np.int8)
+    new_state['churn_date'] = churn_dates
+    new_state['churn_reason'] = reasons
+    new_state['reactivation_attempts'] = attempts
+    new_state['streak_days'] = _per_user(
+        user_ids, activity_users, _last_row_of_each_user(activity_users),
+        activity['streak_days'].to_numpy(dtype=np.int32), 0)
+    new_state['last_active_date'] = last_active
+    return {'daily_activity': activity, 'sessions': sessions,
+            'notifications': notifications, 'churn_labels': labels}, new_state
+
+
+def _window_key(from_date):
+    return np.datetime64(from_date, 'D').astype(np.int64)
+
+
+def build_advance(state, from_date, to_date, seed, timings=None,
+                  churn_rate=DEFAULT_CHURN_RATE):
+    '''``advance_block`` over every block of a snapshot (sorted by user id);
+    returns (tables, new state). A ``timings`` dict receives the seconds
+    spent, under ``'advance'`` since the tables are generated together.'''
+    builder = BatchBuilder()
+    states = []
+    user_ids = state['user_id'].to_numpy(dtype=np.int64)
+    for lo, hi, block in _blocks(user_ids):
+        rng = block_rng(seed, block, ADVANCE_STREAM, _window_key(from_date))
+        with builder.timing('advance'):
+            tables, block_state = advance_block(
+                state.iloc[lo:hi], from_date, to_date, rng, churn_rate)
+        for table, frame in tables.items():
+            builder.add(table, frame)
+        states.append(block_state)
+    tables = builder.build()
+    if timings is not None:
+        timings.update(builder.seconds)
+    return tables, pd.concat(states, ignore_index=True)
+
+
+def signup_range(num_users, per_day, base_date, from_date, to_date):
+    '''0-based (start, end) user offsets of the users who signed up in the
+    window; counted from ``base_date`` (the date of the full run), so the
+    ids do not depend on how the clock was advanced to ``from_date``.'''
+    def signed_up(date):
+        return int(per_day * (date - base_date).days)
+    return (num_users + signed_up(from_date),
+            num_users + signed_up(to_date))
+
+
+def build_signups(user_ids, from_date, to_date, num_courses, seed,
+                  timings=None, churn_rate=DEFAULT_CHURN_RATE):
+    '''Users (sorted ``user_ids``) who sign up between ``from_date`` and the
+    day before ``to_date``, with all their tables up to ``to_date``.
+    Returns (users, tables, state); a ``timings`` dict receives the seconds
+    spent per table.'''
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    days = (to_date - from_date).days
+    key = _window_key(from_date)
+    builder = BatchBuilder()
+    chunks = []
+    for lo, hi, block in _blocks(user_ids):
+        with builder.timing('users'):
+            users = generate_users(user_ids[lo:hi], to_date,
+                                   block_rng(seed, block, SIGNUPS_STREAM, key),
+                                   days, churn_rate)
+        generate_block(builder, user_ids[lo:hi], users, num_courses,
+                       to_date, block_rng(seed, block, SIGNUPS_STREAM, key, 1))
+        chunks.append(users)
+    users = pd.concat(chunks, ignore_index=True)
+    tables = builder.build()
+    if timings is not None:
+        timings.update(builder.seconds)
+    return users, tables, user_state(users, tables)
+
+
+def state_dir(root, as_of):
+    return os.path.join(root, as_of.isoformat())
+
+
+def save_state(root, as_of, label, state):
+    '''Write a snapshot atomically.'''
+    directory = state_dir(root, as_of)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, label + '.npz')
+    with open(path + '.tmp', 'wb') as f:
+        np.savez(f, **{name: state[name].to_numpy()
+                       for name in STATE_COLUMNS})
+    os.replace(path + '.tmp', path)
+
+
+def iter_state(root, as_of):
+    '''Yield (label, snapshot) of every batch saved as of ``as_of``.'''
+    directory = state_dir(root, as_of)
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.npz'):
+            with np.load(os.path.join(directory, name)) as data:
+                yield name[:-4], pd.DataFrame(
+                    {column: data[column] for column in STATE_COLUMNS})
+
+
+def mark_complete(root, as_of):
+    '''Record that every snapshot (and table) as of ``as_of`` was written.'''
+    directory = state_dir(root, as_of)
+    os.makedirs(directory, exist_ok=True)
+    open(os.path.join(directory, COMPLETE_MARKER), 'w').close()
+
+
+def latest_state_date(root):
+    '''The most recent complete as-of date under ``root``, or None.'''
+    dates = []
+    if os.path.isdir(root):
+        for name in os.listdir(root):
+            try:
+                as_of = datetime.date.fromisoformat(name)
+            except ValueError:
+                continue
+            if os.path.exists(os.path.join(root, name, COMPLETE_MARKER)):
+                dates.append(as_of)
+    return max(dates, default=None)
@@ -0,0 +1,111 @@
+'''Durable checkpoint manifest for long generation runs.
+
+The manifest is an append-only JSON-lines file. Its first line records the run
+configuration; every following line records one committed (table, batch) unit
+with its row count and seed. Because every batch is generated
+deterministically from the seed, a restarted run can skip committed units and
+regenerate only the missing ones.
+
+A unit is recorded right after its write committed, so a crash between the
+two can at worst rewrite that single unit (file sinks simply replace it).
+'''
+import datetime
+import json
+import os
+import threading
+
+
+class ManifestMismatch(ValueError):
+    '''Raised when resuming with a configuration different from the run that
+    created the manifest.'''
+
+
+def _entries(path, content):
+    '''Parsed lines of a manifest; raises if the first is not a config.'''
+    entries = []
+    for line in content.decode('utf-8').splitlines():
+        try:
+            entries.append(json.loads(line))
+        except ValueError:
+            continue
+    if not entries or 'config' not in entries[0]:
+        raise ManifestMismatch(f'{path} is not a run manifest')
+    return entries
+
+
+def read_manifest(path):
+    '''(config, unit entries) of the manifest at ``path``, without touching
+    the file; a torn last line is ignored.'''
+    with open(path, 'rb') as f:
+        content = f.read()
+    entries = _entries(path, content[:content.rfind(b'\n') + 1])
+    return entries[0]['config'], entries[1:]
+
+
+class RunManifest:
+    '''Record of the (table, batch) units a run has committed.'''
+
+    def __init__(self, path, config):
+        self.path = path
+        self.config = {key: str(value) for key, value in config.items()}
+        self._lock = threading.Lock()
+        self._done = {}
+        if os.path.exists(path):
+            self._load()
+        else:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._append({'config': self.config})
+
+    def _load(self):
+        with open(self.path, 'rb+') as f:
+            content = f.read()
+            if content and not content.endswith(b'\n'):
+                # A crash left a torn last line: drop it (that unit is redone)
+                content = content[:content.rfind(b'\n') + 1]
+                f.truncate(len(content))
+        entries = _entries(self.path, content)
+        if entries[0]['config'] != self.config:
+            raise ManifestMismatch(
+                f'{self.path} was written by a run with config '
+                f'{entries[0]["config"]}, not {self.config}')
+        for entry in entries[1:]:
+            self._done[(entry['table'], entry['batch'])] = entry
+
+    def _append(self, entry):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def is_done(self, table, batch):
+        with self._lock:
+            return (table, batch) in self._done
+
+    def pending(self, tables, batch):
+        '''The subset of ``tables`` not yet committed for ``batch``.'''
+        return [table for table in tables if not self.is_done(table, batch)]
+
+    def record(self, table, batch, rows, seed, **extra):
+        '''Durably mark (table, batch) as committed.'''
+        entry = dict(table=table, batch=batch, rows=int(rows), seed=seed,
+                     committed_at=datetime.datetime.now().isoformat(),
+                     **extra)
+        with self._lock:
+            self._append(entry)
+            self._done[(table, batch)] = entry
+
+    def rows(self, table):
+        '''Total committed rows of ``table``.'''
+        with self._lock:
+            return sum(entry['rows'] for (name, _), entry
+                       in self._done.items() if name == table)
+
+    def batch_ranges(self):
+        '''{batch: (first_user_id, last_user_id)} of every batch with at
+        least one committed table.'''
+        with self._lock:
+            return {batch: (entry['first_user_id'], entry['last_user_id'])
+                    for (_, batch), entry in self._done.items()
+                    if 'first_user_id' in entry}
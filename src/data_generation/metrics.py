@@ -0,0 +1,155 @@
+'''Per-stage timing and throughput metrics of a generation run.
+
+Every unit of work is recorded as one (stage, table, batch) sample:
+
+* ``generate`` - building the table in memory (worker process)
+* ``backpressure`` - time generation was blocked waiting for the writers
+* ``serialize`` - converting a frame to the sink's wire format
+* ``insert`` - sending it to the database / file, minus serialization
+* ``profile`` - profiling and checking it before it is written
+
+Samples are appended to a JSON-lines file as they happen, aggregated per
+(stage, table) into a Prometheus text-format file, and summarized as a table
+at the end of the run. If ``insert`` dominates, the database is the
+bottleneck; if ``generate`` does (and ``backpressure`` is near zero), it is
+the CPU.
+'''
+import json
+import os
+import threading
+import time
+
+PROMETHEUS_PREFIX = 'synthetic_data'
+# (metric, total field, type, help) of the Prometheus export
+PROMETHEUS_METRICS = [
+    ('stage_seconds_total', 'seconds', 'counter',
+     'Wall time spent in the stage'),
+    ('stage_rows_total', 'rows', 'counter', 'Rows processed by the stage'),
+    ('stage_bytes_total', 'bytes', 'counter',
+     'In-memory bytes processed by the stage'),
+    ('stage_batches_total', 'batches', 'counter', 'Samples recorded'),
+    ('stage_peak_rss_bytes', 'peak_rss', 'gauge',
+     'Highest RSS of the process running the stage')
+]
+
+
+def _throughput(rows, seconds):
+    return rows / seconds if seconds > 0 else 0.0
+
+
+class RunMetrics:
+    '''Thread-safe collector of stage samples.
+
+    ``jsonl_path`` receives every sample, ``prometheus_path`` the running
+    totals each time ``write_prometheus`` is called; either may be None.'''
+
+    def __init__(self, jsonl_path=None, prometheus_path=None):
+        self.prometheus_path = prometheus_path
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._totals = {}
+        self._file = None
+        if jsonl_path:
+            directory = os.path.dirname(jsonl_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(jsonl_path, 'a', encoding='utf-8')
+
+    def record(self, stage, table, batch, seconds, rows=0, nbytes=0,
+               peak_rss=None):
+        '''Add one sample; ``batch`` labels the unit of work.'''
+        entry = {'ts': round(time.time(), 3), 'stage': stage, 'table': table,
+                 'batch': batch, 'seconds': round(seconds, 6),
+                 'rows': int(rows), 'bytes': int(nbytes),
+                 'rows_per_s': round(_throughput(rows, seconds), 1),
+                 'peak_rss': peak_rss}
+        with self._lock:
+            total = self._totals.setdefault((stage, table), {
+                'batches': 0, 'seconds': 0.0, 'rows': 0, 'bytes': 0,
+                'peak_rss': 0})
+            total['batches'] += 1
+            total['seconds'] += seconds
+            total['rows'] += int(rows)
+            total['bytes'] += int(nbytes)
+            if peak_rss:
+                total['peak_rss'] = max(total['peak_rss'], peak_rss)
+            if self._file is not None:
+                self._file.write(json.dumps(entry) + '\n')
+                self._file.flush()
+
+    def record_write(self, table, batch, rows, nbytes, stats, peak_rss=None):
+        '''Split the ``stats`` a ``Sink.write`` call filled into its
+        ``serialize`` and ``insert`` samples.'''
+        if not stats:
+            return
+        serialize = stats.get('serialize_seconds', 0.0)
+        self.record('serialize', table, batch, serialize, rows, nbytes)
+        self.record('insert', table, batch,
+                    max(0.0, stats['seconds'] - serialize), rows,
+                    stats.get('bytes_written', nbytes), peak_rss)
+
+    def totals(self):
+        '''{(stage, table): totals} accumulated so far.'''
+        with self._lock:
+            return {key: dict(total) for key, total in self._totals.items()}
+
+    def prometheus_text(self):
+        totals = sorted(self.totals().items())
+        lines = []
+        for name, field, kind, description in PROMETHEUS_METRICS:
+            metric = f'{PROMETHEUS_PREFIX}_{name}'
+            lines.append(f'# HELP {metric} {description}.')
+            lines.append(f'# TYPE {metric} {kind}')
+            for (stage, table), total in totals:
+                lines.append(f'{metric}{{stage="{stage}",table="{table}"}} '
+                             f'{total[field]!r}')
+        metric = f'{PROMETHEUS_PREFIX}_run_elapsed_seconds'
+        lines.append(f'# HELP {metric} Seconds since the run started.')
+        lines.append(f'# TYPE {metric} gauge')
+        lines.append(f'{metric} {time.time() - self.started:.3f}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self):
+        '''Replace the Prometheus file with the current totals (atomically,
+        so a textfile collector never reads a partial file).'''
+        if not self.prometheus_path:
+            return
+        directory = os.path.dirname(self.prometheus_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.prometheus_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, self.prometheus_path)
+
+    def summary(self):
+        '''Fixed-width table of the totals per stage and table.'''
+        header = ('stage', 'table', 'batches', 'rows', 'seconds', 'rows/s',
+                  'MB', 'peak RSS MB')
+        rows = [header]
+        for (stage, table), total in sorted(self.totals().items()):
+            rows.append((
+                stage, table, str(total['batches']), str(total['rows']),
+                f'{total["seconds"]:.2f}',
+                f'{_throughput(total["rows"], total["seconds"]):.0f}',
+                f'{total["bytes"] / 1024 ** 2:.1f}',
+                f'{total["peak_rss"] / 1024 ** 2:.0f}'
+                if total['peak_rss'] else '-'))
+        widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+        return '\n'.join(
+            '  '.join(cell.ljust(width) if i < 2 else cell.rjust(width)
+                      for i, (cell, width) in enumerate(zip(row, widths)))
+            for row in rows)
+
+    def close(self):
+        self.write_prometheus()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,121 @@
+'''Producer/consumer pipeline that overlaps database writes with generation.
+
+The generator thread submits finished tables; writer threads drain them into a
+sink. Each table is pinned to one writer so its rows are inserted in
+submission order, while different tables are written concurrently. The
+amount of data waiting to be written is capped in bytes: ``submit`` blocks
+once the cap is reached, so generation never runs far ahead of the database.
+'''
+import queue
+import threading
+import time
+
+from batch_sizing import current_rss
+
+DEFAULT_MAX_PENDING_BYTES = 2 * 1024 ** 3
+
+
+def frame_nbytes(frame):
+    '''In-memory size of a DataFrame, including string payloads.'''
+    return int(frame.memory_usage(index=False, deep=True).sum())
+
+
+class WritePipeline:
+    '''Bounded, memory-capped queue of (table, frame) writes to ``sink``.
+
+    ``on_done(rows, error)`` callbacks passed to ``submit`` run on the writer
+    thread once the write finished; ``error`` is the exception raised by the
+    sink, if any. With ``metrics`` (a ``RunMetrics``), the time ``submit``
+    blocked and the serialize/insert time of every write are recorded.'''
+
+    def __init__(self, sink, writers=1,
+                 max_pending_bytes=DEFAULT_MAX_PENDING_BYTES, queue_size=8,
+                 metrics=None):
+        self.sink = sink
+        self.metrics = metrics
+        self.max_pending_bytes = max_pending_bytes
+        self._pending_bytes = 0
+        self._space = threading.Condition()
+        self._queues = [queue.Queue(maxsize=queue_size)
+                        for _ in range(max(1, writers))]
+        self._routes = {}
+        self._callback_errors = []
+        self._threads = [
+            threading.Thread(target=self._drain, args=(q,),
+                             name=f'sink-writer-{i}', daemon=True)
+            for i, q in enumerate(self._queues)]
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def pending_bytes(self):
+        with self._space:
+            return self._pending_bytes
+
+    def submit(self, table, frame, on_done=None, partition=None, key=None):
+        '''Queue ``frame`` for writing to ``table`` (see ``Sink.write`` for
+        ``partition``; with a ``key`` column the rows are upserted instead);
+        blocks while the pipeline holds ``max_pending_bytes`` or more (a
+        single oversized frame is still admitted when nothing else is
+        pending).'''
+        size = frame_nbytes(frame)
+        started = time.perf_counter()
+        with self._space:
+            while (self._pending_bytes
+                   and self._pending_bytes + size > self.max_pending_bytes):
+                self._space.wait()
+            self._pending_bytes += size
+        if self.metrics is not None:
+            self.metrics.record('backpressure', table, partition,
+                                time.perf_counter() - started)
+        if table not in self._routes:
+            self._routes[table] = self._queues[
+                len(self._routes) % len(self._queues)]
+        self._routes[table].put(
+            (table, frame, partition, key, size, on_done))
+
+    def _drain(self, tasks):
+        while True:
+            item = tasks.get()
+            if item is None:
+                return
+            table, frame, partition, key, size, on_done = item
+            item = None
+            rows, error, stats = 0, None, {}
+            try:
+                if key is None:
+                    rows = self.sink.write(table, frame, partition,
+                                           stats=stats)
+                else:
+                    rows = self.sink.upsert(table, frame, key, partition,
+                                            stats=stats)
+            except Exception as exc:
+                error = exc
+            finally:
+                frame = None
+                with self._space:
+                    self._pending_bytes -= size
+                    self._space.notify_all()
+            if self.metrics is not None and error is None:
+                self.metrics.record_write(table, partition, rows, size, stats,
+                                          peak_rss=current_rss())
+            if on_done is not None:
+                try:
+                    on_done(rows, error)
+                except Exception as exc:
+                    self._callback_errors.append(exc)
+
+    def close(self):
+        '''Wait for every queued write to finish and stop the writers.'''
+        for tasks in self._queues:
+            tasks.put(None)
+        for thread in self._threads:
+            thread.join()
+        if self._callback_errors:
+            raise self._callback_errors[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,479 @@
+'''Streaming data-quality profile of a generation run.
+
+``DataProfiler.observe`` folds every generated frame into per-table,
+per-column running statistics whose memory does not grow with the rows:
+
+* row and null counts, mean and variance (merged batch by batch), min, max;
+* quantiles from a log-bucketed sketch with 1% relative error (dates are
+  binned by day instead);
+* approximate distinct counts (HyperLogLog, 4096 registers, ~1.6% error);
+* frequencies of categorical values (the first ``MAX_CATEGORIES`` values).
+
+Before a frame is folded in it is checked against the expectations, e.g. a
+churn rate close to the simulated one, no negative ``time_spent_minutes`` and
+no session ending before it starts (``default_expectations()``). The generator
+runs the checks on every batch before it is written, so a bad run is stopped
+within its first batch rather than found after the load. Expectations can be
+given as a JSON list instead:
+
+    [{"check": "mean_between", "table": "churn_labels",
+      "column": "churn_flag", "min": 0.2, "max": 0.3, "min_rows": 1000},
+     {"check": "range", "table": "daily_activity",
+      "column": "time_spent_minutes", "min": 0},
+     {"check": "at_least", "table": "sessions", "column": "session_end",
+      "other": "session_start"},
+     {"check": "null_rate", "table": "users", "column": "country",
+      "max": 0}]
+
+``mean_between`` also takes ``"by": "<column>"`` to check every group, e.g.
+the open rate of every notification channel.
+'''
+import json
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+from generators import DEFAULT_CHURN_RATE
+
+MAX_CATEGORIES = 1000
+OTHER = '__other__'  # Values after the first MAX_CATEGORIES
+QUANTILES = (0.01, 0.25, 0.5, 0.75, 0.99)
+TOP_VALUES = 20  # Categorical frequencies in the report
+# Allowed distance of the churn rate of a run from the one it simulates
+CHURN_TOLERANCE = 0.05
+
+
+def _kind(dtype):
+    if isinstance(dtype, pd.CategoricalDtype):
+        return 'categorical'
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return 'datetime'
+    if pd.api.types.is_bool_dtype(dtype) or \
+            pd.api.types.is_integer_dtype(dtype):
+        return 'integer'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'float'
+    return 'string'
+
+
+def _values(column, present):
+    '''float64 values of the non-null rows; dates are days since the
+    epoch.'''
+    if pd.api.types.is_datetime64_any_dtype(column.dtype):
+        values = column.to_numpy(dtype='datetime64[s]')[present]
+        return values.astype(np.int64) / 86400.0
+    return column.to_numpy(dtype=np.float64, na_value=np.nan)[present]
+
+
+def _date(days):
+    return str(np.datetime64(int(round(days * 86400)), 's'))
+
+
+def _add_counts(counts, keys):
+    '''Add the occurrences of every integer in ``keys`` to ``counts``.'''
+    low = int(keys.min())
+    if int(keys.max()) - low < 1 << 20:
+        bins = np.bincount(keys - low)
+        present = np.flatnonzero(bins)
+        pairs = zip((present + low).tolist(), bins[present].tolist())
+    else:
+        pairs = zip(*(array.tolist() for array in np.unique(
+            keys, return_counts=True)))
+    for key, count in pairs:
+        counts[key] = counts.get(key, 0) + count
+
+
+class QuantileSketch:
+    '''Counts of every value (integers, or days for dates) while there are
+    at most ``max_exact`` of them, then of logarithmic buckets
+    ``relative_accuracy`` apart; the number of buckets depends on the value
+    range only.'''
+
+    def __init__(self, exact=True, relative_accuracy=0.01, max_exact=65536):
+        self.exact = exact
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.max_exact = max_exact
+        self.counts = {}
+
+    def _log_keys(self, values):
+        magnitude = np.abs(values)
+        keys = np.zeros(len(values), dtype=np.int64)
+        positive = magnitude > 1e-9  # Smaller values count as zero
+        keys[positive] = np.ceil(np.log(magnitude[positive])
+                                 / math.log(self.gamma)).astype(np.int64)
+        # Keys of negative values are offset so they never meet positive ones
+        keys[positive] += np.where(values[positive] < 0, -1, 1) << 32
+        return keys
+
+    def _value(self, key):
+        if self.exact:
+            return float(key)
+        if key == 0:
+            return 0.0
+        sign = 1 if key > 0 else -1
+        exponent = key - (sign << 32)
+        return sign * 2 * self.gamma ** exponent / (self.gamma + 1)
+
+    def add(self, values):
+        if not len(values):
+            return
+        _add_counts(self.counts, np.floor(values).astype(np.int64)
+                    if self.exact else self._log_keys(values))
+        if self.exact and len(self.counts) > self.max_exact:
+            exact, self.counts, self.exact = self.counts, {}, False
+            keys = self._log_keys(np.array(list(exact), dtype=np.float64))
+            for key, count in zip(keys.tolist(), exact.values()):
+                self.counts[key] = self.counts.get(key, 0) + count
+
+    def quantiles(self, qs):
+        if not self.counts:
+            return [None] * len(qs)
+        values = sorted((self._value(key), count)
+                        for key, count in self.counts.items())
+        cumulative = np.cumsum([count for _, count in values])
+        ranks = np.searchsorted(cumulative,
+                                np.asarray(qs) * (cumulative[-1] - 1),
+                                side='right')
+        return [values[rank][0] for rank in ranks]
+
+
+class DistinctCounter:
+    '''HyperLogLog estimate of the number of distinct values.'''
+
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add(self, hashes):
+        p = self.precision
+        index = (hashes >> np.uint64(64 - p)).astype(np.intp)
+        rest = hashes << np.uint64(p)
+        # Leading zeros of the remaining bits, plus one
+        rank = np.full(len(rest), 64 - p + 1, dtype=np.float64)
+        nonzero = rest != 0
+        rank[nonzero] = 64 - np.floor(np.log2(rest[nonzero].astype(
+            np.float64)))
+        np.maximum.at(self.registers, index,
+                      np.clip(rank, 1, 64 - p + 1).astype(np.uint8))
+
+    def estimate(self):
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(
+            np.exp2(-self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # Small range correction
+        return int(round(estimate))
+
+
+class ColumnProfile:
+    '''Running statistics of one column. Distinct values are counted
+    exactly while the column's sketch or frequencies hold every value, then
+    with a ``DistinctCounter``.'''
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.count = self.nulls = 0
+        self.mean = self.m2 = 0.0
+        self.min = self.max = None
+        self.sketch = None if kind in ('categorical', 'string') else \
+            QuantileSketch(exact=kind in ('integer', 'datetime'))
+        self.distinct = None
+        self.frequencies = {}
+
+    def _count_distinct(self, column, present):
+        if self.distinct is None:
+            self.distinct = DistinctCounter()
+        if self.kind == 'datetime':
+            values = column.to_numpy(dtype='datetime64[us]')[present]
+        else:
+            values = column.to_numpy()[present]
+        self.distinct.add(pd.util.hash_array(values))
+
+    def _add_frequencies(self, column, present):
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            codes = column.cat.codes.to_numpy()
+            bins = np.bincount(codes[present],
+                               minlength=len(column.cat.categories))
+            counts = zip(column.cat.categories, bins.tolist())
+        else:
+            counts = column.value_counts().items()
+        for value, count in counts:
+            if not count:
+                continue  # Unused categories
+            key = value if value in self.frequencies or len(
+                self.frequencies) < MAX_CATEGORIES else OTHER
+            self.frequencies[key] = self.frequencies.get(key, 0) + count
+
+    def add(self, column):
+        present = column.notna().to_numpy()
+        n = int(present.sum())
+        self.nulls += len(column) - n
+        if not n:
+            return
+        if self.sketch is None:
+            self.count += n
+            self._add_frequencies(column, present)
+            if self.kind == 'string':
+                self._count_distinct(column, present)
+            return
+        values = _values(column, present)
+        # Merge the batch's moments into the running ones
+        mean = values.mean()
+        total = self.count + n
+        delta = mean - self.mean
+        self.m2 += ((values - mean) ** 2).sum() + \
+            delta * delta * self.count * n / total
+        self.mean += delta * n / total
+        self.count = total
+        low, high = values.min(), values.max()
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+        exact = self.sketch.counts if self.sketch.exact else None
+        self.sketch.add(values)
+        if self.kind != 'integer':
+            self._count_distinct(column, present)
+        elif exact is not None and not self.sketch.exact:
+            # The sketch stopped counting every value; it held all of them
+            # (this batch included) until now
+            self.distinct = DistinctCounter()
+            self.distinct.add(pd.util.hash_array(
+                np.fromiter(exact, dtype=np.int64, count=len(exact))))
+        elif not self.sketch.exact:
+            self._count_distinct(column, present)
+
+    def distinct_count(self):
+        if self.distinct is not None:
+            return self.distinct.estimate()
+        if self.sketch is not None:
+            return len(self.sketch.counts)
+        return len(self.frequencies)
+
+    def report(self):
+        rows = self.count + self.nulls
+        report = {'count': self.count, 'nulls': self.nulls,
+                  'null_rate': self.nulls / rows if rows else 0.0,
+                  'distinct': self.distinct_count()}
+        if self.sketch is None:
+            top = sorted(self.frequencies.items(), key=lambda item: -item[1])
+            report['frequencies'] = {str(value): count / self.count
+                                     for value, count in top[:TOP_VALUES]}
+            return report
+        if not self.count:
+            return report
+        std = math.sqrt(self.m2 / self.count)
+        quantiles = self.sketch.quantiles(QUANTILES)
+        if self.kind == 'datetime':
+            report.update(mean=_date(self.mean), std_days=std,
+                          min=_date(self.min), max=_date(self.max),
+                          quantiles={str(q): _date(value) for q, value
+                                     in zip(QUANTILES, quantiles)})
+        else:
+            report.update(mean=self.mean, std=std, min=float(self.min),
+                          max=float(self.max),
+                          quantiles={str(q): value for q, value
+                                     in zip(QUANTILES, quantiles)})
+        return report
+
+
+class Expectation:
+    '''A check of the rows of ``table``; ``check`` returns the violations
+    of one frame (and may keep running state).'''
+
+    def __init__(self, table):
+        self.table = table
+
+    def check(self, frame):
+        raise NotImplementedError
+
+
+def _bound(column, value):
+    if value is None:
+        return None
+    if pd.api.types.is_datetime64_any_dtype(column.dtype):
+        return pd.Timestamp(value)
+    return value
+
+
+class InRange(Expectation):
+    '''Every non-null value of ``column`` is within [min, max].'''
+
+    def __init__(self, table, column, min=None, max=None):
+        super().__init__(table)
+        self.column, self.min, self.max = column, min, max
+
+    def check(self, frame):
+        if self.column not in frame:
+            return []
+        column = frame[self.column]
+        low, high = _bound(column, self.min), _bound(column, self.max)
+        bad = pd.Series(False, index=frame.index)
+        if low is not None:
+            bad |= (column < low).fillna(False)
+        if high is not None:
+            bad |= (column > high).fillna(False)
+        count = int(bad.sum())
+        if not count:
+            return []
+        return [f'{self.table}.{self.column}: {count} value(s) outside '
+                f'[{self.min}, {self.max}], e.g. {column[bad].iloc[0]}']
+
+
+class AtLeast(Expectation):
+    '''``column`` >= ``other`` wherever both are set.'''
+
+    def __init__(self, table, column, other):
+        super().__init__(table)
+        self.column, self.other = column, other
+
+    def check(self, frame):
+        if self.column not in frame or self.other not in frame:
+            return []
+        bad = (frame[self.column] < frame[self.other]).fillna(False)
+        count = int(bad.sum())
+        if not count:
+            return []
+        return [f'{self.table}: {count} row(s) with {self.column} < '
+                f'{self.other}']
+
+
+class MeanBetween(Expectation):
+    '''The running mean of ``column`` (overall, or of every ``by`` group) is
+    within [min, max] once ``min_rows`` rows have been seen.'''
+
+    def __init__(self, table, column, min=None, max=None, by=None,
+                 min_rows=1000):
+        super().__init__(table)
+        self.column, self.min, self.max = column, min, max
+        self.by, self.min_rows = by, min_rows
+        self.sums = {}  # group -> [rows, sum]
+
+    def check(self, frame):
+        if self.column not in frame or (self.by and self.by not in frame):
+            return []
+        values = frame[self.column].astype(np.float64)
+        groups = values.groupby(frame[self.by], observed=True) \
+            if self.by else values.groupby(np.zeros(len(values)))
+        for group, total in groups.agg(['count', 'sum']).iterrows():
+            running = self.sums.setdefault(group, [0, 0.0])
+            running[0] += int(total['count'])
+            running[1] += float(total['sum'])
+        problems = []
+        for group, (rows, total) in sorted(self.sums.items(),
+                                           key=lambda item: str(item[0])):
+            if rows < self.min_rows:
+                continue
+            mean = total / rows
+            if (self.min is not None and mean < self.min) or \
+                    (self.max is not None and mean > self.max):
+                where = f' ({self.by}={group})' if self.by else ''
+                problems.append(
+                    f'{self.table}.{self.column}{where}: mean {mean:.4f} of '
+                    f'{rows} rows outside [{self.min}, {self.max}]')
+        return problems
+
+
+class NullRate(Expectation):
+    '''At most ``max`` of the values of ``column`` are null.'''
+
+    def __init__(self, table, column, max=0.0):
+        super().__init__(table)
+        self.column, self.max = column, max
+
+    def check(self, frame):
+        if self.column not in frame or not len(frame):
+            return []
+        rate = float(frame[self.column].isna().mean())
+        if rate <= self.max:
+            return []
+        return [f'{self.table}.{self.column}: null rate {rate:.4f} > '
+                f'{self.max}']
+
+
+CHECKS = {'range': InRange, 'at_least': AtLeast, 'mean_between': MeanBetween,
+          'null_rate': NullRate}
+
+
+def default_expectations(churn_rate=DEFAULT_CHURN_RATE):
+    '''The rules of the warehouse schema, with the churn rate within
+    ``CHURN_TOLERANCE`` of the simulated ``churn_rate`` (the charter's
+    20-30% by default).'''
+    return [
+        MeanBetween('churn_labels', 'churn_flag',
+                    max(churn_rate - CHURN_TOLERANCE, 0),
+                    min(churn_rate + CHURN_TOLERANCE, 1)),
+        AtLeast('churn_labels', 'churn_date', 'last_active_date'),
+        InRange('churn_labels', 'retention_days', min=0),
+        InRange('users', 'age', 13, 120),
+        NullRate('users', 'country'),
+        InRange('daily_activity', 'time_spent_minutes', min=0),
+        InRange('daily_activity', 'lessons_completed', min=0),
+        InRange('daily_activity', 'xp_gained', min=0),
+        AtLeast('sessions', 'session_end', 'session_start'),
+        InRange('sessions', 'accuracy_percentage', 0, 100),
+        AtLeast('notifications', 'opened', 'clicked'),
+        MeanBetween('notifications', 'opened', 0.4, 0.8, by='channel'),
+    ]
+
+
+def load_expectations(path):
+    '''Expectations from a JSON list of {"check": ..., "table": ..., ...}.'''
+    with open(path, encoding='utf-8') as f:
+        specs = json.load(f)
+    expectations = []
+    for spec in specs:
+        spec = dict(spec)
+        check = spec.pop('check')
+        if check not in CHECKS:
+            raise ValueError(f'Unknown check {check!r}; expected one of '
+                             f'{", ".join(CHECKS)}')
+        expectations.append(CHECKS[check](**spec))
+    return expectations
+
+
+class DataProfiler:
+    '''Running profile of every table written in a run, checked against
+    ``expectations`` (``default_expectations(churn_rate)`` if None).'''
+
+    def __init__(self, expectations=None, churn_rate=DEFAULT_CHURN_RATE):
+        self.expectations = default_expectations(churn_rate) \
+            if expectations is None else list(expectations)
+        self.tables = {}  # table -> (rows, {column: ColumnProfile})
+        self.violations = []
+
+    def observe(self, table, frame):
+        '''Check ``frame`` and add it to the profile of ``table``; returns the
+        violations it caused (also collected in ``violations``).'''
+        problems = []
+        for expectation in self.expectations:
+            if expectation.table == table:
+                problems.extend(expectation.check(frame))
+        rows, columns = self.tables.get(table, (0, {}))
+        for name in frame.columns:
+            column = frame[name]
+            if name not in columns:
+                columns[name] = ColumnProfile(_kind(column.dtype))
+            columns[name].add(column)
+        self.tables[table] = (rows + len(frame), columns)
+        self.violations.extend(problems)
+        return problems
+
+    def report(self):
+        return {'tables': {
+                    table: {'rows': rows,
+                            'columns': {name: column.report()
+                                        for name, column in columns.items()}}
+                    for table, (rows, columns) in sorted(self.tables.items())},
+                'violations': list(self.violations)}
+
+    def write(self, path):
+        '''Replace ``path`` with the JSON report (atomically).'''
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=1, default=str)
+        os.replace(tmp_path, path)
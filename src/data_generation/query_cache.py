@@ -0,0 +1,286 @@
+'''Cached read layer for analytics queries.
+
+Notebook cells and API handlers re-run the same heavy queries (e.g. users
+JOIN churn_labels) on a fresh connection each time and materialize the whole
+result through ``pd.read_sql``. ``QueryCache`` keeps one connection and
+caches every result on disk, keyed by the normalized query text (comments
+dropped, whitespace collapsed and case folded outside string literals):
+
+* a miss streams the result chunk by chunk into uncompressed Arrow IPC files
+  (one per chunk), so filling the cache never holds the whole result in
+  memory twice;
+* a hit memory-maps those files: the pages come from the OS page cache and
+  the Arrow buffers are not copied;
+* an entry is only invalidated when ``last_load_ts`` in
+  ``analytics_wh.etl_metadata`` moves forward for one of the tables the query
+  reads (matched on ``table_name`` or the end of ``job_name``, e.g.
+  ``load_fact_daily_activity``). Queries on tables without metadata rows use
+  the latest load of any table. Without the metadata table entries stay
+  valid until read with ``refresh=True`` or ``invalidate``d.
+
+Every fill writes a new version directory of the entry and then points the
+entry's ``current`` file at it with an atomic ``os.replace``, so concurrent
+readers see the old or the new version, never a partial one. A superseded
+version is removed ``STALE_SECONDS`` after it was replaced, by a later fill,
+which leaves readers still mapping it time to finish.
+
+    cache = QueryCache('mssql+pyodbc://...', 'logs/query_cache')
+    churn_demo = cache.read(\'\'\'SELECT u.gender, u.country, c.churn_flag
+                              FROM users u JOIN churn_labels c
+                              ON u.user_id = c.user_id\'\'\')
+'''
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import time
+import uuid
+
+import pandas as pd
+
+from sinks import DEFAULT_CHUNKSIZE, connect
+
+METADATA_TABLE = 'analytics_wh.etl_metadata'
+META_FILE = 'meta.json'
+POINTER_FILE = 'current'
+# Superseded versions are kept this long for the readers still using them
+STALE_SECONDS = 300
+# String literals are kept verbatim; comments are dropped
+_TOKENS = re.compile(r"('(?:[^']|'')*')|(--[^\n]*|/\*.*?\*/)", re.DOTALL)
+_TABLES = re.compile(r'\b(?:from|join)\s+([\w.\[\]"]+)')
+
+
+def normalize_query(query):
+    '''Query text with comments removed, whitespace collapsed and everything
+    outside string literals lowercased.'''
+    parts, position = [], 0
+    for match in _TOKENS.finditer(query):
+        parts.append(query[position:match.start()].lower())
+        parts.append(match.group(1) or ' ')
+        position = match.end()
+    parts.append(query[position:].lower())
+    text = ''.join(parts)
+    # Collapse whitespace outside the literals (even pieces of the split)
+    pieces = re.split(r"('(?:[^']|'')*')", text)
+    pieces[::2] = [re.sub(r'\s+', ' ', piece) for piece in pieces[::2]]
+    return ''.join(pieces).strip().rstrip(';').strip()
+
+
+def query_key(query):
+    return hashlib.sha256(normalize_query(query).encode()).hexdigest()[:32]
+
+
+def referenced_tables(query):
+    '''Names (without schema or quoting) of the tables a query reads.'''
+    return sorted({re.sub(r'[\[\]"]', '', name).split('.')[-1]
+                   for name in _TABLES.findall(normalize_query(query))})
+
+
+class QueryCache:
+    '''Disk cache of query results over one connection to ``url``.'''
+
+    def __init__(self, url, cache_dir, chunksize=DEFAULT_CHUNKSIZE,
+                 metadata_table=METADATA_TABLE):
+        self.url = url
+        self.cache_dir = cache_dir
+        self.chunksize = chunksize
+        self.metadata_table = metadata_table
+        os.makedirs(cache_dir, exist_ok=True)
+        self._stack = contextlib.ExitStack()
+        self.connection = self._stack.enter_context(connect(url))
+
+    def close(self):
+        self._stack.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def watermark(self, tables):
+        '''Latest ``last_load_ts`` of the given tables (ISO text), or None
+        without load metadata.'''
+        if not self._has_metadata():
+            # No metadata table (e.g. a local SQLite copy): never stale
+            return None
+        # Any other failure must not be mistaken for "never stale"
+        loads = pd.read_sql(
+            f'SELECT job_name, table_name, last_load_ts '
+            f'FROM {self.metadata_table}', self.connection)
+        loads = loads[loads['last_load_ts'].notna()]
+        if loads.empty:
+            return None
+        matches = loads['table_name'].isin(tables) | loads['job_name'].map(
+            lambda job: any(job.endswith(table) for table in tables))
+        if matches.any():
+            loads = loads[matches]
+        return pd.to_datetime(loads['last_load_ts']).max().isoformat()
+
+    def _has_metadata(self):
+        '''Whether the metadata table exists.'''
+        schema, _, name = self.metadata_table.rpartition('.')
+        if isinstance(self.connection, sqlite3.Connection):
+            if schema and not self.connection.execute(
+                    'SELECT 1 FROM pragma_database_list WHERE name = ?',
+                    (schema,)).fetchone():
+                return False
+            master = f'{schema}.sqlite_master' if schema else 'sqlite_master'
+            return self.connection.execute(
+                f"SELECT 1 FROM {master} WHERE type IN ('table', 'view') "
+                f"AND name = ?", (name,)).fetchone() is not None
+        from sqlalchemy import inspect
+        return inspect(self.connection).has_table(name, schema=schema or None)
+
+    def _entry(self, query):
+        return os.path.join(self.cache_dir, query_key(query))
+
+    def _meta(self, entry):
+        '''Metadata of the current version of ``entry``, with the ``path``
+        of its directory; None if there is none.'''
+        try:
+            with open(os.path.join(entry, POINTER_FILE)) as f:
+                path = os.path.join(entry, f.read().strip())
+            with open(os.path.join(path, META_FILE)) as f:
+                return dict(json.load(f), path=path)
+        except FileNotFoundError:
+            return None
+
+    def _fill(self, query, entry, watermark):
+        '''Run ``query`` into a new version of ``entry``, make it current
+        and return its metadata.'''
+        import pyarrow as pa
+        version = uuid.uuid4().hex
+        path = os.path.join(entry, version)
+        tmp = path + '.tmp'
+        os.makedirs(tmp)
+        rows = parts = 0
+        try:
+            for chunk in pd.read_sql(query, self.connection,
+                                     chunksize=self.chunksize):
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                part = os.path.join(tmp, f'part-{parts:05d}.arrow')
+                with pa.OSFile(part, 'wb') as sink, \
+                        pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+                rows += len(chunk)
+                parts += 1
+            meta = {'query': normalize_query(query),
+                    'tables': referenced_tables(query),
+                    'watermark': watermark, 'rows': rows, 'parts': parts,
+                    'created': time.time()}
+            with open(os.path.join(tmp, META_FILE), 'w') as f:
+                json.dump(meta, f)
+            os.rename(tmp, path)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        previous = self._meta(entry)
+        pointer = os.path.join(entry, f'{POINTER_FILE}.{version}.tmp')
+        with open(pointer, 'w') as f:
+            f.write(version)
+        # Concurrent fills each switch to a complete version; the last wins
+        os.replace(pointer, os.path.join(entry, POINTER_FILE))
+        if previous is not None:
+            # Start the grace period of the superseded version now
+            with contextlib.suppress(FileNotFoundError):
+                os.utime(previous['path'])
+        self._prune(entry, version)
+        return dict(meta, path=path)
+
+    def _prune(self, entry, version):
+        '''Remove what was superseded (or left by a failed fill) in ``entry``
+        more than ``STALE_SECONDS`` ago; ``version`` and the current version
+        are kept.'''
+        current = self._meta(entry)
+        keep = {POINTER_FILE, version}
+        if current is not None:
+            keep.add(os.path.basename(current['path']))
+        cutoff = time.time() - STALE_SECONDS
+        for name in os.listdir(entry):
+            path = os.path.join(entry, name)
+            try:
+                if name in keep or os.stat(path).st_mtime >= cutoff:
+                    continue
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass  # Pruned concurrently
+
+    def _load(self, meta):
+        import pyarrow as pa
+        tables = []
+        for part in range(meta['parts']):
+            with pa.memory_map(os.path.join(
+                    meta['path'], f'part-{part:05d}.arrow')) as source:
+                tables.append(pa.ipc.open_file(source).read_all())
+        return tables
+
+    def read_arrow(self, query, refresh=False):
+        '''The result of ``query`` as a ``pyarrow.Table`` backed by
+        memory-mapped files; run and cached if missing or stale.'''
+        import pyarrow as pa
+        entry = self._entry(query)
+        meta = self._meta(entry)
+        watermark = self.watermark(referenced_tables(query))
+        if refresh or meta is None or (
+                watermark is not None and (meta['watermark'] is None
+                                           or watermark > meta['watermark'])):
+            meta = self._fill(query, entry, watermark)
+        try:
+            tables = self._load(meta)
+        except FileNotFoundError:
+            # Invalidated or pruned while being read: retry once
+            meta = self._meta(entry) or self._fill(query, entry, watermark)
+            tables = self._load(meta)
+        if not tables:
+            return None
+        # Chunks may infer different types (e.g. an all-NULL column)
+        return pa.concat_tables(tables, promote_options='default')
+
+    def read(self, query, refresh=False):
+        '''The result of ``query`` as a DataFrame (see ``read_arrow``).'''
+        table = self.read_arrow(query, refresh)
+        if table is None:
+            # An empty result has no chunks: run it for the columns
+            return pd.read_sql(query, self.connection)
+        return table.to_pandas()
+
+    def invalidate(self, query=None):
+        '''Drop the entry of ``query``, or every entry.'''
+        entries = [self._entry(query)] if query else [
+            os.path.join(self.cache_dir, name)
+            for name in os.listdir(self.cache_dir)]
+        for entry in entries:
+            shutil.rmtree(entry, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Run a query through the on-disk query cache.')
+    parser.add_argument('query')
+    parser.add_argument('--url', required=True, help='database URL')
+    parser.add_argument('--cache-dir', default=os.path.join(
+        os.getcwd(), 'logs', 'query_cache'))
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument('--metadata-table', default=METADATA_TABLE)
+    parser.add_argument('--refresh', action='store_true')
+    args = parser.parse_args(argv)
+
+    with QueryCache(args.url, args.cache_dir, args.chunksize,
+                    args.metadata_table) as cache:
+        started = time.perf_counter()
+        result = cache.read(args.query, args.refresh)
+    print(f'{len(result)} rows in {time.perf_counter() - started:.3f}s '
+          f'(cache entry {query_key(args.query)})')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,229 @@
+'''Client-side change detection for the dim_user SCD2 refresh.
+
+Section 8 of ``analytic_warehouse.sql`` rebuilds ``#src_users`` from all of
+``dbo.users_clean``, hashes every row and joins it to ``dim_user`` on every
+run. This stage computes the same ``record_hash`` in bulk and keeps a compact
+local index of user_id -> hash from the last load (sorted ids and 32-byte
+digests in an ``.npz`` file), so only the new and changed users are written
+to ``dbo.dim_user_delta`` (created in section 8b);
+``analytics_wh.sp_apply_dim_user_delta`` then closes and inserts just those
+rows.
+
+The hash is byte-compatible with the T-SQL formula: the ten tracked columns
+rendered like their ``CAST``/``CONVERT`` (NULL -> ''), joined with ``|``,
+encoded in the VARCHAR code page (1252 for the default Latin1 collations)
+and hashed with SHA-256, which is what ``HASHBYTES('SHA2_256', ...)`` does.
+
+    python scd2.py --source mssql+pyodbc://... --sink mssql+pyodbc://... \\
+        --index logs/dim_user_index.npz
+    (EXEC analytics_wh.sp_apply_dim_user_delta)
+    python scd2.py --index logs/dim_user_index.npz --commit
+
+The new index is written next to the old one with a ``.pending`` suffix and
+only replaces it with ``--commit`` once the delta has been applied, so a
+failed apply is simply rerun. Seed the index of an existing warehouse with
+``--bootstrap`` (reads the current rows of ``analytics_wh.dim_user``).
+'''
+import argparse
+import hashlib
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from generators import USER_COLUMNS
+from sinks import connect
+
+# Column -> how T-SQL renders it in the hashed string
+HASHED_COLUMNS = {'user_id': 'int', 'signup_date': 'date', 'age': 'int',
+                  'gender': 'text', 'country': 'text', 'device_type': 'text',
+                  'referral_source': 'text', 'learning_motivation': 'text',
+                  'email_verified': 'bit', 'duolingo_plus_subscribed': 'bit'}
+DELTA_TABLE = 'dim_user_delta'
+SOURCE_QUERY = 'SELECT {} FROM {} ORDER BY user_id'
+BOOTSTRAP_QUERY = ('SELECT user_id, record_hash FROM analytics_wh.dim_user '
+                   'WHERE is_current = 1')
+HASH_BYTES = 32
+# Code page of the VARCHAR columns (Latin1_General collations)
+DEFAULT_ENCODING = 'cp1252'
+
+
+def _rendered(column, kind):
+    '''Column values as T-SQL renders them for the hash (NULL -> '').'''
+    missing = column.isna().to_numpy()
+    if kind == 'date':
+        # CONVERT(VARCHAR(10), d, 23)
+        values = pd.to_datetime(column).dt.strftime('%Y-%m-%d')
+    elif kind in ('int', 'bit'):
+        # CAST(... AS VARCHAR); a bit renders as 0 / 1
+        values = column.astype('Int64').astype(str)
+    else:
+        values = column.astype(object).astype(str)
+    return np.where(missing, '', values.to_numpy(dtype=object))
+
+
+def record_texts(users):
+    '''The ``__concat_for_hash`` string of every row of ``users``.'''
+    columns = [_rendered(users[name], kind)
+               for name, kind in HASHED_COLUMNS.items()]
+    return ['|'.join(row) for row in zip(*columns)]
+
+
+def record_hashes(users, encoding=DEFAULT_ENCODING):
+    '''``HASHBYTES('SHA2_256', __concat_for_hash)`` of every row, as an
+    (n, 32) uint8 array.'''
+    digests = b''.join(
+        hashlib.sha256(text.encode(encoding, errors='replace')).digest()
+        for text in record_texts(users))
+    return np.frombuffer(digests, dtype=np.uint8).reshape(-1, HASH_BYTES)
+
+
+class HashIndex:
+    '''user_id -> record_hash of the last load, as sorted arrays.'''
+
+    def __init__(self, user_ids=None, hashes=None):
+        self.user_ids = np.asarray(
+            [] if user_ids is None else user_ids, dtype=np.int64)
+        self.hashes = np.empty((0, HASH_BYTES), dtype=np.uint8) \
+            if hashes is None else np.asarray(hashes, dtype=np.uint8)
+        order = np.argsort(self.user_ids, kind='stable')
+        self.user_ids, self.hashes = self.user_ids[order], self.hashes[order]
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    @classmethod
+    def load(cls, path):
+        '''The index saved at ``path``; empty if there is none yet.'''
+        if not os.path.exists(path):
+            return cls()
+        with np.load(path) as data:
+            return cls(data['user_ids'], data['hashes'])
+
+    @classmethod
+    def from_frame(cls, frame):
+        '''Index of (user_id, record_hash) rows, e.g. from dim_user.'''
+        present = frame['record_hash'].notna().to_numpy()
+        hashes = b''.join(bytes(value)
+                          for value in frame['record_hash'][present])
+        return cls(frame['user_id'].to_numpy()[present], np.frombuffer(
+            hashes, dtype=np.uint8).reshape(-1, HASH_BYTES))
+
+    def save(self, path):
+        '''Write the index atomically.'''
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, user_ids=self.user_ids, hashes=self.hashes)
+        os.replace(path + '.tmp', path)
+
+    def lookup(self, user_ids, hashes):
+        '''(is_new, is_changed) masks of the given users against the index.'''
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        position = np.searchsorted(self.user_ids, user_ids)
+        found = position < len(self.user_ids)
+        found[found] = self.user_ids[position[found]] == user_ids[found]
+        changed = np.zeros(len(user_ids), dtype=bool)
+        changed[found] = (self.hashes[position[found]]
+                          != hashes[found]).any(axis=1)
+        return ~found, changed
+
+    def updated(self, user_ids, hashes):
+        '''A new index with the given users' hashes replacing their old
+        ones; users not given keep theirs.'''
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        kept = ~np.isin(self.user_ids, user_ids)
+        return HashIndex(np.r_[self.user_ids[kept], user_ids],
+                         np.r_[self.hashes[kept], hashes])
+
+
+def user_delta(users, index, encoding=DEFAULT_ENCODING):
+    '''SCD2 delta of ``users`` against ``index``: the new and changed rows
+    with their ``record_hash`` and a ``change_type`` of ``'insert'`` or
+    ``'update'``. Returns (delta, user_ids, hashes) so that the caller can
+    update the index once the delta is applied.'''
+    hashes = record_hashes(users, encoding)
+    user_ids = users['user_id'].to_numpy(dtype=np.int64)
+    is_new, changed = index.lookup(user_ids, hashes)
+    rows = is_new | changed
+    delta = users.loc[rows, USER_COLUMNS].reset_index(drop=True)
+    delta['record_hash'] = [row.tobytes() for row in hashes[rows]]
+    delta['change_type'] = np.where(is_new[rows], 'insert', 'update')
+    return delta, user_ids, hashes
+
+
+def detect_changes(source_url, sink, index_path, table='dbo.users_clean',
+                   chunksize=100000, encoding=DEFAULT_ENCODING):
+    '''Write the delta of the source users against the index at
+    ``index_path`` to ``sink``, chunk by chunk, and save the updated index
+    as ``index_path + '.pending'``. Returns (new, changed) user counts.'''
+    index = HashIndex.load(index_path)
+    seen_ids, seen_hashes = [], []
+    new = changed = 0
+    query = SOURCE_QUERY.format(', '.join(USER_COLUMNS), table)
+    with connect(source_url) as connection:
+        for chunk in pd.read_sql(query, connection, chunksize=chunksize):
+            delta, user_ids, hashes = user_delta(chunk, index, encoding)
+            if len(delta):
+                # Replaces the rows of a rerun that was not applied
+                sink.upsert(DELTA_TABLE, delta, 'user_id')
+            inserts = int((delta['change_type'] == 'insert').sum())
+            new += inserts
+            changed += len(delta) - inserts
+            seen_ids.append(user_ids)
+            seen_hashes.append(hashes)
+    if seen_ids:
+        index = index.updated(np.concatenate(seen_ids),
+                              np.concatenate(seen_hashes))
+    index.save(index_path + '.pending')
+    return new, changed
+
+
+def commit_index(index_path):
+    '''Make the index of the last applied delta the current one.'''
+    os.replace(index_path + '.pending', index_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Emit the SCD2 delta of dim_user from a local hash index.')
+    parser.add_argument('--index', required=True,
+                        help='user_id -> record_hash index file (.npz)')
+    parser.add_argument('--source', help='URL of the database with the users')
+    parser.add_argument('--table', default='dbo.users_clean')
+    parser.add_argument('--sink', help=f'URL to write {DELTA_TABLE} to '
+                                       '(default: the source)')
+    parser.add_argument('--chunksize', type=int, default=100000)
+    parser.add_argument('--encoding', default=DEFAULT_ENCODING,
+                        help='code page of the VARCHAR columns')
+    parser.add_argument('--bootstrap', action='store_true',
+                        help='seed the index from analytics_wh.dim_user')
+    parser.add_argument('--commit', action='store_true',
+                        help='the delta was applied: keep the new index')
+    args = parser.parse_args(argv)
+
+    if args.commit:
+        commit_index(args.index)
+        print(f'Committed {args.index}')
+        return 0
+    if not args.source:
+        parser.error('--source is required')
+    if args.bootstrap:
+        with connect(args.source) as connection:
+            index = HashIndex.from_frame(
+                pd.read_sql(BOOTSTRAP_QUERY, connection))
+        index.save(args.index)
+        print(f'Seeded {args.index} with {len(index)} users')
+        return 0
+
+    from sinks import create_sink
+    with create_sink(args.sink or args.source) as sink:
+        new, changed = detect_changes(args.source, sink, args.index,
+                                      args.table, args.chunksize,
+                                      args.encoding)
+    print(f'{new} new and {changed} changed users written to {DELTA_TABLE}; '
+          f'apply them, then run with --commit')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
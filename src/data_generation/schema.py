@@ -0,0 +1,121 @@
+'''Compact column types of the generated tables.
+
+Every column of the tables written by ``generate_synthetic_data.py`` gets
+the smallest dtype that holds the values its SQL type (``wh_creations.sql``)
+is generated with, instead of whatever pandas infers:
+
+* ids are int32 (SQL INT) and BIT flags int8;
+* small counters are int8 / int16; measurements stay float64, as SQL FLOAT
+  is double precision and a narrower type would change the stored values;
+* DATE columns are datetime64[s] and DATETIME columns datetime64[us];
+* low-cardinality strings are categoricals over their fixed vocabulary;
+* nullable integers are masked arrays (``Int8``, ``Int16``, ``Int32``).
+
+Generators build their frames with ``typed_frame``, so the columns are
+allocated in these types once; sinks cast anything else (e.g. a frame built
+from records) with ``TABLE_SCHEMAS`` as their ``dtypes``. Arrow and the
+bulk loaders take the buffers as they are: int8/int16 columns and
+dictionary-encoded categoricals need no conversion.
+'''
+import numpy as np
+import pandas as pd
+
+# Vocabularies of the categorical columns
+GENDERS = ['Male', 'Female', 'Non-binary', 'Prefer not to say']
+DEVICE_TYPES = ['iOS', 'Android', 'Web']
+REFERRAL_SOURCES = ['Friend', 'Ad', 'Organic']
+LEARNING_MOTIVATIONS = ['Travel', 'Career', 'Hobby', 'School']
+SKILLS = np.array(['Vocabulary', 'Grammar', 'Listening', 'Speaking'])
+NOTIFICATION_TYPES = np.array(
+    ['Streak Reminder', 'Progress Update', 'Friend Challenge', 'Daily Goal'])
+CHANNELS = np.array(['Push', 'Email', 'In-App'])
+CHURN_REASONS = np.array(['Inactivity', 'Difficulty', 'Time Constraints'])
+
+DATE = 'datetime64[s]'
+DATETIME = 'datetime64[us]'
+
+
+def _category(values):
+    return pd.CategoricalDtype(list(values))
+
+
+TABLE_SCHEMAS = {
+    'languages': {
+        'language_name': 'str', 'popularity_score': np.float64,
+        'script_type': 'category', 'native_speakers_millions': np.float64},
+    'courses': {
+        'target_language_id': np.int32, 'base_language_id': np.int32,
+        'difficulty_level': np.int8, 'total_lessons': np.int16,
+        'avg_completion_time_days': np.float64, 'created_date': DATE},
+    'users': {
+        'user_id': np.int32, 'signup_date': DATE, 'age': np.int8,
+        # The countries are only known once faker is loaded
+        'gender': _category(GENDERS), 'country': 'category',
+        'device_type': _category(DEVICE_TYPES),
+        'referral_source': _category(REFERRAL_SOURCES),
+        'learning_motivation': _category(LEARNING_MOTIVATIONS),
+        'email_verified': np.int8, 'duolingo_plus_subscribed': np.int8,
+        # Simulated churn, not written to the users table
+        'churn_flag': np.int8, 'churn_date': DATE},
+    'user_courses': {
+        'user_id': np.int32, 'course_id': np.int32, 'start_date': DATE,
+        'current_level': np.int8, 'total_xp': np.int16,
+        'crown_count': np.int16, 'lingot_count': np.int16},
+    'daily_activity': {
+        'user_id': np.int32, 'activity_date': DATE,
+        'lessons_completed': np.int16, 'xp_gained': np.int16,
+        'time_spent_minutes': np.float64, 'streak_days': np.int16,
+        'daily_goal_met': np.int8, 'leaderboard_rank': 'Int8',
+        'duolingo_plus_active': np.int8},
+    'sessions': {
+        'user_id': np.int32, 'user_course_id': 'Int32',
+        'session_start': DATETIME, 'session_end': DATETIME,
+        'exercises_completed': np.int16, 'accuracy_percentage': np.float64,
+        'skill_practiced': _category(SKILLS), 'hearts_lost': np.int8,
+        'gems_earned': np.int8},
+    'notifications': {
+        'user_id': np.int32, 'sent_date': DATETIME,
+        'notification_type': _category(NOTIFICATION_TYPES),
+        'opened': np.int8, 'clicked': np.int8,
+        'response_time_seconds': 'Int16', 'channel': _category(CHANNELS)},
+    'churn_labels': {
+        'user_id': np.int32, 'churn_flag': np.int8, 'churn_date': DATE,
+        'last_active_date': DATE,
+        'churn_reason_category': _category(CHURN_REASONS),
+        'retention_days': np.int16, 'reactivation_attempts': np.int8}
+}
+
+
+def categorical(codes, categories):
+    '''Categorical of ``codes`` into ``categories`` (-1 is missing).'''
+    return pd.Categorical.from_codes(codes, categories=categories)
+
+
+def masked(values, mask, dtype):
+    '''Nullable integer array of ``values`` with ``mask`` marking NULLs.'''
+    values = np.asarray(values)
+    mask = np.asarray(mask, dtype=bool)
+    # Masked slots may hold anything (e.g. NaN); zero them before the cast
+    values = np.where(mask, 0, values).astype(
+        pd.api.types.pandas_dtype(dtype).numpy_dtype)
+    return pd.arrays.IntegerArray(values, mask)
+
+
+def typed_frame(table, columns):
+    '''DataFrame of ``columns`` (name -> array) in ``table``'s schema;
+    arrays already in their type are not copied.'''
+    schema = TABLE_SCHEMAS[table]
+    return pd.DataFrame({
+        name: _typed(values, schema.get(name))
+        for name, values in columns.items()}, copy=False)
+
+
+def _typed(values, dtype):
+    if dtype is None:
+        return values
+    if isinstance(values, (pd.Series, pd.api.extensions.ExtensionArray)):
+        return values.astype(dtype, copy=False)
+    dtype = pd.api.types.pandas_dtype(dtype)
+    if isinstance(dtype, pd.api.extensions.ExtensionDtype):
+        return pd.array(values, dtype=dtype)
+    return np.asarray(values).astype(dtype, copy=False)
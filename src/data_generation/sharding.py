@@ -0,0 +1,179 @@
+'''Sharded generation over disjoint user-id ranges.
+
+A run can be split into ``n`` shards (``SHARD=i/n``, ``i`` in 0..n-1), each
+running on its own node. Shard ``i`` generates one contiguous, block aligned
+range of user ids; since every block draws from its own random stream derived
+from the seed, the union of the shards is identical to a single-node run.
+The static dimensions (languages, courses) depend only on the seed, so every
+shard generates the same ones and records their fingerprint in its manifest
+config; only shard 0 writes them.
+
+Once every shard has finished, verify the merged output with
+
+    python sharding.py logs/generation_manifest-shard-*.jsonl --sink URL
+
+which checks that the shards' configs agree, that their batches cover every
+user exactly once, and that the sink holds the committed row counts with
+unique user keys.
+'''
+import argparse
+import hashlib
+import sys
+
+import pandas as pd
+
+from batch_builder import BATCH_TABLES
+from manifest import read_manifest
+
+STATIC_TABLES = ('languages', 'courses')
+# Tables with exactly one row per user
+USER_KEY_TABLES = ('users', 'churn_labels')
+
+
+def parse_shard(text):
+    '''(index, count) of a shard spec such as ``'2/8'``.'''
+    try:
+        index, count = (int(part) for part in text.split('/'))
+    except ValueError:
+        raise ValueError(f'Shard must look like i/n, not {text!r}') from None
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f'Shard index must be in 0..{count - 1}: {text!r}')
+    return index, count
+
+
+def shard_range(num_users, index, count, block_size, first=0):
+    '''0-based (start, end) user offsets of shard ``index`` of ``count`` of
+    the users ``first``..``num_users - 1``: whole blocks (aligned to user id
+    0), as evenly spread as possible.'''
+    first_block = first // block_size
+    blocks = -(-num_users // block_size) - first_block
+    start = (first_block + blocks * index // count) * block_size
+    end = (first_block + blocks * (index + 1) // count) * block_size
+    return (min(max(start, first), num_users),
+            min(max(end, first), num_users))
+
+
+def frame_fingerprint(frame):
+    '''Content hash of a DataFrame (values, dtypes and column names).'''
+    digest = hashlib.sha256()
+    digest.update(repr([(name, str(dtype)) for name, dtype
+                        in frame.dtypes.items()]).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(
+        frame, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _shard_key(config):
+    return parse_shard(config.get('shard', '0/1'))
+
+
+def verify_shards(manifest_paths, sink=None):
+    '''Check that the manifests of all shards of a run fit together.
+
+    Returns (problems, expected rows per table); with a ``sink`` its row
+    counts and user keys are checked against the manifests as well.'''
+    problems = []
+    shards = {}
+    for path in manifest_paths:
+        config, entries = read_manifest(path)
+        # A unit recommitted after a crash counts once
+        entries = list({(entry['table'], entry['batch']): entry
+                        for entry in entries}.values())
+        index, count = _shard_key(config)
+        if index in shards:
+            problems.append(f'{path}: shard {index} appears twice')
+        shards[index] = (path, config, entries)
+    if not shards:
+        return ['No manifests given'], {}
+
+    reference = next(iter(shards.values()))[1]
+    count = _shard_key(reference)[1]
+    missing = sorted(set(range(count)) - set(shards))
+    if missing:
+        problems.append(f'Missing shards {missing} of {count}')
+    common = {key: value for key, value in reference.items() if key != 'shard'}
+    for path, config, _ in shards.values():
+        other = {key: value for key, value in config.items() if key != 'shard'}
+        if other != common:
+            problems.append(f'{path}: config {other} differs from {common}')
+    num_users = int(reference['num_users'])
+    block_size = int(reference['block_size'])
+
+    expected = dict.fromkeys(STATIC_TABLES + ('users',) + BATCH_TABLES, 0)
+    for index, (path, config, entries) in sorted(shards.items()):
+        start, end = shard_range(num_users, index, count, block_size)
+        batches = {}
+        for entry in entries:
+            table = entry['table']
+            if entry['batch'] == 'static':
+                if table == 'users' or index == 0:
+                    expected[table] += entry['rows']
+                continue
+            batch = batches.setdefault(
+                (entry['first_user_id'], entry['last_user_id']), set())
+            batch.add(table)
+            if table in expected:
+                expected[table] += entry['rows']
+        if not any(e['table'] == 'users' and e['batch'] == 'static'
+                   for e in entries):
+            problems.append(f'{path}: users not committed')
+        if index == 0:
+            for table in STATIC_TABLES:
+                if not any(e['table'] == table for e in entries):
+                    problems.append(f'{path}: {table} not committed')
+        covered = start
+        for (first, last), tables in sorted(batches.items()):
+            if first - 1 != covered:
+                problems.append(f'{path}: users {covered + 1}-{first - 1} '
+                                f'have no batch')
+            covered = max(covered, last)
+            pending = sorted(set(BATCH_TABLES) - tables)
+            if pending:
+                problems.append(f'{path}: batch {first}-{last} is missing '
+                                f'{", ".join(pending)}')
+        if covered != end:
+            problems.append(f'{path}: covers users up to {covered}, shard '
+                            f'ends at {end}')
+
+    if sink is not None:
+        for table, rows in expected.items():
+            actual = sink.row_count(table)
+            if actual != rows:
+                problems.append(f'{table}: sink has {actual} rows, shards '
+                                f'committed {rows}')
+        for table in USER_KEY_TABLES:
+            distinct = sink.distinct_count(table, 'user_id')
+            if distinct != num_users:
+                problems.append(f'{table}: {distinct} distinct user_id, '
+                                f'expected {num_users}')
+    return problems, expected
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Verify the merged output of a sharded run.')
+    parser.add_argument('manifests', nargs='+',
+                        help='manifest of every shard')
+    parser.add_argument('--sink', help='URL of the merged output to check')
+    args = parser.parse_args(argv)
+
+    sink = None
+    if args.sink:
+        from sinks import create_sink
+        sink = create_sink(args.sink)
+    try:
+        problems, expected = verify_shards(args.manifests, sink)
+    finally:
+        if sink is not None:
+            sink.close()
+    for table, rows in expected.items():
+        print(f'{table:<16} {rows:>14,d} rows')
+    if problems:
+        print('\n'.join(['', 'FAILED:'] + problems))
+        return 1
+    print(f'\nOK: {len(args.manifests)} shard(s) verified')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
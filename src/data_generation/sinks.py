@@ -0,0 +1,629 @@
+'''Bulk-load sinks for generated tables.
+
+A sink takes whole DataFrames and writes them with the fastest path its backend
+offers, instead of ``DataFrame.to_sql`` sending row-wise parameterized INSERTs:
+
+* ``MssqlSink`` - pyodbc ``fast_executemany`` (array parameter binding)
+* ``PostgresSink`` - ``COPY ... FROM STDIN`` with CSV chunks
+* ``SqliteSink`` / ``DuckDBSink`` - local, dependency-light backends for tests
+* ``SqlAlchemySink`` - chunked ``to_sql`` for any other SQLAlchemy URL
+* ``ParquetSink`` / ``ArrowSink`` - partitioned files, no database needed
+
+Use ``create_sink(url)`` to pick the backend from a connection URL.
+'''
+import contextlib
+import datetime
+import io
+import os
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+DEFAULT_CHUNKSIZE = 50000
+
+
+class SinkError(Exception):
+    '''Raised when a sink fails to write or read a table.'''
+
+
+def _chunks(frame, chunksize):
+    for lo in range(0, len(frame), chunksize):
+        yield frame.iloc[lo:lo + chunksize]
+
+
+def _python_column(column):
+    '''Column values as DB-API friendly Python objects (missing -> None).'''
+    if pd.api.types.is_datetime64_any_dtype(column.dtype):
+        values = pd.Series(column.dt.to_pydatetime(), dtype=object)
+        return values.where(column.notna().to_numpy(), None).tolist()
+    if column.dtype == object or isinstance(
+            column.dtype, pd.api.extensions.ExtensionDtype):
+        return column.astype(object).where(column.notna(), None).tolist()
+    return column.tolist()
+
+
+def frame_records(frame, convert=_python_column):
+    '''Row tuples of ``frame`` built column-wise, ready for executemany.'''
+    return list(zip(*(convert(frame[name]) for name in frame.columns)))
+
+
+class Sink:
+    '''Writes DataFrames to named tables.
+
+    ``chunksize`` bounds the rows sent per round trip and ``dtypes`` maps
+    table -> {column: dtype}; those columns are cast before every write so
+    the wire types do not depend on what pandas inferred.'''
+
+    def __init__(self, chunksize=DEFAULT_CHUNKSIZE, dtypes=None):
+        self.chunksize = chunksize
+        self.dtypes = dtypes or {}
+        self._timing = threading.local()
+
+    def write(self, table, frame, partition=None, stats=None):
+        '''Append ``frame`` to ``table`` and return the number of rows.
+
+        ``partition`` names the unit of work the rows belong to (e.g. a
+        batch); file sinks use it as the file name, databases ignore it.
+        A ``stats`` dict is filled with the total ``seconds`` of the write,
+        the ``serialize_seconds`` spent converting rows to the wire format
+        and, for file sinks, the ``bytes_written``.'''
+        return self._apply(self._write, table, frame, partition, stats)
+
+    def upsert(self, table, frame, key, partition=None, stats=None):
+        '''Replace the rows of ``table`` whose ``key`` column matches a row
+        of ``frame`` with the rows of ``frame`` (delete, then append; in one
+        transaction on databases). Otherwise like ``write``.'''
+        def upsert(table, frame, partition):
+            self._upsert(table, frame, partition, key)
+        return self._apply(upsert, table, frame, partition, stats)
+
+    def _apply(self, write, table, frame, partition, stats):
+        if frame.empty:
+            return 0
+        started = time.perf_counter()
+        self._timing.serialize_seconds = 0.0
+        self._timing.bytes_written = None
+        casts = {column: dtype for column, dtype
+                 in self.dtypes.get(table, {}).items() if column in frame}
+        if casts:
+            frame = self._serialize(frame.astype, casts)
+        try:
+            write(table, frame, partition)
+        except Exception as exc:
+            raise SinkError(
+                f'Failed writing {len(frame)} rows to {table}') from exc
+        if stats is not None:
+            stats['seconds'] = time.perf_counter() - started
+            stats['serialize_seconds'] = self._timing.serialize_seconds
+            if self._timing.bytes_written is not None:
+                stats['bytes_written'] = self._timing.bytes_written
+        return len(frame)
+
+    def _serialize(self, convert, *args, **kwargs):
+        '''Call ``convert``, counting its time as serialization.'''
+        started = time.perf_counter()
+        try:
+            return convert(*args, **kwargs)
+        finally:
+            self._timing.serialize_seconds += time.perf_counter() - started
+
+    def _wrote_bytes(self, nbytes):
+        self._timing.bytes_written = (self._timing.bytes_written or 0) + nbytes
+
+    def row_count(self, table):
+        try:
+            return self._row_count(table)
+        except Exception as exc:
+            raise SinkError(f'Failed counting rows of {table}') from exc
+
+    def distinct_count(self, table, column):
+        '''Number of distinct non-null values of ``column`` in ``table``.'''
+        try:
+            return self._distinct_count(table, column)
+        except Exception as exc:
+            raise SinkError(
+                f'Failed counting distinct {column} of {table}') from exc
+
+    def _write(self, table, frame, partition):
+        raise NotImplementedError
+
+    def _upsert(self, table, frame, partition, key):
+        raise NotImplementedError
+
+    def _row_count(self, table):
+        raise NotImplementedError
+
+    def _distinct_count(self, table, column):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SqlAlchemySink(Sink):
+    '''Generic sink for any SQLAlchemy URL using chunked ``to_sql``.'''
+
+    def __init__(self, url, chunksize=DEFAULT_CHUNKSIZE, dtypes=None,
+                 **engine_kwargs):
+        super().__init__(chunksize, dtypes)
+        from sqlalchemy import create_engine
+        self.engine = create_engine(url, **engine_kwargs)
+
+    def _write(self, table, frame, partition):
+        with self.engine.begin() as conn:
+            frame.to_sql(table, conn, if_exists='append', index=False,
+                         chunksize=self.chunksize)
+
+    def _upsert(self, table, frame, partition, key):
+        from sqlalchemy import inspect, text
+        with self.engine.begin() as conn:
+            if inspect(conn).has_table(table):
+                delete = text(f'DELETE FROM {table} WHERE {key} = :key')
+                for chunk in _chunks(frame[[key]], self.chunksize):
+                    conn.execute(delete, [{'key': value} for value
+                                          in _python_column(chunk[key])])
+            frame.to_sql(table, conn, if_exists='append', index=False,
+                         chunksize=self.chunksize)
+
+    def _row_count(self, table):
+        from sqlalchemy import text
+        with self.engine.connect() as conn:
+            return int(conn.execute(
+                text(f'SELECT COUNT(*) FROM {table}')).scalar())
+
+    def _distinct_count(self, table, column):
+        from sqlalchemy import text
+        with self.engine.connect() as conn:
+            return int(conn.execute(text(
+                f'SELECT COUNT(DISTINCT {column}) FROM {table}')).scalar())
+
+    def close(self):
+        self.engine.dispose()
+
+
+class MssqlSink(SqlAlchemySink):
+    '''SQL Server via pyodbc with ``fast_executemany`` enabled, which binds
+    each chunk as one parameter array instead of one round trip per row.
+
+    A frame that carries the table's IDENTITY column (``users.user_id``,
+    which every other table references) is inserted with IDENTITY_INSERT
+    on, so the generated keys are kept instead of rejected.'''
+
+    def __init__(self, url, chunksize=DEFAULT_CHUNKSIZE, dtypes=None):
+        super().__init__(url, chunksize, dtypes, fast_executemany=True)
+        self._identity_columns = {}
+
+    def _identity_column(self, cursor, table):
+        if table not in self._identity_columns:
+            row = cursor.execute(
+                'SELECT name FROM sys.identity_columns '
+                'WHERE object_id = OBJECT_ID(?)', table).fetchone()
+            self._identity_columns[table] = row[0] if row else None
+        return self._identity_columns[table]
+
+    def _write(self, table, frame, partition):
+        self._upsert(table, frame, partition, None)
+
+    def _upsert(self, table, frame, partition, key):
+        columns = ', '.join(frame.columns)
+        params = ', '.join('?' * len(frame.columns))
+        sql = f'INSERT INTO {table} ({columns}) VALUES ({params})'
+        raw = self.engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            cursor.fast_executemany = True
+            identity = self._identity_column(cursor, table) in frame.columns
+            if identity:
+                cursor.execute(f'SET IDENTITY_INSERT {table} ON')
+            try:
+                if key is not None:
+                    for chunk in _chunks(frame[[key]], self.chunksize):
+                        cursor.executemany(
+                            f'DELETE FROM {table} WHERE {key} = ?',
+                            self._serialize(frame_records, chunk))
+                for chunk in _chunks(frame, self.chunksize):
+                    cursor.executemany(
+                        sql, self._serialize(frame_records, chunk))
+            finally:
+                # The setting outlives the transaction on a pooled connection
+                if identity:
+                    cursor.execute(f'SET IDENTITY_INSERT {table} OFF')
+            raw.commit()
+        except Exception:
+            raw.rollback()
+            raise
+        finally:
+            raw.close()
+
+
+class PostgresSink(SqlAlchemySink):
+    '''PostgreSQL via ``COPY ... FROM STDIN`` (psycopg2 or psycopg 3).'''
+
+    def _write(self, table, frame, partition):
+        self._upsert(table, frame, partition, None)
+
+    def _upsert(self, table, frame, partition, key):
+        columns = ', '.join(frame.columns)
+        sql = f'COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)'
+        raw = self.engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            if key is not None:
+                cursor.execute(f'DELETE FROM {table} WHERE {key} = ANY(%s)',
+                               (_python_column(frame[key]),))
+            for chunk in _chunks(frame, self.chunksize):
+                buf = io.StringIO()
+                # Missing values are written as unquoted empty fields = NULL
+                self._serialize(chunk.to_csv, buf, index=False, header=False)
+                if hasattr(cursor, 'copy_expert'):  # psycopg2
+                    buf.seek(0)
+                    cursor.copy_expert(sql, buf)
+                else:  # psycopg 3
+                    with cursor.copy(sql) as copy:
+                        copy.write(buf.getvalue())
+            raw.commit()
+        except Exception:
+            raw.rollback()
+            raise
+        finally:
+            raw.close()
+
+
+def _sqlite_column(column):
+    if pd.api.types.is_datetime64_any_dtype(column.dtype):
+        values = column.dt.strftime('%Y-%m-%d %H:%M:%S.%f').astype(object)
+        return values.where(column.notna(), None).tolist()
+    values = _python_column(column)
+    if column.dtype == object:
+        values = [value.isoformat() if isinstance(value, datetime.date)
+                  else value for value in values]
+    return values
+
+
+def _sqlite_affinity(dtype):
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return 'INTEGER'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'REAL'
+    return 'TEXT'
+
+
+class SqliteSink(Sink):
+    '''Local SQLite file (or ``:memory:``); tables are created on first write.
+    Every write is a single transaction of chunked ``executemany`` calls.
+    The connection is shared between threads, one write at a time.'''
+
+    def __init__(self, path, chunksize=DEFAULT_CHUNKSIZE, dtypes=None):
+        super().__init__(chunksize, dtypes)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self._lock = threading.Lock()
+
+    def _write(self, table, frame, partition):
+        self._upsert(table, frame, partition, None)
+
+    def _upsert(self, table, frame, partition, key):
+        definition = ', '.join(f'{name} {_sqlite_affinity(frame[name].dtype)}'
+                               for name in frame.columns)
+        params = ', '.join('?' * len(frame.columns))
+        sql = (f'INSERT INTO {table} ({", ".join(frame.columns)}) '
+               f'VALUES ({params})')
+        with self._lock, self.conn:
+            self.conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {table} ({definition})')
+            if key is not None:
+                # One scan of the table instead of one per deleted key
+                self.conn.execute('CREATE TEMP TABLE _keys (key)')
+                try:
+                    self.conn.executemany('INSERT INTO _keys VALUES (?)', (
+                        (value,) for value in _sqlite_column(frame[key])))
+                    self.conn.execute(f'DELETE FROM {table} WHERE {key} IN '
+                                      f'(SELECT key FROM _keys)')
+                finally:
+                    self.conn.execute('DROP TABLE _keys')
+            for chunk in _chunks(frame, self.chunksize):
+                self.conn.executemany(sql, self._serialize(
+                    frame_records, chunk, _sqlite_column))
+
+    def _row_count(self, table):
+        with self._lock:
+            exists = self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                (table,)).fetchone()
+            if not exists:
+                return 0
+            return self.conn.execute(
+                f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+    def _distinct_count(self, table, column):
+        with self._lock:
+            return self.conn.execute(
+                f'SELECT COUNT(DISTINCT {column}) FROM {table}').fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+class DuckDBSink(Sink):
+    '''Local DuckDB file; frames are inserted through a zero-copy scan of the
+    registered DataFrame, so no chunking is needed. Writes are serialized.'''
+
+    def __init__(self, path, chunksize=DEFAULT_CHUNKSIZE, dtypes=None):
+        super().__init__(chunksize, dtypes)
+        import duckdb
+        self.conn = duckdb.connect(path)
+        self._lock = threading.Lock()
+
+    def _write(self, table, frame, partition):
+        self._upsert(table, frame, partition, None)
+
+    def _upsert(self, table, frame, partition, key):
+        columns = ', '.join(frame.columns)
+        with self._lock:
+            self.conn.register('_frame', frame)
+            try:
+                self.conn.execute('BEGIN TRANSACTION')
+                self.conn.execute(
+                    f'CREATE TABLE IF NOT EXISTS {table} AS '
+                    f'SELECT {columns} FROM _frame LIMIT 0')
+                if key is not None:
+                    self.conn.execute(f'DELETE FROM {table} WHERE {key} IN '
+                                      f'(SELECT {key} FROM _frame)')
+                self.conn.execute(
+                    f'INSERT INTO {table} ({columns}) '
+                    f'SELECT {columns} FROM _frame')
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+            finally:
+                self.conn.unregister('_frame')
+
+    def _row_count(self, table):
+        with self._lock:
+            exists = self.conn.execute(
+                'SELECT COUNT(*) FROM information_schema.tables '
+                'WHERE table_name = ?', [table]).fetchone()[0]
+            if not exists:
+                return 0
+            return self.conn.execute(
+                f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+    def _distinct_count(self, table, column):
+        with self._lock:
+            return self.conn.execute(
+                f'SELECT COUNT(DISTINCT {column}) FROM {table}').fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+# Date column used by the "month" partitioning of each table
+MONTH_COLUMNS = {
+    'users': 'signup_date',
+    'user_courses': 'start_date',
+    'daily_activity': 'activity_date',
+    'sessions': 'session_start',
+    'notifications': 'sent_date'
+}
+
+
+def compact_arrow_table(frame):
+    '''Arrow table with compact column types: 64-bit integers become int32
+    (every integer column is an SQL INT), strings are dictionary-encoded
+    and timestamps keep microsecond resolution.'''
+    import pyarrow as pa
+    arrays, names = [], []
+    for name in frame.columns:
+        column = frame[name]
+        array = pa.array(column, from_pandas=True)
+        if pa.types.is_int64(array.type):
+            array = array.cast(pa.int32())
+        elif pa.types.is_string(array.type) or pa.types.is_large_string(
+                array.type):
+            array = array.dictionary_encode()
+        elif pa.types.is_timestamp(array.type) and array.type.unit == 'ns':
+            array = array.cast(pa.timestamp('us'))
+        arrays.append(array)
+        names.append(name)
+    return pa.Table.from_arrays(arrays, names=names)
+
+
+class _FileSink(Sink):
+    '''Writes every ``write`` call as its own file under ``root/<table>/``.
+
+    Files are named after the ``partition`` passed to ``write`` (rewriting a
+    partition replaces its file) or numbered sequentially. With
+    ``partition_by='month'`` rows are further split into ``month=YYYY-MM``
+    directories using the table's date column from ``MONTH_COLUMNS``.
+    Files are written to a temporary name and renamed into place, so readers
+    never see a partially written file.'''
+
+    extension = None
+
+    def __init__(self, root, chunksize=DEFAULT_CHUNKSIZE, dtypes=None,
+                 partition_by='batch'):
+        super().__init__(chunksize, dtypes)
+        if partition_by not in ('batch', 'month'):
+            raise ValueError(f'Unknown partition_by: {partition_by}')
+        self.root = root
+        self.partition_by = partition_by
+        self._lock = threading.Lock()
+        self._sequence = {}
+
+    def _next_name(self, table):
+        with self._lock:
+            if table not in self._sequence:
+                # Continue after any parts left by an earlier run
+                parts = [int(os.path.basename(path)[5:10])
+                         for path in self._files(table)
+                         if os.path.basename(path).startswith('part-')]
+                self._sequence[table] = max(parts, default=-1) + 1
+            self._sequence[table] += 1
+            return f'part-{self._sequence[table] - 1:05d}'
+
+    def _files(self, table):
+        files = []
+        for directory, _, names in os.walk(os.path.join(self.root, table)):
+            files.extend(os.path.join(directory, name) for name in names
+                         if name.endswith(self.extension))
+        return sorted(files)
+
+    def _write(self, table, frame, partition):
+        name = partition or self._next_name(table)
+        column = MONTH_COLUMNS.get(table)
+        if self.partition_by == 'month' and column in frame:
+            months = pd.to_datetime(frame[column]).dt.strftime('%Y-%m')
+            for month, rows in frame.groupby(months.to_numpy(), sort=True):
+                self._write_file(os.path.join(table, f'month={month}'),
+                                 name, rows)
+        else:
+            self._write_file(table, name, frame)
+
+    def _write_file(self, directory, name, frame):
+        directory = os.path.join(self.root, directory)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, name + self.extension)
+        tmp_path = path + '.tmp'
+        self._write_arrow(tmp_path,
+                          self._serialize(compact_arrow_table, frame))
+        os.replace(tmp_path, path)
+        self._wrote_bytes(os.path.getsize(path))
+
+    def _write_arrow(self, path, table):
+        raise NotImplementedError
+
+    def _read_arrow(self, path):
+        raise NotImplementedError
+
+    def _upsert(self, table, frame, partition, key):
+        # Files cannot be updated in place: every file holding one of the
+        # keys is rewritten without those rows, then the frame is appended
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        keys = pa.array(frame[key].to_numpy())
+        for path in self._files(table):
+            data = self._read_arrow(path)
+            drop = pc.is_in(data.column(key), value_set=keys.cast(
+                data.schema.field(key).type))
+            if not pc.any(drop).as_py():
+                continue
+            kept = data.filter(pc.invert(drop))
+            if kept.num_rows:
+                self._write_arrow(path + '.tmp', kept)
+                os.replace(path + '.tmp', path)
+            else:
+                os.remove(path)
+        self._write(table, frame, partition)
+
+    def _row_count(self, table):
+        return sum(self._file_rows(path) for path in self._files(table))
+
+    def _distinct_count(self, table, column):
+        import pyarrow.compute as pc
+        values = open_dataset(self.root, table, self.extension[1:]).to_table(
+            columns=[column]).column(column)
+        return pc.count_distinct(values).as_py()
+
+
+class ParquetSink(_FileSink):
+    '''Partitioned Parquet files (zstd-compressed, dictionary-encoded).'''
+
+    extension = '.parquet'
+
+    def _write_arrow(self, path, table):
+        import pyarrow.parquet as pq
+        pq.write_table(table, path, compression='zstd',
+                       row_group_size=self.chunksize)
+
+    def _read_arrow(self, path):
+        import pyarrow.parquet as pq
+        return pq.read_table(path)
+
+    def _file_rows(self, path):
+        import pyarrow.parquet as pq
+        return pq.read_metadata(path).num_rows
+
+
+class ArrowSink(_FileSink):
+    '''Partitioned uncompressed Arrow IPC files, which can be memory-mapped
+    for zero-copy reads.'''
+
+    extension = '.arrow'
+
+    def _write_arrow(self, path, table):
+        import pyarrow as pa
+        with pa.OSFile(path, 'wb') as sink, \
+                pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=self.chunksize)
+
+    def _read_arrow(self, path):
+        # Read into memory rather than mapping, as the file may be replaced
+        import pyarrow as pa
+        with pa.OSFile(path) as source:
+            return pa.ipc.open_file(source).read_all()
+
+    def _file_rows(self, path):
+        import pyarrow as pa
+        with pa.memory_map(path) as source:
+            return pa.ipc.open_file(source).read_all().num_rows
+
+
+def open_dataset(root, table, format='parquet'):
+    '''``pyarrow.dataset`` over the files a file sink wrote for ``table``;
+    Arrow IPC files are memory-mapped rather than read into memory.'''
+    import pyarrow.dataset as ds
+    return ds.dataset(os.path.join(root, table),
+                      format='ipc' if format == 'arrow' else format,
+                      partitioning='hive')
+
+
+@contextlib.contextmanager
+def connect(url):
+    '''A connection to read from with ``pd.read_sql``: sqlite3 for
+    ``sqlite:///`` URLs, a SQLAlchemy engine for anything else.'''
+    if url.startswith('sqlite:///'):
+        connection = sqlite3.connect(url[len('sqlite:///'):])
+        try:
+            yield connection
+        finally:
+            connection.close()
+        return
+    from sqlalchemy import create_engine
+    engine = create_engine(url)
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+
+
+def create_sink(url, chunksize=DEFAULT_CHUNKSIZE, dtypes=None):
+    '''Pick the bulk-load sink for a connection URL.
+
+    ``sqlite:///path`` and ``duckdb:///path`` open local files;
+    ``parquet:///dir`` and ``arrow:///dir`` write partitioned files under
+    ``dir``; ``mssql+*`` and ``postgresql*`` URLs get their bulk paths;
+    anything else falls back to ``SqlAlchemySink``.'''
+    scheme, _, rest = url.partition('://')
+    if scheme == 'sqlite':
+        return SqliteSink(rest[1:] or ':memory:', chunksize, dtypes)
+    if scheme == 'duckdb':
+        return DuckDBSink(rest[1:] or ':memory:', chunksize, dtypes)
+    if scheme in ('parquet', 'arrow'):
+        path, _, partition_by = rest[1:].partition('?partition_by=')
+        cls = ParquetSink if scheme == 'parquet' else ArrowSink
+        return cls(path, chunksize, dtypes, partition_by or 'batch')
+    if scheme.startswith('mssql+pyodbc'):
+        return MssqlSink(url, chunksize, dtypes)
+    if scheme.startswith('postgresql'):
+        return PostgresSink(url, chunksize, dtypes)
+    return SqlAlchemySink(url, chunksize, dtypes)
@@ -0,0 +1,190 @@
+'''Star-schema output of the generator, laid out like the analytics_wh tables.
+
+The gold load in ``analytic_warehouse.sql`` (sections 9A-9C) and
+``simplified_analytics_warehouse.sql`` reads every dbo row a second time to
+compute ``CONVERT(INT, FORMAT(date, 'yyyyMMdd'))`` and join the dimensions
+for the surrogate keys. With ``STAR_SCHEMA=1`` the generator emits the facts
+directly instead:
+
+* ``date_id`` is computed from the dates in bulk (yyyyMMdd integers, the keys
+  of ``dim_date``);
+* surrogate keys come from in-memory dimension maps. The device and
+  notification type maps are seeded with the fixed vocabularies, courses and
+  languages are keyed by their id, and ``user_sk`` is the user id (ids are
+  dense 1..N), so every shard assigns the same keys without sharing a map;
+* fact frames have the columns of the columnstore tables in table order
+  (without the IDENTITY key and ``created_at``, which default on insert).
+
+Facts are appended straight to ``analytics_wh.fact_*``; the dimensions carry
+their keys and go to ``analytics_wh.<dim>_stage`` tables, from which
+``analytics_wh.sp_load_star_dimensions`` inserts them with IDENTITY_INSERT
+and moves the fact watermarks past the loaded days, so the incremental fact
+loads do not copy the same rows again. Use an ``INSERT_CHUNKSIZE`` of at
+least 102400 so that every chunk lands in a compressed columnstore row group.
+'''
+import numpy as np
+import pandas as pd
+
+from generators import USER_COLUMNS
+from schema import DEVICE_TYPES, NOTIFICATION_TYPES
+from scd2 import record_hashes
+
+STAR_FACTS = ('fact_daily_activity', 'fact_session', 'fact_notification')
+# dbo table every fact is derived from
+FACT_SOURCES = {'fact_daily_activity': 'daily_activity',
+                'fact_session': 'sessions',
+                'fact_notification': 'notifications'}
+STAR_DIMENSIONS = ('dim_language', 'dim_course', 'dim_device',
+                   'dim_notification_type')
+STAGE_SUFFIX = '_stage'
+# Fact columns in table order, without the IDENTITY key and created_at
+FACT_COLUMNS = {
+    'fact_daily_activity': ['date_id', 'user_sk', 'lessons_completed',
+                            'xp_gained', 'time_spent_minutes', 'streak_days',
+                            'daily_goal_met', 'duolingo_plus_active',
+                            'churn_flag'],
+    'fact_session': ['session_id', 'date_id', 'user_sk', 'user_course_sk',
+                     'session_start', 'session_end', 'exercises_completed',
+                     'accuracy_percentage', 'skill_practiced', 'hearts_lost',
+                     'gems_earned'],
+    'fact_notification': ['notification_id', 'date_id', 'user_sk',
+                          'notification_type_sk', 'opened', 'clicked',
+                          'response_time_seconds', 'channel']
+}
+
+
+def date_ids(dates):
+    '''yyyyMMdd integers (``dim_date.date_id``) of datetime64 values.'''
+    days = np.asarray(dates, dtype='datetime64[D]')
+    months = days.astype('datetime64[M]')
+    years = months.astype('datetime64[Y]')
+    return ((years.astype(np.int32) + 1970) * 10000
+            + ((months - years).astype(np.int32) + 1) * 100
+            + (days - months).astype(np.int32) + 1)
+
+
+class DimensionMap:
+    '''Natural key -> surrogate key of one dimension. Keys are assigned 1, 2,
+    ... in order of appearance, like the IDENTITY column of a first load.'''
+
+    def __init__(self, values=()):
+        self.keys = {}
+        for value in values:
+            self.keys.setdefault(value, len(self.keys) + 1)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, values):
+        '''Surrogate keys (int32) of ``values``; every value must be mapped,
+        since the dimension rows are written before the facts.'''
+        codes = pd.Index(list(self.keys)).get_indexer(values)
+        if (codes < 0).any():
+            unknown = pd.unique(np.asarray(values, dtype=object)[codes < 0])
+            raise ValueError(f'Values not in the dimension: {list(unknown)}')
+        return np.asarray(list(self.keys.values()), dtype=np.int32)[codes]
+
+    def frame(self, natural, surrogate):
+        '''The dimension rows as (surrogate, natural) columns.'''
+        return pd.DataFrame({surrogate: list(self.keys.values()),
+                             natural: list(self.keys)})
+
+
+def user_keys(user_ids):
+    '''``user_sk`` of the first version of every user: the user id.'''
+    return np.asarray(user_ids, dtype=np.int32)
+
+
+class StarSchema:
+    '''Dimension maps of one run and the star-schema frames built from
+    them.'''
+
+    def __init__(self, num_languages, num_courses):
+        # dbo ids are IDENTITY(1,1) in insertion order, and so are the keys
+        self.languages = DimensionMap(range(1, num_languages + 1))
+        self.courses = DimensionMap(range(1, num_courses + 1))
+        self.devices = DimensionMap(value.upper() for value in DEVICE_TYPES)
+        self.notification_types = DimensionMap(NOTIFICATION_TYPES)
+
+    def dimensions(self, languages, courses):
+        '''The static dimensions of the generated languages and courses.'''
+        dim_language = self.languages.frame('language_id', 'language_sk')
+        dim_language = pd.concat(
+            [dim_language, languages.reset_index(drop=True)], axis=1)
+        dim_course = self.courses.frame('course_id', 'course_sk')
+        dim_course['target_language_sk'] = self.languages.lookup(
+            courses['target_language_id'])
+        dim_course['base_language_sk'] = self.languages.lookup(
+            courses['base_language_id'])
+        for column in ('difficulty_level', 'total_lessons',
+                       'avg_completion_time_days', 'created_date'):
+            dim_course[column] = courses[column].to_numpy()
+        return {
+            'dim_language': dim_language,
+            'dim_course': dim_course,
+            'dim_device': self.devices.frame('device_type', 'device_sk'),
+            'dim_notification_type': self.notification_types.frame(
+                'notification_type', 'notification_type_sk')
+        }
+
+    def dim_user(self, users, effective_from):
+        '''First SCD2 version of every user, current from ``effective_from``,
+        with the ``record_hash`` of section 8.'''
+        frame = users[USER_COLUMNS].reset_index(drop=True)
+        frame.insert(0, 'user_sk', user_keys(frame['user_id']))
+        frame['effective_from'] = pd.Timestamp(effective_from)
+        frame['effective_to'] = pd.NaT
+        frame['is_current'] = 1
+        frame['record_hash'] = [row.tobytes()
+                                for row in record_hashes(frame)]
+        return frame
+
+    def facts(self, tables):
+        '''The fact frames of one generated batch (whose churn_labels hold
+        every user of the batch).'''
+        activity = tables['daily_activity']
+        labels = tables['churn_labels']
+        label_users = labels['user_id'].to_numpy()
+        activity_users = activity['user_id'].to_numpy()
+        fact_daily_activity = pd.DataFrame({
+            'date_id': date_ids(activity['activity_date']),
+            'user_sk': user_keys(activity_users)})
+        for column in FACT_COLUMNS['fact_daily_activity'][2:-1]:
+            fact_daily_activity[column] = activity[column].to_numpy()
+        fact_daily_activity['churn_flag'] = labels['churn_flag'].to_numpy()[
+            np.searchsorted(label_users, activity_users)]
+
+        sessions = tables['sessions']
+        fact_session = pd.DataFrame({
+            # Degenerate keys: NULL, the dbo IDENTITY ids are not known yet
+            'session_id': _ids(sessions, 'session_id'),
+            'date_id': date_ids(sessions['session_start']),
+            'user_sk': user_keys(sessions['user_id']),
+            # The generated user_course_id is the session's course
+            'user_course_sk': self.courses.lookup(sessions['user_course_id'])})
+        for column in FACT_COLUMNS['fact_session'][4:]:
+            fact_session[column] = sessions[column].array
+
+        notifications = tables['notifications']
+        fact_notification = pd.DataFrame({
+            'notification_id': _ids(notifications, 'notification_id'),
+            'date_id': date_ids(notifications['sent_date']),
+            'user_sk': user_keys(notifications['user_id']),
+            'notification_type_sk': self.notification_types.lookup(
+                notifications['notification_type'])})
+        for column in FACT_COLUMNS['fact_notification'][4:]:
+            fact_notification[column] = notifications[column].array
+        return {'fact_daily_activity': fact_daily_activity,
+                'fact_session': fact_session,
+                'fact_notification': fact_notification}
+
+
+def _ids(frame, column):
+    return frame[column].array if column in frame \
+        else pd.array([None] * len(frame), dtype='Int64')
+
+
+def stage_table(dimension):
+    '''Table the rows of ``dimension`` are written to before the load.'''
+    return dimension + STAGE_SUFFIX
+
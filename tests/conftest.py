@@ -0,0 +1,8 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The generator modules are plain scripts living next to each other, as are
+# the benchmark helpers
+sys.path.insert(0, os.path.join(ROOT, 'src', 'data_generation'))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
@@ -0,0 +1,77 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import batch_builder
+from batch_builder import (BATCH_TABLES, build_batch, build_users,
+                           generate_batches, iter_batch_ranges)
+
+CURRENT_DATE = datetime.date(2025, 8, 31)
+
+
+def make_users(n=250, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'signup_date': [CURRENT_DATE - datetime.timedelta(days=int(d))
+                        for d in rng.integers(1, 731, n)],
+        'duolingo_plus_subscribed': (rng.random(n) < 0.2).astype(int)
+    })
+
+
+def test_build_batch_materializes_every_table():
+    users = make_users()
+    user_ids = np.arange(101, 101 + len(users))
+    batch = build_batch(user_ids, users, 100, CURRENT_DATE, 3)
+    assert set(batch) == set(BATCH_TABLES)
+    assert batch['churn_labels']['user_id'].tolist() == user_ids.tolist()
+    courses_per_user = batch['user_courses'].groupby('user_id').size()
+    assert courses_per_user.between(1, 3).all()
+    assert len(courses_per_user) == len(users)
+    for frame in batch.values():
+        assert frame.index.equals(pd.RangeIndex(len(frame)))
+
+
+def test_sessions_use_first_course_of_user():
+    users = make_users()
+    batch = build_batch(np.arange(1, len(users) + 1), users, 100,
+                        CURRENT_DATE, 4)
+    first_course = batch['user_courses'].groupby('user_id')['course_id'].first()
+    sessions = batch['sessions']
+    assert (sessions['user_course_id'].to_numpy()
+            == first_course.loc[sessions['user_id']].to_numpy()).all()
+
+
+def run_batches(users, batch_size, workers):
+    tasks = [(np.arange(start + 1, end + 1), users.iloc[start:end], 100,
+              CURRENT_DATE, 42)
+             for start, end in iter_batch_ranges(len(users), batch_size)]
+    results = list(generate_batches(tasks, workers))
+    assert all(error is None for _, error, _ in results)
+    return {table: pd.concat([tables[table] for tables, _, _ in results],
+                             ignore_index=True)
+            for table in BATCH_TABLES}
+
+
+def test_output_is_identical_across_workers_and_batch_sizes(monkeypatch):
+    monkeypatch.setattr(batch_builder, 'BLOCK_SIZE', 50)
+    users = make_users(n=230)
+    serial = run_batches(users, 100, workers=1)
+    for batch_size, workers in [(100, 3), (50, 2), (150, 1)]:
+        other = run_batches(users, batch_size, workers)
+        for table in BATCH_TABLES:
+            pd.testing.assert_frame_equal(serial[table], other[table])
+
+
+def test_batches_must_cover_whole_blocks():
+    with pytest.raises(ValueError):
+        list(iter_batch_ranges(5000, 1500))
+
+
+def test_users_of_any_range_match_the_full_run(monkeypatch):
+    monkeypatch.setattr(batch_builder, 'BLOCK_SIZE', 50)
+    everyone = build_users(np.arange(1, 301), CURRENT_DATE, 42)
+    middle = build_users(np.arange(101, 201), CURRENT_DATE, 42)
+    pd.testing.assert_frame_equal(
+        everyone.iloc[100:200].reset_index(drop=True), middle)
@@ -0,0 +1,67 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from batch_sizing import BatchPlanner, PeakRss, estimate_rows
+from manifest import RunManifest
+
+
+def test_estimate_rows_grows_with_tenure():
+    today = datetime.date(2025, 8, 31)
+    signup = np.array(['2025-08-31', '2024-08-31'], dtype='datetime64[D]')
+    rows = estimate_rows(signup, [0, 0], today)
+    assert rows[0] < 10
+    assert rows[1] > 300 * rows[0] / 10
+
+
+def test_fixed_batch_size():
+    planner = BatchPlanner(np.ones(250), 50, batch_size=100)
+    assert list(planner.iter_batches(0, 250)) == [(0, 100), (100, 200),
+                                                  (200, 250)]
+    with pytest.raises(ValueError):
+        BatchPlanner(np.ones(250), 50, batch_size=120)
+    with pytest.raises(ValueError):
+        list(planner.iter_batches(10, 250))
+
+
+def test_memory_budget_packs_whole_blocks():
+    # Users 0-99 are heavy, the rest light
+    estimates = np.r_[np.full(100, 10.0), np.ones(300)]
+    planner = BatchPlanner(estimates, 50, memory_budget=400, bytes_per_row=1)
+    batches = list(planner.iter_batches(0, 400))
+    # Heavy blocks exceed the budget alone, but a batch has at least one
+    assert batches[:2] == [(0, 50), (50, 100)]
+    assert batches[-1] == (100, 400)
+    assert all(start % 50 == 0 for start, _ in batches)
+    assert batches[-1][1] == 400
+
+
+def test_observe_adapts_batch_sizes():
+    planner = BatchPlanner(np.ones(1000), 100, memory_budget=400,
+                           bytes_per_row=1)
+    assert planner.next_end(0, 1000) == 400
+    planner.observe(0, 400, rss_delta=1600)  # 4 bytes/row: adopted at once
+    assert planner.bytes_per_row == 4
+    assert planner.next_end(400, 1000) == 500
+    planner.observe(400, 500, rss_delta=100)  # Overestimate decays slowly
+    assert 1 < planner.bytes_per_row < 4
+    planner.observe(500, 600, rss_delta=None)
+    assert 1 < planner.bytes_per_row < 4
+
+
+def test_peak_rss_measures_allocation():
+    with PeakRss(interval=0.01) as rss:
+        block = np.ones(50 * 1024 ** 2 // 8)
+        block.sum()
+    if rss.delta is None:
+        pytest.skip('RSS not available on this platform')
+    assert rss.delta >= 10 * 1024 ** 2
+
+
+def test_manifest_batch_ranges(tmp_path):
+    manifest = RunManifest(str(tmp_path / 'm.jsonl'), {'seed': 1})
+    manifest.record('sessions', 'batch-000000001', 5, 1,
+                    first_user_id=1, last_user_id=2000)
+    manifest.record('languages', 'static', 1, 1)
+    assert manifest.batch_ranges() == {'batch-000000001': (1, 2000)}
@@ -0,0 +1,49 @@
+import json
+
+from bench_generation import (MIN_SECONDS, REFERENCE_PATH, generate_sample,
+                              median_result, regressions)
+from distributions import compare, summarize
+
+
+def test_generated_data_matches_reference_distributions():
+    with open(REFERENCE_PATH, encoding='utf-8') as f:
+        reference = json.load(f)
+    # A different seed draws different rows from the same distributions
+    assert compare(reference, summarize(generate_sample(1000, seed=7),
+                                        1000)) == []
+
+
+def test_changed_distribution_is_detected():
+    tables = generate_sample(1000)
+    baseline = summarize(tables, 1000)
+    activity = tables['daily_activity']
+    activity['time_spent_minutes'] += 2
+    tables['sessions'] = tables['sessions'].iloc[::2]
+    problems = compare(baseline, summarize(tables, 1000))
+    assert any('time_spent_minutes:mean' in p for p in problems)
+    assert any('sessions.rows_per_user' in p for p in problems)
+
+
+def test_regressions_against_baseline():
+    baseline = {'rows_per_s': {'generate:sessions': 1000,
+                               'insert:sessions': 500},
+                'peak_rss_mb': 100}
+    result = {'rows_per_s': {'generate:sessions': 650,
+                             'insert:sessions': 400},
+              'peak_rss_mb': 120}
+    assert len(regressions(result, baseline, 0.3)) == 1
+    result['peak_rss_mb'] = 150
+    assert len(regressions(result, baseline, 0.3)) == 2
+
+
+def test_short_stages_are_listed_as_untimed():
+    runs = [{'users': 10, 'seconds': seconds, 'peak_rss_mb': 50.0,
+             'rows_per_s': {'generate:users': rate, 'insert:users': 10.0},
+             'stage_seconds': {'generate:users': MIN_SECONDS / 2,
+                               'insert:users': MIN_SECONDS / 10}}
+            for seconds, rate in ((1.0, 100.0), (3.0, 900.0), (2.0, 200.0))]
+    result = median_result(runs)
+    assert result['seconds'] == 2.0
+    # Timed over all runs together, but not in any single one
+    assert result['rows_per_s'] == {'generate:users': 200.0}
+    assert result['untimed'] == ['insert:users']
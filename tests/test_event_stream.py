@@ -0,0 +1,91 @@
+import asyncio
+import datetime
+import json
+import time
+
+import numpy as np
+
+from batch_builder import build_batch, build_users
+from event_stream import (EVENT_TABLES, NdjsonEventSink, TableEventSink,
+                          generate_events, paced, stream_events,
+                          stream_to_consumer)
+from sinks import SqliteSink
+
+TODAY = datetime.date(2025, 8, 31)
+SINCE = datetime.datetime(2025, 8, 29)
+UNTIL = datetime.datetime(2025, 9, 1)
+
+
+def events(num_users=1500):
+    return list(generate_events(0, num_users, 100, TODAY, 7, SINCE, UNTIL))
+
+
+def test_events_are_time_ordered_and_match_the_bulk_rows():
+    streamed = events()
+    assert all(a.time <= b.time for a, b in zip(streamed, streamed[1:]))
+    # Users of different blocks are interleaved
+    assert len({e.user_id > 1000 for e in streamed[:50]}) == 2
+
+    user_ids = np.arange(1, 1501)
+    users = build_users(user_ids, TODAY, 7)
+    tables = build_batch(user_ids, users, 100, TODAY, 7)
+    for table in EVENT_TABLES:
+        column = {'daily_activity': 'activity_date',
+                  'sessions': 'session_start',
+                  'notifications': 'sent_date'}[table]
+        frame = tables[table]
+        expected = frame[frame[column] >= '2025-08-29']
+        got = [e for e in streamed if e.table == table]
+        assert len(got) == len(expected)
+        assert sorted(e.row['user_id'] for e in got) == sorted(
+            expected['user_id'])
+
+
+def test_unaligned_first_user_streams_the_bulk_rows():
+    streamed = list(generate_events(1500, 2500, 100, TODAY, 7, SINCE, UNTIL))
+    assert min(e.user_id for e in streamed) > 1500
+
+    user_ids = np.arange(1, 2501)
+    tables = build_batch(user_ids, build_users(user_ids, TODAY, 7), 100,
+                         TODAY, 7)
+    sessions = tables['sessions']
+    expected = sessions[(sessions['user_id'] > 1500)
+                        & (sessions['session_start'] >= '2025-08-29')]
+    got = [e.row for e in streamed if e.table == 'sessions']
+    assert sorted((r['user_id'], r['session_start'], r['gems_earned'])
+                  for r in got) == sorted(zip(
+        expected['user_id'], expected['session_start'].dt.to_pydatetime(),
+        expected['gems_earned']))
+
+
+def test_paced_holds_the_rate():
+    started = time.perf_counter()
+    assert list(paced(range(21), rate=200)) == list(range(21))
+    assert time.perf_counter() - started >= 0.1
+
+
+def test_events_reach_sinks_and_async_consumers(tmp_path):
+    streamed = events(300)
+    with SqliteSink(':memory:') as sink:
+        table_sink = TableEventSink(sink, flush_rows=50)
+        assert stream_events(streamed, table_sink, limit=120) == 120
+        table_sink.flush()
+        assert sum(sink.row_count(t) for t in EVENT_TABLES) == 120
+
+    path = tmp_path / 'events.ndjson'
+    ndjson = NdjsonEventSink(str(path))
+    stream_events(streamed, ndjson)
+    ndjson.close()
+    lines = path.read_text().splitlines()
+    assert len(lines) == len(streamed)
+    first = json.loads(lines[0])
+    assert first['table'] == streamed[0].table
+    assert first['user_id'] == streamed[0].user_id
+
+    received = []
+
+    async def consumer(event):
+        received.append(event)
+
+    assert asyncio.run(stream_to_consumer(streamed, consumer)) == len(streamed)
+    assert received == streamed
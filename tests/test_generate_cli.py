@@ -0,0 +1,56 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+from generate_synthetic_data import main, parse_args
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(os.path.dirname(HERE), 'src', 'data_generation')
+
+
+def test_import_does_no_work(tmp_path):
+    env = {key: value for key, value in os.environ.items()
+           if key not in ('PASSWORD', 'DB_URL')}
+    code = ('import sys; import generate_synthetic_data; '
+            'print(sorted({"numpy", "pandas", "faker", "sqlalchemy", '
+            '"dotenv"} & set(sys.modules)))')
+    result = subprocess.run([sys.executable, '-c', code], cwd=tmp_path,
+                            env=dict(env, PYTHONPATH=SRC),
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == '[]'
+    assert os.listdir(tmp_path) == []
+
+
+def test_options_fall_back_to_the_environment(monkeypatch, tmp_path):
+    monkeypatch.setenv('NUM_USERS', '123')
+    monkeypatch.setenv('SHARD', '1/4')
+    config = parse_args(['--log-dir', str(tmp_path), '--seed', '7',
+                         '--tables', 'users,sessions'])
+    assert config.num_users == 123
+    assert config.seed == 7
+    assert config.tables == ('users', 'sessions')
+    assert (config.shard_index, config.shard_count) == (1, 4)
+    assert config.manifest_path == str(
+        tmp_path / 'generation_manifest-shard-1-of-4.jsonl')
+    assert config.new_users_per_day == 123 / 730
+    with pytest.raises(SystemExit):
+        parse_args(['--tables', 'users,sales'])
+
+
+def test_main_writes_only_the_selected_tables(tmp_path):
+    database = tmp_path / 'run.db'
+    assert main(['--num-users', '30', '--date', '2025-01-31',
+                 '--sink', f'sqlite:///{database}',
+                 '--tables', 'users,churn_labels',
+                 '--log-dir', str(tmp_path / 'logs')]) == 0
+    with sqlite3.connect(database) as conn:
+        tables = {name for (name,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'")}
+        assert tables == {'users', 'churn_labels'}
+        assert conn.execute('SELECT COUNT(*) FROM churn_labels').fetchone() \
+            == (30,)
+        assert conn.execute('SELECT MAX(signup_date) FROM users').fetchone() \
+            < ('2025-01-31',)
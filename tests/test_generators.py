@@ -0,0 +1,136 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from generators import (USER_COLUMNS, apply_churn_rules, churn_hazard,
+                        country_vocabulary, generate_daily_activity,
+                        generate_notifications, generate_sessions,
+                        generate_users)
+
+CURRENT_DATE = datetime.date(2025, 8, 31)
+
+
+def make_activity(seed=0, n=200):
+    rng = np.random.default_rng(seed)
+    signup = [CURRENT_DATE - datetime.timedelta(days=int(d))
+              for d in rng.integers(1, 731, n)]
+    is_churner = rng.random(n) < 0.5
+    is_premium = rng.random(n) < 0.2
+    df = generate_daily_activity(np.arange(1, n + 1), signup, is_churner,
+                                 is_premium, CURRENT_DATE,
+                                 np.random.default_rng(seed))
+    return df, signup
+
+
+def test_daily_activity_covers_signup_to_current_date():
+    df, signup = make_activity()
+    expected = sum((CURRENT_DATE - s).days + 1 for s in signup)
+    assert len(df) == expected
+    first = df.groupby('user_id')['activity_date'].min().dt.date.tolist()
+    assert first == signup
+    assert (df.groupby('user_id')['activity_date'].max().dt.date
+            == CURRENT_DATE).all()
+
+
+def test_daily_activity_streak_resets_per_user():
+    df, _ = make_activity()
+    for _, user in df.groupby('user_id'):
+        streak = user['streak_days'].to_numpy()
+        previous = np.concatenate([[0], streak[:-1]])
+        assert ((streak == 0) | (streak == previous + 1)).all()
+    inactive = df[df['streak_days'] == 0]
+    assert (inactive[['lessons_completed', 'xp_gained']] == 0).all().all()
+    assert inactive['leaderboard_rank'].isna().all()
+    assert (df['time_spent_minutes'] >= 0).all()
+
+
+def test_daily_activity_is_reproducible():
+    first, _ = make_activity(seed=7)
+    second, _ = make_activity(seed=7)
+    assert first.equals(second)
+
+
+def test_sessions_follow_active_days():
+    activity, _ = make_activity()
+    rng = np.random.default_rng(1)
+    sessions = generate_sessions(activity, np.ones(len(activity), int), rng)
+    per_day = sessions.groupby(
+        [sessions['user_id'], sessions['session_start'].dt.normalize()]).size()
+    assert per_day.between(1, 3).all()
+    assert len(per_day) == (activity['lessons_completed'] > 0).sum()
+    assert sessions['accuracy_percentage'].between(50, 100).all()
+    assert set(sessions['skill_practiced']) == {
+        'Vocabulary', 'Grammar', 'Listening', 'Speaking'}
+
+
+def test_notifications_rates_and_click_conditioning():
+    activity, _ = make_activity(n=500)
+    notifications = generate_notifications(
+        activity, np.random.default_rng(2))
+    assert abs(len(notifications) / len(activity) - 0.3) < 0.01
+    assert abs(notifications['opened'].mean() - 0.6) < 0.01
+    assert (notifications['clicked'] <= notifications['opened']).all()
+    assert (notifications['response_time_seconds'].isna()
+            == (notifications['clicked'] == 0)).all()
+
+
+def test_generate_users_distributions():
+    users = generate_users(np.arange(1, 20001), CURRENT_DATE,
+                           np.random.default_rng(5))
+    assert set(USER_COLUMNS) <= set(users.columns)
+    days_back = (np.datetime64(CURRENT_DATE)
+                 - users['signup_date'].to_numpy(dtype='datetime64[D]'))
+    assert days_back.astype(int).min() >= 1
+    assert days_back.astype(int).max() <= 730
+    assert users['age'].between(18, 100).all()
+    assert abs(users['duolingo_plus_subscribed'].mean() - 0.2) < 0.01
+    assert abs((users['device_type'] == 'Web').mean() - 0.2) < 0.01
+    assert set(users['country'].cat.categories) <= set(country_vocabulary())
+    churned = users['churn_flag'] == 1
+    assert users.loc[~churned, 'churn_date'].isna().all()
+    retention = (users.loc[churned, 'churn_date']
+                 - users.loc[churned, 'signup_date']).dt.days
+    assert retention.min() >= 31
+
+
+def test_churn_rules_match_the_labels_update_script():
+    day = np.datetime64('2025-01-01')
+    signup = np.full(4, day)
+    is_churner = np.array([True, True, True, False])
+    churn = day + np.array([200, 200, 40, 0]).astype('timedelta64[D]')
+    churn[3] = np.datetime64('NaT')
+    last_active = day + np.array([190, 100, 20, -5]).astype('timedelta64[D]')
+    flag, churn_dates, last_active, retention = apply_churn_rules(
+        signup, is_churner, churn, last_active, CURRENT_DATE)
+    # Clamped to 31 days before the churn date; retained < 31 days is no
+    # churn; last activity never precedes signup
+    assert flag.tolist() == [True, True, False, False]
+    assert np.isnat(churn_dates[2:]).all()
+    assert last_active.tolist() == [
+        day + np.timedelta64(169, 'D'), day + np.timedelta64(100, 'D'),
+        day + np.timedelta64(20, 'D'), day]
+    assert retention.tolist() == [200, 200, 242, 242]
+
+
+def test_churners_are_inactive_before_churning():
+    signup = np.array(['2024-01-01'] * 50, dtype='datetime64[D]')
+    churn = np.full(50, np.datetime64('2024-12-01'))
+    activity = generate_daily_activity(
+        np.arange(1, 51), signup, np.ones(50, bool), np.ones(50, bool),
+        CURRENT_DATE, np.random.default_rng(0), churn_dates=churn)
+    last = activity.loc[activity['lessons_completed'] > 0, 'activity_date']
+    assert last.max() == pd.Timestamp('2024-10-31')
+
+
+@pytest.mark.parametrize('rate', [0.2, 0.3])
+def test_churn_rate_is_controllable(rate):
+    from batch_builder import build_batch, build_users
+    user_ids = np.arange(1, 3001)
+    users = build_users(user_ids, CURRENT_DATE, 3, churn_rate=rate)
+    labels = build_batch(user_ids, users, 100, CURRENT_DATE,
+                         3)['churn_labels']
+    assert abs(labels['churn_flag'].mean() - rate) < 0.03
+    with pytest.raises(ValueError):
+        churn_hazard(0.9)
@@ -0,0 +1,90 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from batch_builder import build_batch, build_users
+from incremental import (build_advance, build_signups, iter_state,
+                         latest_state_date, mark_complete, save_state,
+                         signup_range, user_state)
+
+TODAY = datetime.date(2025, 8, 31)
+NEXT_WEEK = datetime.date(2025, 9, 7)
+
+
+def full_run(num_users=300, seed=7):
+    user_ids = np.arange(1, num_users + 1)
+    users = build_users(user_ids, TODAY, seed)
+    tables = build_batch(user_ids, users, 100, TODAY, seed)
+    return users, tables, user_state(users, tables)
+
+
+def test_advance_generates_only_the_new_days():
+    _, tables, state = full_run()
+    new, new_state = build_advance(state, TODAY, NEXT_WEEK, 7)
+    dates = new['daily_activity']['activity_date']
+    assert dates.min() == pd.Timestamp('2025-09-01')
+    assert dates.max() == pd.Timestamp('2025-09-07')
+    assert new['daily_activity'].groupby('user_id').size().eq(7).all()
+    assert set(new['sessions']['user_id']) <= set(state['user_id'])
+    # Deterministic for a given seed and window
+    again, _ = build_advance(state, TODAY, NEXT_WEEK, 7)
+    pd.testing.assert_frame_equal(new['daily_activity'],
+                                  again['daily_activity'])
+
+
+def test_advance_continues_streaks_and_churn():
+    _, tables, state = full_run()
+    new, new_state = build_advance(state, TODAY, NEXT_WEEK, 7)
+    activity = new['daily_activity']
+    first_day = activity.groupby('user_id').head(1).set_index('user_id')
+    active = first_day['lessons_completed'] > 0
+    previous = state.set_index('user_id')['streak_days']
+    expected = (previous[first_day.index] + 1).where(active, 0)
+    assert (first_day['streak_days'] == expected).all()
+
+    # Churners stay churned; labelled churners are final, everyone else's
+    # retention is updated
+    assert (new_state['churn_flag'] >= state['churn_flag']).all()
+    labels = new['churn_labels']
+    assert labels['user_id'].is_unique
+    old = tables['churn_labels'].set_index('user_id')
+    assert set(labels['user_id']) == set(old.index[old['churn_flag'] == 0]) \
+        | set(labels.loc[labels['churn_flag'] == 1, 'user_id'])
+    kept = labels[labels['churn_flag'] == 0]
+    signup = state.set_index('user_id')['signup_date'][kept['user_id']]
+    assert (kept['retention_days'].to_numpy() == (
+        pd.Timestamp(NEXT_WEEK) - signup).dt.days.to_numpy()).all()
+    churned = labels[labels['churn_flag'] == 1]
+    assert (pd.to_datetime(churned['last_active_date'])
+            <= pd.to_datetime(churned['churn_date'])
+            - pd.Timedelta(days=31)).all()
+
+
+def test_signups_fall_in_the_window():
+    first, last = signup_range(1000, 10, TODAY, TODAY, NEXT_WEEK)
+    assert (first, last) == (1000, 1070)
+    # Counted from the full run's date, whatever the steps in between
+    assert signup_range(1000, 10, TODAY, datetime.date(2025, 9, 3),
+                        NEXT_WEEK) == (1030, 1070)
+    user_ids = np.arange(first + 1, last + 1)
+    users, tables, state = build_signups(user_ids, TODAY, NEXT_WEEK, 100, 7)
+    signup = pd.to_datetime(users['signup_date'])
+    assert signup.min() >= pd.Timestamp(TODAY)
+    assert signup.max() < pd.Timestamp(NEXT_WEEK)
+    assert tables['daily_activity']['activity_date'].max() == pd.Timestamp(
+        NEXT_WEEK)
+    assert list(state['user_id']) == list(user_ids)
+    again = build_signups(user_ids, TODAY, NEXT_WEEK, 100, 7)[0]
+    pd.testing.assert_frame_equal(users, again)
+
+
+def test_state_round_trip(tmp_path):
+    _, _, state = full_run(50)
+    save_state(str(tmp_path), TODAY, 'batch-000000001', state)
+    assert latest_state_date(str(tmp_path)) is None
+    mark_complete(str(tmp_path), TODAY)
+    assert latest_state_date(str(tmp_path)) == TODAY
+    [(label, loaded)] = list(iter_state(str(tmp_path), TODAY))
+    assert label == 'batch-000000001'
+    pd.testing.assert_frame_equal(loaded, state)
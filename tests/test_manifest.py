@@ -0,0 +1,38 @@
+import pytest
+
+from manifest import ManifestMismatch, RunManifest
+
+CONFIG = {'num_users': 1000, 'seed': 42, 'batch_size': 1000}
+
+
+def test_manifest_survives_restart(tmp_path):
+    path = str(tmp_path / 'run' / 'manifest.jsonl')
+    manifest = RunManifest(path, CONFIG)
+    manifest.record('sessions', 'batch-1', 120, 42)
+    manifest.record('sessions', 'batch-2', 80, 42)
+    manifest.record('notifications', 'batch-1', 30, 42)
+
+    resumed = RunManifest(path, CONFIG)
+    assert resumed.is_done('sessions', 'batch-2')
+    assert resumed.pending(['sessions', 'notifications'], 'batch-2') == [
+        'notifications']
+    assert resumed.rows('sessions') == 200
+
+
+def test_manifest_ignores_torn_last_line(tmp_path):
+    path = str(tmp_path / 'manifest.jsonl')
+    RunManifest(path, CONFIG).record('users', 'static', 1000, 42)
+    with open(path, 'a') as f:
+        f.write('{"table": "sessions", "bat')
+    resumed = RunManifest(path, CONFIG)
+    assert resumed.is_done('users', 'static')
+    assert not resumed.is_done('sessions', 'batch-1')
+    resumed.record('sessions', 'batch-1', 10, 42)
+    assert RunManifest(path, CONFIG).is_done('sessions', 'batch-1')
+
+
+def test_manifest_rejects_other_config(tmp_path):
+    path = str(tmp_path / 'manifest.jsonl')
+    RunManifest(path, CONFIG)
+    with pytest.raises(ManifestMismatch):
+        RunManifest(path, dict(CONFIG, seed=7))
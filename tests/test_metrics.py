@@ -0,0 +1,47 @@
+import json
+
+import pandas as pd
+
+from metrics import RunMetrics
+from pipeline import WritePipeline
+from sinks import SqliteSink
+
+
+def test_samples_are_exported(tmp_path):
+    jsonl, prom = tmp_path / 'm.jsonl', tmp_path / 'm.prom'
+    with RunMetrics(str(jsonl), str(prom)) as metrics:
+        metrics.record('generate', 'sessions', 'batch-1', 2.0, 1000, 4096,
+                       peak_rss=10 * 1024 ** 2)
+        metrics.record('generate', 'sessions', 'batch-2', 1.0, 500, 2048)
+        metrics.record_write('sessions', 'batch-1', 1000, 4096,
+                             {'seconds': 0.5, 'serialize_seconds': 0.2})
+
+    samples = [json.loads(line) for line in jsonl.read_text().splitlines()]
+    assert [s['stage'] for s in samples] == ['generate', 'generate',
+                                             'serialize', 'insert']
+    assert samples[0]['rows_per_s'] == 500
+    assert abs(samples[3]['seconds'] - 0.3) < 1e-9
+
+    text = prom.read_text()
+    assert ('synthetic_data_stage_rows_total'
+            '{stage="generate",table="sessions"} 1500') in text
+    assert ('synthetic_data_stage_peak_rss_bytes'
+            '{stage="generate",table="sessions"} 10485760') in text
+    assert '# TYPE synthetic_data_stage_seconds_total counter' in text
+
+    summary = metrics.summary().splitlines()
+    assert summary[0].split()[:2] == ['stage', 'table']
+    assert summary[1].split()[:4] == ['generate', 'sessions', '2', '1500']
+
+
+def test_pipeline_records_write_stages():
+    metrics = RunMetrics()
+    frame = pd.DataFrame({'a': range(100), 'b': ['x'] * 100})
+    with SqliteSink(':memory:') as sink:
+        with WritePipeline(sink, metrics=metrics) as pipeline:
+            pipeline.submit('t', frame, partition='batch-1')
+    totals = metrics.totals()
+    assert set(totals) == {('backpressure', 't'), ('serialize', 't'),
+                           ('insert', 't')}
+    assert totals[('insert', 't')]['rows'] == 100
+    assert totals[('serialize', 't')]['seconds'] > 0
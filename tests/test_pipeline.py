@@ -0,0 +1,61 @@
+import threading
+import time
+
+import pandas as pd
+
+from pipeline import WritePipeline, frame_nbytes
+from sinks import SinkError
+
+
+class RecordingSink:
+    def __init__(self, delay=0.0, fail_table=None):
+        self.delay = delay
+        self.fail_table = fail_table
+        self.writes = []
+        self.lock = threading.Lock()
+
+    def write(self, table, frame, partition=None, stats=None):
+        time.sleep(self.delay)
+        if table == self.fail_table:
+            raise SinkError(f'cannot write {table}')
+        with self.lock:
+            self.writes.append((table, int(frame['batch'].iloc[0])))
+        return len(frame)
+
+
+def make_frame(batch, rows=1000):
+    return pd.DataFrame({'batch': [batch] * rows, 'value': range(rows)})
+
+
+def test_writes_keep_per_table_order():
+    sink = RecordingSink()
+    with WritePipeline(sink, writers=3) as pipeline:
+        for batch in range(20):
+            for table in ('a', 'b', 'c', 'd'):
+                pipeline.submit(table, make_frame(batch))
+    for table in ('a', 'b', 'c', 'd'):
+        assert [b for t, b in sink.writes if t == table] == list(range(20))
+
+
+def test_submit_blocks_at_memory_cap():
+    sink = RecordingSink(delay=0.01)
+    cap = 3 * frame_nbytes(make_frame(0))
+    observed = []
+    with WritePipeline(sink, writers=2, max_pending_bytes=cap) as pipeline:
+        for batch in range(15):
+            pipeline.submit('t%d' % (batch % 2), make_frame(batch))
+            observed.append(pipeline.pending_bytes)
+    assert max(observed) <= cap
+    assert pipeline.pending_bytes == 0
+    assert len(sink.writes) == 15
+
+
+def test_errors_are_reported_to_callbacks():
+    results = []
+    with WritePipeline(RecordingSink(fail_table='bad')) as pipeline:
+        pipeline.submit('good', make_frame(0),
+                        lambda rows, error: results.append((rows, error)))
+        pipeline.submit('bad', make_frame(1),
+                        lambda rows, error: results.append((rows, error)))
+    assert results[0] == (1000, None)
+    assert isinstance(results[1][1], SinkError)
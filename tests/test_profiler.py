@@ -0,0 +1,126 @@
+import datetime
+import json
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from batch_builder import build_batch, build_users
+from generate_synthetic_data import main
+from profiler import (AtLeast, ColumnProfile, DataProfiler, InRange,
+                      MeanBetween, load_expectations)
+
+TODAY = datetime.date(2025, 8, 31)
+
+
+def test_running_statistics_match_the_whole_table():
+    user_ids = np.arange(1, 401)
+    tables = build_batch(user_ids, build_users(user_ids, TODAY, 3), 100,
+                         TODAY, 3)
+    activity = tables['daily_activity']
+    profiler = DataProfiler([])
+    for chunk in np.array_split(np.arange(len(activity)), 7):
+        profiler.observe('daily_activity', activity.iloc[chunk])
+    report = profiler.report()['tables']['daily_activity']
+    assert report['rows'] == len(activity)
+
+    time_spent = report['columns']['time_spent_minutes']
+    expected = activity['time_spent_minutes'].astype(np.float64)
+    assert np.isclose(time_spent['mean'], expected.mean())
+    assert np.isclose(time_spent['std'], expected.std(ddof=0))
+    assert time_spent['max'] == expected.max()
+    assert abs(time_spent['quantiles']['0.75'] / expected.quantile(0.75)
+               - 1) < 0.02
+    assert abs(time_spent['distinct'] / expected.nunique() - 1) < 0.05
+
+    rank = report['columns']['leaderboard_rank']
+    assert rank['null_rate'] == activity['leaderboard_rank'].isna().mean()
+    assert rank['distinct'] == activity['leaderboard_rank'].nunique()
+    assert rank['quantiles']['0.5'] == activity['leaderboard_rank'].quantile(
+        0.5, interpolation='lower')
+    dates = report['columns']['activity_date']
+    assert dates['max'] == '2025-08-31T00:00:00'
+
+
+def test_profile_memory_does_not_grow_with_the_rows():
+    column = ColumnProfile('integer')
+    for start in range(0, 400000, 50000):
+        column.add(pd.Series(np.arange(start, start + 50000)))
+    assert len(column.sketch.counts) < 2000
+    assert abs(column.distinct_count() / 400000 - 1) < 0.05
+    assert abs(column.report()['quantiles']['0.5'] / 200000 - 1) < 0.02
+
+    categories = ColumnProfile('string')
+    categories.add(pd.Series([f'value-{i}' for i in range(3000)] + [None]))
+    assert len(categories.frequencies) == 1001
+    assert categories.report()['null_rate'] == 1 / 3001
+
+
+def test_expectations_flag_bad_rows_and_rates(tmp_path):
+    profiler = DataProfiler([
+        InRange('daily_activity', 'time_spent_minutes', min=0),
+        AtLeast('sessions', 'session_end', 'session_start'),
+        MeanBetween('notifications', 'opened', 0.4, 0.8, by='channel',
+                    min_rows=2)])
+    assert profiler.observe('daily_activity', pd.DataFrame(
+        {'time_spent_minutes': [3.0, -1.5, 0.0]})) == [
+        'daily_activity.time_spent_minutes: 1 value(s) outside [0, None], '
+        'e.g. -1.5']
+    start = pd.Timestamp('2025-01-01 10:00')
+    problems = profiler.observe('sessions', pd.DataFrame({
+        'session_start': [start, start],
+        'session_end': [start + pd.Timedelta(minutes=5),
+                        start - pd.Timedelta(minutes=1)]}))
+    assert problems == ['sessions: 1 row(s) with session_end < session_start']
+    notifications = pd.DataFrame({'channel': ['Push', 'Push', 'Email'],
+                                  'opened': [1, 1, 0]})
+    # Email has too few rows to judge yet
+    assert profiler.observe('notifications', notifications) == [
+        'notifications.opened (channel=Push): mean 1.0000 of 2 rows outside '
+        '[0.4, 0.8]']
+    assert len(profiler.violations) == 3
+
+    path = tmp_path / 'expectations.json'
+    path.write_text(json.dumps([{'check': 'null_rate', 'table': 'users',
+                                 'column': 'country', 'max': 0.1}]))
+    [expectation] = load_expectations(str(path))
+    assert expectation.check(pd.DataFrame({'country': ['A', None]}))
+
+
+def test_generation_stops_at_the_first_bad_batch(tmp_path):
+    expectations = tmp_path / 'expectations.json'
+    expectations.write_text(json.dumps([
+        {'check': 'mean_between', 'table': 'churn_labels',
+         'column': 'churn_flag', 'min': 0.5, 'max': 0.6, 'min_rows': 10}]))
+    database = tmp_path / 'run.db'
+    profile = tmp_path / 'profile.json'
+    assert main(['--num-users', '2000', '--batch-size', '1000',
+                 '--sink', f'sqlite:///{database}',
+                 '--expectations', str(expectations),
+                 '--profile-path', str(profile),
+                 '--log-dir', str(tmp_path / 'logs')]) == 1
+
+    report = json.loads(profile.read_text())
+    assert len(report['violations']) == 1
+    assert report['tables']['churn_labels']['rows'] == 1000
+    with sqlite3.connect(database) as conn:
+        tables = {name for (name,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'")}
+    # Nothing of the bad batch was written
+    assert tables == {'languages', 'courses', 'users'}
+
+
+def test_churn_expectation_follows_the_simulated_rate(tmp_path):
+    database = tmp_path / 'run.db'
+    metrics = tmp_path / 'metrics.jsonl'
+    assert main(['--num-users', '2000', '--batch-size', '1000',
+                 '--churn-rate', '0.4', '--sink', f'sqlite:///{database}',
+                 '--metrics-path', str(metrics),
+                 '--log-dir', str(tmp_path / 'logs')]) == 0
+    with sqlite3.connect(database) as conn:
+        rate, = conn.execute(
+            'SELECT AVG(churn_flag) FROM churn_labels').fetchone()
+    assert 0.35 < rate < 0.45
+    samples = [json.loads(line) for line in metrics.read_text().splitlines()]
+    assert {s['table'] for s in samples if s['stage'] == 'profile'} >= {
+        'users', 'churn_labels', 'sessions'}
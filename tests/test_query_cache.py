@@ -0,0 +1,122 @@
+import os
+import shutil
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import query_cache
+from query_cache import (QueryCache, normalize_query, query_key,
+                         referenced_tables)
+
+CHURN_DEMO = '''
+SELECT u.gender, c.churn_flag   -- demographics
+FROM users u
+JOIN churn_labels c ON u.user_id = c.user_id
+'''
+
+
+def make_db(path):
+    with sqlite3.connect(path) as connection:
+        connection.execute('CREATE TABLE users (user_id INT, gender TEXT)')
+        connection.execute(
+            'CREATE TABLE churn_labels (user_id INT, churn_flag INT)')
+        connection.executemany('INSERT INTO users VALUES (?, ?)',
+                               [(i, 'Male' if i % 2 else 'Female')
+                                for i in range(1, 101)])
+        connection.executemany('INSERT INTO churn_labels VALUES (?, ?)',
+                               [(i, int(i % 4 == 0)) for i in range(1, 101)])
+        connection.execute('CREATE TABLE etl_metadata (job_name TEXT, '
+                           'table_name TEXT, last_load_ts TEXT)')
+        connection.executemany('INSERT INTO etl_metadata VALUES (?, ?, ?)', [
+            ('load_churn', 'churn_labels', '2025-09-01 02:00:00'),
+            ('load_fact_session', 'sessions', '2025-09-03 02:00:00')])
+
+
+def execute(path, sql):
+    with sqlite3.connect(path) as connection:
+        connection.execute(sql)
+
+
+def test_normalized_queries_share_an_entry():
+    assert normalize_query(CHURN_DEMO) == (
+        'select u.gender, c.churn_flag from users u join churn_labels c '
+        'on u.user_id = c.user_id')
+    assert query_key(CHURN_DEMO) == query_key(
+        ' select U.gender,  c.churn_flag FROM users u\n'
+        'JOIN churn_labels c ON u.user_id = c.user_id;')
+    # String literals are not folded
+    assert normalize_query("SELECT * FROM t WHERE a = 'Mixed  Case'") == \
+        "select * from t where a = 'Mixed  Case'"
+    assert referenced_tables(
+        'SELECT * FROM analytics_wh.[fact_session] f '
+        'JOIN dbo.users u ON 1 = 1') == ['fact_session', 'users']
+
+
+def test_entries_are_invalidated_only_when_their_tables_load(tmp_path):
+    db = str(tmp_path / 'data.db')
+    make_db(db)
+    cache_dir = str(tmp_path / 'cache')
+    with QueryCache(f'sqlite:///{db}', cache_dir, chunksize=30,
+                    metadata_table='etl_metadata') as cache:
+        first = cache.read(CHURN_DEMO)
+        assert len(first) == 100 and first['churn_flag'].sum() == 25
+        meta = cache._meta(os.path.join(cache_dir, query_key(CHURN_DEMO)))
+        assert len([name for name in os.listdir(meta['path'])
+                    if name.endswith('.arrow')]) == 4
+
+        # Served from the cache: a change without a newer load is not seen
+        execute(db, 'UPDATE churn_labels SET churn_flag = 1')
+        pd.testing.assert_frame_equal(cache.read(CHURN_DEMO), first)
+        # Loading another table does not invalidate the entry either
+        execute(db, "UPDATE etl_metadata SET last_load_ts = "
+                    "'2025-09-09 02:00:00' WHERE table_name = 'sessions'")
+        pd.testing.assert_frame_equal(cache.read(CHURN_DEMO), first)
+
+        execute(db, "UPDATE etl_metadata SET last_load_ts = "
+                    "'2025-09-02 02:00:00' WHERE table_name = 'churn_labels'")
+        assert cache.read(CHURN_DEMO)['churn_flag'].sum() == 100
+        cache.invalidate()
+        assert os.listdir(cache_dir) == []
+
+
+def test_refreshes_keep_the_version_readers_are_using(tmp_path, monkeypatch):
+    db = str(tmp_path / 'data.db')
+    make_db(db)
+    with QueryCache(f'sqlite:///{db}', str(tmp_path / 'cache'),
+                    chunksize=30) as cache:
+        entry = cache._entry(CHURN_DEMO)
+        cache.read(CHURN_DEMO)
+        # A reader that looked up the entry just before a refresh
+        reading = cache._meta(entry)
+        execute(db, 'UPDATE churn_labels SET churn_flag = 1')
+        assert cache.read(CHURN_DEMO, refresh=True)['churn_flag'].sum() == 100
+        assert sum(len(table) for table in cache._load(reading)) == 100
+
+        monkeypatch.setattr(query_cache, 'STALE_SECONDS', -1)
+        cache.read(CHURN_DEMO, refresh=True)
+        assert not os.path.exists(reading['path'])
+        assert sorted(os.listdir(entry)) == sorted(
+            ['current', os.path.basename(cache._meta(entry)['path'])])
+
+        # A current version that vanished is filled again
+        shutil.rmtree(cache._meta(entry)['path'])
+        assert len(cache.read(CHURN_DEMO)) == 100
+
+
+def test_only_a_missing_metadata_table_means_never_stale(tmp_path):
+    db = str(tmp_path / 'data.db')
+    make_db(db)
+    for url in (f'sqlite:///{db}', f'sqlite+pysqlite:///{db}'):
+        with QueryCache(url, str(tmp_path / 'cache'),
+                        metadata_table='analytics_wh.etl_metadata') as cache:
+            assert cache.watermark(['users']) is None
+        with QueryCache(url, str(tmp_path / 'cache'),
+                        metadata_table='etl_metadata') as cache:
+            assert cache.watermark(['churn_labels']) == '2025-09-01T02:00:00'
+    # A failing query on an existing table is not swallowed
+    execute(db, 'ALTER TABLE etl_metadata DROP COLUMN job_name')
+    with QueryCache(f'sqlite:///{db}', str(tmp_path / 'cache'),
+                    metadata_table='etl_metadata') as cache:
+        with pytest.raises(Exception, match='job_name'):
+            cache.watermark(['users'])
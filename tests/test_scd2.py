@@ -0,0 +1,99 @@
+import hashlib
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from scd2 import (DELTA_TABLE, HashIndex, commit_index, detect_changes,
+                  record_hashes, record_texts, user_delta)
+from sinks import SqliteSink
+
+WAREHOUSE_SQL = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'analytic_warehouse.sql')
+
+
+def make_users():
+    return pd.DataFrame({
+        'user_id': [1, 2, 3],
+        'signup_date': pd.to_datetime(['2024-01-05', '2024-02-29', None]),
+        'age': pd.array([30, None, 45], dtype='Int64'),
+        'gender': ['Male', None, 'Female'],
+        'country': ['France', 'Curaçao', 'Japan'],
+        'device_type': ['iOS', 'Web', 'Android'],
+        'referral_source': ['Ad', 'Friend', 'Organic'],
+        'learning_motivation': ['Travel', None, 'Career'],
+        'email_verified': [True, False, None],
+        'duolingo_plus_subscribed': [0, 1, 0]
+    })
+
+
+def test_record_hash_matches_the_tsql_formula():
+    users = make_users()
+    assert record_texts(users) == [
+        '1|2024-01-05|30|Male|France|iOS|Ad|Travel|1|0',
+        '2|2024-02-29|||Curaçao|Web|Friend||0|1',
+        '3||45|Female|Japan|Android|Organic|Career||0']
+    # HASHBYTES hashes the VARCHAR bytes (code page 1252)
+    expected = hashlib.sha256(
+        '2|2024-02-29|||Curaçao|Web|Friend||0|1'.encode('cp1252')).digest()
+    assert record_hashes(users)[1].tobytes() == expected
+
+
+def test_delta_holds_only_new_and_changed_users(tmp_path):
+    users = make_users()
+    delta, user_ids, hashes = user_delta(users, HashIndex())
+    assert delta['change_type'].tolist() == ['insert'] * 3
+    index = HashIndex().updated(user_ids, hashes)
+    index.save(str(tmp_path / 'index.npz'))
+    index = HashIndex.load(str(tmp_path / 'index.npz'))
+
+    users.loc[1, 'age'] = 41
+    users.loc[3] = users.loc[0]
+    users.loc[3, 'user_id'] = 4
+    delta, _, _ = user_delta(users, index)
+    assert delta['user_id'].tolist() == [2, 4]
+    assert delta['change_type'].tolist() == ['update', 'insert']
+    # The index of dim_user's current rows gives the same answer
+    current = pd.DataFrame({'user_id': user_ids,
+                            'record_hash': [h.tobytes() for h in hashes]})
+    assert HashIndex.from_frame(current).lookup(
+        user_ids, hashes)[1].sum() == 0
+
+
+def test_detect_changes_from_a_database(tmp_path):
+    db = tmp_path / 'source.db'
+    index = str(tmp_path / 'index.npz')
+    users = make_users()
+    with SqliteSink(str(db)) as source:
+        source.write('users', users)
+    with SqliteSink(str(tmp_path / 'wh.db')) as sink:
+        assert detect_changes(f'sqlite:///{db}', sink, index,
+                              table='users', chunksize=2) == (3, 0)
+        commit_index(index)
+        assert detect_changes(f'sqlite:///{db}', sink, index,
+                              table='users') == (0, 0)
+        with SqliteSink(str(db)) as source:
+            source.conn.execute("UPDATE users SET country = 'Peru' "
+                                "WHERE user_id = 3")
+            source.conn.commit()
+        # Until committed, reruns emit the same delta without duplicates
+        for _ in range(2):
+            assert detect_changes(f'sqlite:///{db}', sink, index,
+                                  table='users') == (0, 1)
+        assert sink.row_count(DELTA_TABLE) == 3
+        hashes = sink.conn.execute(
+            f'SELECT record_hash FROM {DELTA_TABLE} WHERE user_id = 3'
+        ).fetchall()
+    assert len(hashes) == 1 and len(hashes[0][0]) == 32
+    assert len(HashIndex.load(index + '.pending')) == 3
+    assert np.array_equal(HashIndex.load(index).user_ids, [1, 2, 3])
+
+
+def test_delta_columns_match_the_staging_table_ddl():
+    with open(WAREHOUSE_SQL, encoding='utf-8') as f:
+        ddl = re.search(rf'CREATE TABLE dbo\.{DELTA_TABLE} \((.*?)\n    \);',
+                        f.read(), re.DOTALL).group(1)
+    columns = [line.split()[0] for line in ddl.strip().splitlines()]
+    delta, _, _ = user_delta(make_users(), HashIndex())
+    assert columns == list(delta.columns)
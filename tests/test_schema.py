@@ -0,0 +1,100 @@
+import datetime
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from batch_builder import build_batch, build_courses, build_users
+from incremental import advance_block, user_state
+from schema import TABLE_SCHEMAS, masked, typed_frame
+from sinks import SqliteSink
+
+TODAY = datetime.date(2025, 8, 31)
+WH_CREATIONS = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'src', 'data_generation', 'wh_creations.sql')
+
+
+def assert_schema(table, frame):
+    for column in frame.columns:
+        assert frame[column].dtype == pd.api.types.pandas_dtype(
+            TABLE_SCHEMAS[table][column]), (table, column)
+
+
+def test_generated_tables_are_allocated_in_their_schema():
+    user_ids = np.arange(1, 201)
+    users = build_users(user_ids, TODAY, 3)
+    tables = build_batch(user_ids, users, 100, TODAY, 3)
+    assert_schema('users', users.drop(columns='country'))
+    assert isinstance(users['country'].dtype, pd.CategoricalDtype)
+    assert_schema('courses', build_courses(4, 4, TODAY, 3))
+    for table, frame in tables.items():
+        assert_schema(table, frame)
+
+    # The days added for existing users keep the same types
+    state = user_state(users, tables)
+    added, _ = advance_block(state, TODAY, TODAY + datetime.timedelta(days=5),
+                             np.random.default_rng(1))
+    for table, frame in added.items():
+        assert_schema(table, frame)
+
+
+def _inferred(dtype):
+    if isinstance(dtype, pd.CategoricalDtype):
+        return object
+    if pd.api.types.is_extension_array_dtype(dtype):
+        return 'Int64'
+    if pd.api.types.is_float_dtype(dtype):
+        return np.float64
+    return np.int64 if pd.api.types.is_integer_dtype(dtype) else dtype
+
+
+def test_compact_types_shrink_the_fact_tables():
+    user_ids = np.arange(1, 201)
+    users = build_users(user_ids, TODAY, 3)
+    tables = build_batch(user_ids, users, 100, TODAY, 3)
+    for table in ('daily_activity', 'sessions', 'notifications'):
+        frame = tables[table]
+        # What pandas infers: int64, float64 and object strings
+        inferred = frame.astype({column: _inferred(dtype) for column, dtype
+                                 in frame.dtypes.items()})
+        compact = frame.memory_usage(deep=True).sum()
+        assert compact < inferred.memory_usage(deep=True).sum() / 2, table
+
+
+def test_typed_frame_casts_and_sinks_conform_records(tmp_path):
+    frame = typed_frame('notifications', {
+        'user_id': np.array([1, 2], dtype=np.int64),
+        'opened': np.array([True, False]),
+        'response_time_seconds': masked([12.0, np.nan], [False, True],
+                                        'Int16'),
+        'channel': ['Push', 'Email']})
+    assert_schema('notifications', frame)
+    assert frame['response_time_seconds'].isna().tolist() == [False, True]
+
+    with SqliteSink(str(tmp_path / 'typed.db'), dtypes=TABLE_SCHEMAS) as sink:
+        records = pd.DataFrame({'user_id': [1], 'channel': ['In-App'],
+                                'response_time_seconds': [None]})
+        assert sink.write('notifications', records) == 1
+        assert sink.row_count('notifications') == 1
+
+
+def test_float_columns_keep_the_precision_of_sql_float():
+    with open(WH_CREATIONS, encoding='utf-8') as f:
+        sql = f.read()
+    floats = re.findall(r'CREATE TABLE (\w+) \(|^\s+(\w+) FLOAT', sql,
+                        re.MULTILINE)
+    table, columns = None, []
+    for created, column in floats:
+        table = created or table
+        if column:
+            columns.append((table, column))
+    assert len(columns) == 4
+    for table, column in columns:
+        assert TABLE_SCHEMAS[table][column] == np.float64, (table, column)
+
+    with SqliteSink(':memory:', dtypes=TABLE_SCHEMAS) as sink:
+        sink.write('languages', pd.DataFrame(
+            {'language_name': ['Spanish'], 'popularity_score': [0.9]}))
+        assert sink.conn.execute(
+            'SELECT popularity_score FROM languages').fetchone() == (0.9,)
@@ -0,0 +1,92 @@
+import datetime
+
+import pandas as pd
+import pytest
+
+from batch_builder import BATCH_TABLES, build_courses
+from manifest import RunManifest
+from sharding import (frame_fingerprint, parse_shard, shard_range,
+                      verify_shards)
+from sinks import SqliteSink
+
+
+def test_shard_ranges_are_disjoint_whole_blocks():
+    ranges = [shard_range(10500, i, 4, 1000) for i in range(4)]
+    assert ranges[0][0] == 0 and ranges[-1][1] == 10500
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        assert end == start and start % 1000 == 0
+    # More shards than blocks leaves some shards empty
+    assert shard_range(1000, 0, 2, 1000) == (0, 0)
+    assert shard_range(1000, 1, 2, 1000) == (0, 1000)
+    # A range that starts mid-block keeps the blocks aligned to user id 0
+    ranges = [shard_range(3500, i, 2, 1000, first=1200) for i in range(2)]
+    assert ranges == [(1200, 2000), (2000, 3500)]
+
+
+def test_parse_shard():
+    assert parse_shard('2/8') == (2, 8)
+    for text in ('8/8', '-1/2', '1', 'a/b', '0/0'):
+        with pytest.raises(ValueError):
+            parse_shard(text)
+
+
+def test_static_dimensions_are_identical_across_nodes():
+    today = datetime.date(2025, 8, 31)
+    first = build_courses(20, 20, today, 42)
+    assert len(first) == 100
+    assert (first['target_language_id'] != first['base_language_id']).all()
+    assert frame_fingerprint(first) == frame_fingerprint(
+        build_courses(20, 20, today, 42))
+    assert frame_fingerprint(first) != frame_fingerprint(
+        build_courses(20, 20, today, 43))
+
+
+def write_shard(tmp_path, index, count, num_users, tables=BATCH_TABLES):
+    config = {'num_users': num_users, 'seed': 1, 'block_size': 100,
+              'shard': f'{index}/{count}', 'static_fingerprint': 'abc'}
+    manifest = RunManifest(str(tmp_path / f'shard-{index}.jsonl'), config)
+    start, end = shard_range(num_users, index, count, 100)
+    if index == 0:
+        manifest.record('languages', 'static', 3, 1)
+        manifest.record('courses', 'static', 6, 1)
+    manifest.record('users', 'static', end - start, 1)
+    for lo in range(start, end, 200):
+        hi = min(lo + 200, end)
+        for table in tables:
+            manifest.record(table, f'batch-{lo + 1:09d}', hi - lo, 1,
+                            first_user_id=lo + 1, last_user_id=hi)
+    return manifest.path
+
+
+def test_verify_shards(tmp_path):
+    paths = [write_shard(tmp_path, i, 3, 1000) for i in range(3)]
+    problems, expected = verify_shards(paths)
+    assert problems == []
+    assert expected['users'] == expected['churn_labels'] == 1000
+    assert expected['courses'] == 6
+
+    problems, _ = verify_shards(paths[:2])
+    assert problems == ['Missing shards [2] of 3']
+
+    (tmp_path / 'partial').mkdir()
+    paths[1] = write_shard(tmp_path / 'partial', 1, 3, 1000,
+                           tables=BATCH_TABLES[:-1])
+    problems, _ = verify_shards(paths)
+    assert problems and all('missing churn_labels' in p for p in problems)
+
+
+def test_verify_shards_checks_the_sink(tmp_path):
+    paths = [write_shard(tmp_path, i, 2, 400) for i in range(2)]
+    with SqliteSink(':memory:') as sink:
+        users = pd.DataFrame({'user_id': range(1, 401)})
+        sink.write('languages', pd.DataFrame({'x': range(3)}))
+        sink.write('courses', pd.DataFrame({'x': range(6)}))
+        sink.write('users', users)
+        for table in BATCH_TABLES:
+            sink.write(table, users)
+        assert verify_shards(paths, sink)[0] == []
+        # A shard written twice duplicates its keys
+        sink.write('churn_labels', users.iloc[:200])
+        problems = verify_shards(paths, sink)[0]
+        assert problems == [
+            'churn_labels: sink has 600 rows, shards committed 400']
@@ -0,0 +1,156 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from sinks import DuckDBSink, SinkError, SqliteSink, create_sink
+
+
+def make_frame():
+    return pd.DataFrame({
+        'user_id': np.arange(1, 6),
+        'sent_date': pd.to_datetime(['2025-01-01 10:00:00', '2025-01-02 00:00:00', None,
+                                     '2025-01-04 00:00:00', '2025-01-05 23:59:59']),
+        'response_time_seconds': pd.array([10, None, 30, None, 50],
+                                          dtype='Int64'),
+        'channel': ['Push', 'Email', None, 'In-App', 'Push'],
+        'score': [0.5, 1.5, np.nan, 2.5, 3.5]
+    })
+
+
+def test_sqlite_sink_round_trip_in_chunks():
+    with SqliteSink(':memory:', chunksize=2) as sink:
+        assert sink.row_count('notifications') == 0
+        assert sink.write('notifications', make_frame()) == 5
+        assert sink.write('notifications', make_frame()) == 5
+        assert sink.row_count('notifications') == 10
+        rows = sink.conn.execute(
+            'SELECT * FROM notifications ORDER BY rowid LIMIT 3').fetchall()
+    assert rows[0] == (1, '2025-01-01 10:00:00.000000', 10, 'Push', 0.5)
+    assert rows[1][2] is None
+    assert rows[2][1:] == (None, 30, None, None)
+
+
+def test_sink_applies_explicit_dtypes():
+    with SqliteSink(':memory:', dtypes={'t': {'score': 'float32'}}) as sink:
+        sink.write('t', make_frame()[['user_id', 'score']])
+        assert sink.conn.execute(
+            'SELECT typeof(score) FROM t LIMIT 1').fetchone() == ('real',)
+
+
+def test_sink_wraps_backend_errors():
+    with SqliteSink(':memory:') as sink:
+        sink.write('t', make_frame()[['user_id']])
+        with pytest.raises(SinkError):
+            sink.write('t', make_frame()[['channel']])
+
+
+def test_create_sink_dispatches_on_url(tmp_path):
+    sink = create_sink(f'sqlite:///{tmp_path / "local.db"}')
+    assert isinstance(sink, SqliteSink)
+    sink.close()
+
+
+def test_duckdb_sink_round_trip():
+    pytest.importorskip('duckdb')
+    with DuckDBSink(':memory:') as sink:
+        sink.write('notifications', make_frame())
+        sink.write('notifications', make_frame())
+        assert sink.row_count('notifications') == 10
+
+
+def test_parquet_sink_writes_one_file_per_partition(tmp_path):
+    pytest.importorskip('pyarrow')
+    from sinks import ParquetSink, open_dataset
+    sink = create_sink(f'parquet:///{tmp_path}')
+    assert isinstance(sink, ParquetSink)
+    sink.write('notifications', make_frame(), partition='batch-1')
+    sink.write('notifications', make_frame(), partition='batch-2')
+    sink.write('notifications', make_frame(), partition='batch-2')
+    sink.write('notifications', make_frame())
+    assert sorted(p.name for p in (tmp_path / 'notifications').iterdir()) == [
+        'batch-1.parquet', 'batch-2.parquet', 'part-00000.parquet']
+    assert sink.row_count('notifications') == 15
+    table = open_dataset(str(tmp_path), 'notifications').to_table()
+    assert str(table.schema.field('user_id').type) == 'int32'
+    assert table.column('response_time_seconds').null_count == 6
+
+
+def test_arrow_sink_partitions_by_month(tmp_path):
+    pytest.importorskip('pyarrow')
+    from sinks import ArrowSink, open_dataset
+    frame = make_frame().dropna(subset=['sent_date'])
+    frame.loc[frame.index[-1], 'sent_date'] = pd.Timestamp('2025-02-03')
+    sink = ArrowSink(str(tmp_path), partition_by='month')
+    sink.write('notifications', frame, partition='batch-1')
+    months = sorted(p.name for p in (tmp_path / 'notifications').iterdir())
+    assert months == ['month=2025-01', 'month=2025-02']
+    table = open_dataset(str(tmp_path), 'notifications', 'arrow').to_table()
+    assert table.num_rows == len(frame)
+
+
+@pytest.mark.parametrize('url', ['sqlite', 'duckdb', 'parquet'])
+def test_upsert_replaces_rows_by_key(tmp_path, url):
+    pytest.importorskip({'sqlite': 'sqlite3', 'duckdb': 'duckdb',
+                         'parquet': 'pyarrow'}[url])
+    location = tmp_path if url == 'parquet' else tmp_path / 'out.db'
+    frame = make_frame()[['user_id', 'score']]
+    with create_sink(f'{url}:///{location}') as sink:
+        # A new table is simply created
+        sink.upsert('labels', frame, 'user_id', partition='batch-1')
+        changed = pd.DataFrame({'user_id': [2, 6], 'score': [9.0, 6.0]})
+        assert sink.upsert('labels', changed, 'user_id',
+                           partition='batch-1-delta') == 2
+        assert sink.row_count('labels') == 6
+        assert sink.distinct_count('labels', 'user_id') == 6
+
+
+class FakeCursor:
+    def __init__(self, statements):
+        self.statements = statements
+
+    def execute(self, sql, *params):
+        self.statements.append(sql)
+        self.row = ('user_id',) if 'identity_columns' in sql and \
+            params == ('users',) else None
+        return self
+
+    def fetchone(self):
+        return self.row
+
+    def executemany(self, sql, rows):
+        self.statements.append(sql)
+
+
+class FakeConnection:
+    def __init__(self, statements):
+        self.statements = statements
+
+    def cursor(self):
+        return FakeCursor(self.statements)
+
+    def commit(self):
+        self.statements.append('COMMIT')
+
+    def rollback(self):
+        self.statements.append('ROLLBACK')
+
+    def close(self):
+        pass
+
+
+def test_mssql_sink_keeps_explicit_identity_values():
+    from sinks import MssqlSink, Sink
+    statements = []
+    sink = MssqlSink.__new__(MssqlSink)
+    Sink.__init__(sink)
+    sink._identity_columns = {}
+    sink.engine = type('Engine', (), {
+        'raw_connection': lambda self: FakeConnection(statements)})()
+    sink.write('users', make_frame()[['user_id', 'channel']])
+    sink.write('sessions', make_frame()[['user_id', 'channel']])
+    inserts = [sql for sql in statements if 'identity_columns' not in sql]
+    assert inserts == [
+        'SET IDENTITY_INSERT users ON',
+        'INSERT INTO users (user_id, channel) VALUES (?, ?)',
+        'SET IDENTITY_INSERT users OFF', 'COMMIT',
+        'INSERT INTO sessions (user_id, channel) VALUES (?, ?)', 'COMMIT']
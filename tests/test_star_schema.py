@@ -0,0 +1,83 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from batch_builder import build_batch, build_courses, build_users
+from scd2 import record_hashes
+from sinks import SqliteSink
+from star_schema import (FACT_COLUMNS, STAR_FACTS, DimensionMap, StarSchema,
+                         date_ids)
+
+TODAY = datetime.date(2025, 8, 31)
+
+
+def test_date_ids_are_yyyymmdd():
+    dates = np.array(['2020-01-01', '2024-02-29T23:59:59', '2030-12-31'],
+                     dtype='datetime64[s]')
+    assert date_ids(dates).tolist() == [20200101, 20240229, 20301231]
+
+
+def test_dimension_map_assigns_keys_in_order_and_rejects_unknown_values():
+    devices = DimensionMap(['IOS', 'ANDROID', 'WEB', 'IOS'])
+    assert len(devices) == 3
+    assert devices.lookup(['WEB', 'IOS', 'WEB']).tolist() == [3, 1, 3]
+    with pytest.raises(ValueError, match='TV'):
+        devices.lookup(['IOS', 'TV'])
+
+
+def test_facts_match_the_warehouse_tables():
+    user_ids = np.arange(1, 301)
+    users = build_users(user_ids, TODAY, 3)
+    tables = build_batch(user_ids, users, 100, TODAY, 3)
+    star = StarSchema(44, 100)
+    facts = star.facts(tables)
+
+    for table in STAR_FACTS:
+        assert list(facts[table].columns) == FACT_COLUMNS[table]
+    activity = facts['fact_daily_activity']
+    assert len(activity) == len(tables['daily_activity'])
+    expected = tables['daily_activity']['activity_date'].dt.strftime(
+        '%Y%m%d').astype(int)
+    assert (activity['date_id'] == expected).all()
+    assert (activity['user_sk'] == tables['daily_activity']['user_id']).all()
+    # churn_flag is the user's label, as the gold load's churn_labels join
+    flags = tables['churn_labels'].set_index('user_id')['churn_flag']
+    assert (activity['churn_flag'].to_numpy() == flags.loc[
+        tables['daily_activity']['user_id']].to_numpy()).all()
+
+    notifications = facts['fact_notification']
+    types = list(star.notification_types.keys)
+    assert [types[key - 1] for key in notifications['notification_type_sk']] \
+        == tables['notifications']['notification_type'].tolist()
+    assert notifications['response_time_seconds'].isna().sum() == \
+        tables['notifications']['response_time_seconds'].isna().sum()
+    assert facts['fact_session']['session_id'].isna().all()
+
+
+def test_dimensions_carry_the_keys_the_facts_refer_to(tmp_path):
+    languages = pd.DataFrame({'language_name': ['Spanish', 'French'],
+                              'popularity_score': [0.9, 0.8],
+                              'script_type': ['Latin', 'Latin'],
+                              'native_speakers_millions': [484, 80]})
+    courses = build_courses(2, 2, TODAY, 3)
+    star = StarSchema(len(languages), len(courses))
+    dimensions = star.dimensions(languages, courses)
+    assert dimensions['dim_language']['language_sk'].tolist() == [1, 2]
+    assert dimensions['dim_course']['course_sk'].tolist() == \
+        list(range(1, len(courses) + 1))
+    assert set(dimensions['dim_device']['device_type']) == \
+        {'IOS', 'ANDROID', 'WEB'}
+
+    users = build_users(np.arange(1, 11), TODAY, 3)
+    dim_user = star.dim_user(users, TODAY)
+    assert dim_user['user_sk'].tolist() == list(range(1, 11))
+    assert dim_user['is_current'].eq(1).all()
+    assert dim_user['record_hash'][0] == record_hashes(users)[0].tobytes()
+
+    with SqliteSink(str(tmp_path / 'star.db')) as sink:
+        for table, frame in dimensions.items():
+            sink.write(table, frame)
+        sink.write('dim_user', dim_user)
+        assert sink.row_count('dim_user') == 10